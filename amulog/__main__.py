@@ -86,7 +86,7 @@ def data_parse(ns):
     from . import strutil
     from . import manager
     lp = manager.load_log2seq(conf)
-    for line in manager.iter_lines(targets):
+    for line in manager.iter_lines_conf(conf, targets):
         pline = manager.parse_line(strutil.add_esc(line), lp)
         if pline is None:
             pass
@@ -106,9 +106,10 @@ def db_make(ns):
     timer = common.Timer("db-make", output=_logger)
     timer.start()
     if is_online(conf, ns.parallel):
-        manager.process_files_online(conf, targets, True)
+        manager.process_files_online(conf, targets, True, dry_run=ns.dry)
     else:
-        manager.process_files_offline(conf, targets, True, ns.parallel)
+        manager.process_files_offline(conf, targets, True, ns.parallel,
+                                      dry_run=ns.dry)
     timer.stop()
 
 
@@ -129,6 +130,43 @@ def db_add(ns):
     timer.stop()
 
 
+def db_resume(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger=_logger, lv=lv)
+
+    from . import manager
+    timer = common.Timer("db-resume", output=_logger)
+    timer.start()
+    manager.resume_files_online(conf)
+    timer.stop()
+
+
+def db_follow(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger=_logger, lv=lv)
+    targets = get_targets(ns, conf)
+
+    from . import follow
+    timer = common.Timer("db-follow", output=_logger)
+    timer.start()
+    follow.follow_files(conf, targets, reset_db=False)
+    timer.stop()
+
+
+def serve_syslog(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger=_logger, lv=lv)
+
+    from . import syslog_server
+    timer = common.Timer("serve-syslog", output=_logger)
+    timer.start()
+    syslog_server.serve_syslog(conf, reset_db=False)
+    timer.stop()
+
+
 def db_remake_group(ns):
     conf = config.open_config(ns.conf_path)
     lv = logging.DEBUG if ns.debug else logging.INFO
@@ -163,6 +201,46 @@ def db_repair(ns):
     db.repair_tables()
 
 
+def db_archive(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger=_logger, lv=lv)
+
+    from dateutil import parser
+    from . import log_db
+    dte = parser.parse(ns.time)
+    timer = common.Timer("db-archive", output=_logger)
+    timer.start()
+    ld = log_db.LogData(conf, edit=True, reset_db=False)
+    cnt = ld.archive_lines(dte)
+    _logger.info("{0} lines before {1} archived".format(cnt, dte))
+    timer.stop()
+
+
+def db_export(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger=_logger, lv=lv)
+
+    from . import db_snapshot
+    timer = common.Timer("db-export", output=_logger)
+    timer.start()
+    db_snapshot.export_db(conf, ns.file)
+    timer.stop()
+
+
+def db_import(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger=_logger, lv=lv)
+
+    from . import db_snapshot
+    timer = common.Timer("db-import", output=_logger)
+    timer.start()
+    db_snapshot.import_db(conf, ns.file)
+    timer.stop()
+
+
 def db_anonymize(ns):
     conf = config.open_config(ns.conf_path)
     lv = logging.DEBUG if ns.debug else logging.INFO
@@ -426,7 +504,7 @@ OPT_PARALLEL = [["-p", "--parallel"],
 OPT_RECUR = [["-r", "--recur"],
              {"dest": "recur", "action": "store_true",
               "help": "recursively search files to process"}]
-OPT_DRY = [["-d", "--dry"],
+OPT_DRY = [["-d", "--dry", "--dry-run"],
            {"dest": "dry", "action": "store_true",
             "help": "do not store data into db"}]
 # OPT_TERM = [["-t", "--term"],
@@ -490,12 +568,27 @@ DICT_ARGSET = {
                       "help": "only show parsed words"}],
                     ARG_FILES_OPT],
                    data_parse],
-    "db-make": ["Initialize database and add log data. ",
-                [OPT_CONFIG, OPT_DEBUG, OPT_RECUR, OPT_PARALLEL, ARG_FILES_OPT],
+    "db-make": ["Initialize database and add log data. "
+                "With --dry-run, only measure the throughput "
+                "of template generation without DB.",
+                [OPT_CONFIG, OPT_DEBUG, OPT_RECUR, OPT_PARALLEL, OPT_DRY,
+                 ARG_FILES_OPT],
                 db_make],
     "db-add": ["Add log data to existing database.",
                [OPT_CONFIG, OPT_DEBUG, OPT_RECUR, OPT_PARALLEL, ARG_FILES],
                db_add],
+    "db-resume": ["Resume interrupted online processing "
+                  "with the write-ahead journal.",
+                  [OPT_CONFIG, OPT_DEBUG],
+                  db_resume],
+    "db-follow": ["Add log data continuously from growing files "
+                  "(until SIGINT or SIGTERM).",
+                  [OPT_CONFIG, OPT_DEBUG, OPT_RECUR, ARG_FILES_OPT],
+                  db_follow],
+    "serve-syslog": ["Receive syslog messages over UDP/TCP and add them "
+                     "to existing database (until SIGINT or SIGTERM).",
+                     [OPT_CONFIG, OPT_DEBUG],
+                     serve_syslog],
     "db-remake-group": ["Remake log template groups",
                         [OPT_CONFIG, OPT_DEBUG],
                         db_remake_group],
@@ -505,6 +598,19 @@ DICT_ARGSET = {
     "db-repair": ["Repair db schema after version updates.",
                   [OPT_CONFIG, OPT_DEBUG],
                   db_repair],
+    "db-archive": ["Move old log messages into compressed archive files.",
+                   [OPT_CONFIG, OPT_DEBUG,
+                    [["time"],
+                     {"metavar": "DATETIME", "action": "store",
+                      "help": "archive messages before this datetime"}]],
+                   db_archive],
+    "db-export": ["Export whole database into a snapshot file.",
+                  [OPT_CONFIG, OPT_DEBUG, ARG_FILE],
+                  db_export],
+    "db-import": ["Reset database and import a snapshot file "
+                  "made with db-export.",
+                  [OPT_CONFIG, OPT_DEBUG, ARG_FILE],
+                  db_import],
     "db-anonymize": ["Anonymize templates and hostnames.",
                      [OPT_CONFIG, OPT_DEBUG,
                       [["--config-export"],
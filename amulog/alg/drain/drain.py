@@ -11,10 +11,13 @@ Do NOT edit log templates manually if you still have unprocessed log data.
 """
 
 import os
+from array import array
+
 from amulog import lt_common
 
 DEFAULT_REGEX_CONFIG = "/".join((os.path.dirname(os.path.abspath(__file__)),
                                  "../../data/drain_regex.conf"))
+DUMP_VERSION = 1
 
 
 class Node:
@@ -44,12 +47,74 @@ class LTGenDrain(lt_common.LTGen):
         self._vre = vreobj
         self._count_replacer = count_replacer
         self._root = Node()
+        self._delta = []  # (node path, tid) of clusters added after dump
+
+    def is_memo_safe(self):
+        # a repeated message is merged into the same cluster without change
+        # unless the cluster is updated or a new cluster is added
+        # (LTManager invalidates the memo cache in both cases)
+        return True
 
     def load(self, loadobj):
-        self._root = loadobj
+        if lt_common.is_flat_dump(loadobj, DUMP_VERSION):
+            self._root = self._load_flat(loadobj)
+        else:
+            # old format: pickled Node tree
+            self._root = loadobj
+        self._delta = []
 
     def dumpobj(self):
-        return self._root
+        # nodes in breadth-first order, children after their parents
+        parents = array("q", [-1])
+        keys = [None]
+        cluster_nodes = array("q")
+        cluster_tids = array("q")
+        l_node = [self._root]
+        for nid, node in enumerate(l_node):
+            for key, child in node.child.items():
+                parents.append(nid)
+                keys.append(key)
+                l_node.append(child)
+            if node.clusters:
+                for tid in node.clusters:
+                    cluster_nodes.append(nid)
+                    cluster_tids.append(tid)
+        return {"version": DUMP_VERSION,
+                "parents": parents,
+                "keys": keys,
+                "cluster_nodes": cluster_nodes,
+                "cluster_tids": cluster_tids}
+
+    @staticmethod
+    def _load_flat(loadobj):
+        l_node = [Node() for _ in range(len(loadobj["parents"]))]
+        for nid, (parent, key) in enumerate(zip(loadobj["parents"],
+                                                loadobj["keys"])):
+            if parent >= 0:
+                l_node[parent].child[key] = l_node[nid]
+        for nid, tid in zip(loadobj["cluster_nodes"],
+                            loadobj["cluster_tids"]):
+            node = l_node[nid]
+            if node.clusters is None:
+                node.clusters = set()
+            node.clusters.add(tid)
+        return l_node[0]
+
+    def dump_delta(self):
+        # the tree changes only with new clusters
+        delta, self._delta = self._delta, []
+        return delta
+
+    def load_delta(self, delta):
+        for path, tid in delta:
+            node = self._root
+            for key in path:
+                if key not in node.child:
+                    node.child[key] = Node()
+                node = node.child[key]
+            if node.clusters is None:
+                node.clusters = set()
+            node.clusters.add(tid)
 
     def process_line(self, pline):
         # preprocess
@@ -63,6 +128,7 @@ class LTGenDrain(lt_common.LTGen):
         node = self._root.child[length]
 
         # search by preceding tokens
+        path = [length]
         ptokens = [w for w in tokens if w != lt_common.REPLACER]
         for i in range(self._depth - 2):
             try:
@@ -72,6 +138,7 @@ class LTGenDrain(lt_common.LTGen):
             if key not in node.child:
                 node.child[key] = Node()
             node = node.child[key]
+            path.append(key)
 
         # search by token similarlity
         max_sim_seq = 0
@@ -89,6 +156,7 @@ class LTGenDrain(lt_common.LTGen):
         if tid is None:
             tid = self.add_tpl(tokens)
             node.clusters.add(tid)
+            self._delta.append((tuple(path), tid))
             state = self.state_added
         else:
             state = self.merge_tpl(tokens, tid)
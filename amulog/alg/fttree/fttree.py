@@ -12,12 +12,15 @@ see also https://github.com/WeibinMeng/ft-tree
 
 
 import logging
+from array import array
 from collections import defaultdict
 
 from amulog import lt_common
 
 _logger = logging.getLogger(__package__)
 
+DUMP_VERSION = 1
+
 
 class Node:
 
@@ -45,10 +48,56 @@ class LTGenFTTree(lt_common.LTGen):
             self._type_func = message_type_func
 
     def load(self, loadobj):
-        self._tree, self._d_words = loadobj
+        if lt_common.is_flat_dump(loadobj, DUMP_VERSION):
+            self._tree, self._d_words = self._load_flat(loadobj)
+        else:
+            # old format: pickled Node trees and word counts
+            self._tree, self._d_words = loadobj
 
     def dumpobj(self):
-        return self._tree, self._d_words
+        # nodes in breadth-first order, children after their parents
+        # (parent -1 for the root nodes of message types)
+        parents = array("q")
+        words = []
+        pruned = array("q")  # nodes with childs pruned
+        l_node = []
+        for message_type, root in self._tree.items():
+            parents.append(-1)
+            words.append(message_type)
+            l_node.append(root)
+        for nid, node in enumerate(l_node):
+            if node.childs is None:
+                pruned.append(nid)
+                continue
+            for w, child in node.childs.items():
+                parents.append(nid)
+                words.append(w)
+                l_node.append(child)
+        return {"version": DUMP_VERSION,
+                "parents": parents,
+                "words": words,
+                "pruned": pruned,
+                "vocabulary": list(self._d_words.keys()),
+                "counts": array("q", self._d_words.values())}
+
+    @staticmethod
+    def _load_flat(loadobj):
+        tree = {}
+        l_node = []
+        for parent, w in zip(loadobj["parents"], loadobj["words"]):
+            if parent < 0:
+                node = Node(w, 0)
+                tree[w] = node
+            else:
+                parent_node = l_node[parent]
+                node = Node(w, parent_node.depth + 1)
+                parent_node.childs[w] = node
+            l_node.append(node)
+        for nid in loadobj["pruned"]:
+            l_node[nid].childs = None
+        d_words = defaultdict(int, zip(loadobj["vocabulary"],
+                                       loadobj["counts"]))
+        return tree, d_words
 
     @staticmethod
     def message_type_none(words):
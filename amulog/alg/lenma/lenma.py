@@ -9,10 +9,13 @@ This code is based on https://github.com/keiichishima/templateminer .
 """
 
 import numpy as np
+from array import array
 from collections import defaultdict
 
 from amulog import lt_common
 
+DUMP_VERSION = 1
+
 
 class Cluster:
 
@@ -21,6 +24,14 @@ class Cluster:
         self._nwords = words
         self._wordlens = np.array([len(w) for w in words])
 
+    @classmethod
+    def restore(cls, words, nwords, wordlens):
+        cluster = cls.__new__(cls)
+        cluster._words = words
+        cluster._nwords = nwords
+        cluster._wordlens = np.array(wordlens)
+        return cluster
+
     def _get_similarity_score_cosine(self, new_words):
         # cosine similarity
         from sklearn.metrics.pairwise import cosine_similarity
@@ -62,10 +73,45 @@ class LTGenLenMa(lt_common.LTGen):
         self._d_candidates = defaultdict(list)  # key: length, val: list of tid
 
     def load(self, loadobj):
-        self._clusters, self._d_candidates = loadobj
+        if lt_common.is_flat_dump(loadobj, DUMP_VERSION):
+            self._load_flat(loadobj)
+        else:
+            # old format: pickled Cluster objects
+            self._clusters, self._d_candidates = loadobj
 
     def dumpobj(self):
-        return self._clusters, self._d_candidates
+        # words of clusters are concatenated,
+        # the words of i-th cluster are in [offsets[i], offsets[i+1])
+        tids = array("q")
+        offsets = array("q", [0])
+        words = []
+        nwords = []
+        wordlens = array("q")
+        for tid, cluster in self._clusters.items():
+            tids.append(tid)
+            words.extend(cluster._words)
+            nwords.extend(cluster._nwords)
+            wordlens.extend(int(v) for v in cluster._wordlens)
+            offsets.append(len(words))
+        return {"version": DUMP_VERSION,
+                "tids": tids,
+                "offsets": offsets,
+                "words": words,
+                "nwords": nwords,
+                "wordlens": wordlens}
+
+    def _load_flat(self, loadobj):
+        # clusters are dumped in the order of addition,
+        # that is also the order of candidates
+        self._clusters = {}
+        self._d_candidates = defaultdict(list)
+        offsets = loadobj["offsets"]
+        for i, tid in enumerate(loadobj["tids"]):
+            start, end = offsets[i], offsets[i + 1]
+            self._clusters[tid] = Cluster.restore(
+                loadobj["words"][start:end], loadobj["nwords"][start:end],
+                loadobj["wordlens"][start:end])
+            self._d_candidates[end - start].append(tid)
 
     def process_line(self, pline):
         words = pline["words"]
@@ -5,6 +5,8 @@ SHISO: a log template generation algorithm proposed in [1].
 """
 
 import logging
+from array import array
+
 import numpy as np
 
 from amulog import lt_common
@@ -12,6 +14,8 @@ from amulog import lt_misc
 
 _logger = logging.getLogger(__package__)
 
+DUMP_VERSION = 1
+
 
 class LTGenNode:
 
@@ -40,10 +44,35 @@ class LTGenSHISO(lt_common.LTGen):
             self._cfunc = self.c_alphabet
 
     def load(self, loadobj):
-        self._n_root = loadobj
+        if lt_common.is_flat_dump(loadobj, DUMP_VERSION):
+            self._n_root = self._load_flat(loadobj)
+        else:
+            # old format: pickled LTGenNode tree
+            self._n_root = loadobj
 
     def dumpobj(self):
-        return self._n_root
+        # nodes in breadth-first order, children after their parents
+        # (tid -1 for the root node)
+        parents = array("q", [-1])
+        tids = array("q", [-1])
+        l_node = [self._n_root]
+        for nid, node in enumerate(l_node):
+            for child in node:
+                parents.append(nid)
+                tids.append(child.tid)
+                l_node.append(child)
+        return {"version": DUMP_VERSION,
+                "parents": parents,
+                "tids": tids}
+
+    @staticmethod
+    def _load_flat(loadobj):
+        l_node = [LTGenNode(tid if tid >= 0 else None)
+                  for tid in loadobj["tids"]]
+        for nid, parent in enumerate(loadobj["parents"]):
+            if parent >= 0:
+                l_node[parent].join(l_node[nid])
+        return l_node[0]
 
     def process_line(self, pline):
         l_w = pline["words"]
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Incremental checkpoints of the internal data of log template generation.
+
+The internal data consists of a base file (manager.indata_filename)
+with the whole data, and delta files (indata_filename.delta.N)
+with the changes after the preceding checkpoint.
+Every file is written into a temporary file and renamed,
+so that a killed process leaves only complete checkpoints.
+The base file records the sequence number of the last delta
+included in it, and older delta files are ignored in loading.
+"""
+
+import os
+import glob
+import pickle
+import logging
+
+_logger = logging.getLogger(__package__)
+
+DELTA_SUFFIX = ".delta."
+
+
+def write_atomic(filename, obj):
+    """Pickle obj into a temporary file, and rename it to filename."""
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+class Checkpointer:
+    """Writer and reader of the base and delta files.
+
+    Args:
+        filename (str): Base file path (manager.indata_filename).
+    """
+
+    def __init__(self, filename):
+        self._filename = filename
+        self.seq = 0  # sequence number of the last checkpoint
+        self.n_delta = 0  # number of delta files after the base
+        self._clean = False  # True if no stale delta files remain
+
+    def _delta_filename(self, seq):
+        return "{0}{1}{2}".format(self._filename, DELTA_SUFFIX, seq)
+
+    def _delta_files(self):
+        ret = []
+        for fp in glob.glob(glob.escape(self._filename) + DELTA_SUFFIX + "*"):
+            suffix = fp[len(self._filename) + len(DELTA_SUFFIX):]
+            if suffix.isdigit():
+                ret.append((int(suffix), fp))
+        return sorted(ret)
+
+    def _remove_deltas(self, after_seq=None):
+        for seq, fp in self._delta_files():
+            if after_seq is None or seq > after_seq:
+                os.remove(fp)
+
+    def remove(self):
+        """Remove the base and delta files."""
+        if os.path.exists(self._filename):
+            os.remove(self._filename)
+        self._remove_deltas()
+        self._clean = False
+        self.n_delta = 0
+
+    def write_base(self, obj):
+        """Write the whole data, and remove the delta files."""
+        write_atomic(self._filename, (obj, self.seq))
+        self._remove_deltas()
+        self._clean = True
+        self.n_delta = 0
+
+    @property
+    def needs_base(self):
+        """True if the base file is not written or loaded yet.
+        The existing base and deltas may belong to another processing,
+        so the first checkpoint needs the whole data."""
+        return not self._clean
+
+    def write_delta(self, delta):
+        """Write the changes after the last checkpoint."""
+        assert not self.needs_base
+        self.seq += 1
+        write_atomic(self._delta_filename(self.seq), delta)
+        self.n_delta += 1
+
+    def load(self):
+        """Load the base and delta files.
+
+        Returns:
+            Tuple[object, List[object]]: The base data and the deltas
+            to apply in order.
+        """
+        with open(self._filename, "rb") as f:
+            obj = pickle.load(f)
+        if len(obj) == 2:
+            obj, self.seq = obj
+        else:
+            # old format without checkpoints
+            self.seq = 0
+        l_delta = []
+        for seq, fp in self._delta_files():
+            if seq <= self.seq:
+                continue
+            if seq != self.seq + 1:
+                _logger.warning("checkpoint delta {0} missing, "
+                                "ignore following deltas".format(
+                                    self.seq + 1))
+                break
+            with open(fp, "rb") as f:
+                l_delta.append(pickle.load(f))
+            self.seq = seq
+        self._remove_deltas(after_seq=self.seq)
+        self._clean = True
+        self.n_delta = len(l_delta)
+        return obj, l_delta
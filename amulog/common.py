@@ -312,6 +312,18 @@ def mprocess_queueing(l_pq, n_process):
 
 # measurement
 
+def peak_memory():
+    """Return the peak resident set sizes (bytes) of this process
+    and of the terminated child processes (e.g., multiprocessing workers).
+    Available on Unix."""
+    import sys
+    import resource
+    # ru_maxrss is in bytes on macOS, in kilobytes on Linux
+    unit = 1 if sys.platform == "darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+
+
 class Timer:
 
     def __init__(self, header, output=None, timestr_func=None):
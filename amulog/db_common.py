@@ -79,6 +79,10 @@ class Database(ABC):
     def get_table_names(self):
         raise NotImplementedError
 
+    def get_indexes(self):
+        """Return a dict of index names and their table names."""
+        raise NotImplementedError
+
     def get_column_names(self, table_name):
         raise NotImplementedError
 
@@ -103,6 +107,15 @@ class Database(ABC):
     def datetime(cls, ret):
         raise NotImplementedError
 
+    @staticmethod
+    @abstractmethod
+    def datetime_bin_sql(key, seconds):
+        """SQL expression to round down datetime column values
+        into bins of given seconds.
+        Bins are aligned to the local time of the stored values
+        (e.g., 1 day bins start at 00:00 in local time)."""
+        raise NotImplementedError
+
     @staticmethod
     @abstractmethod
     def _ph(varname):
@@ -184,7 +197,8 @@ class Database(ABC):
 
     @classmethod
     def select_sql(cls, table_name, l_key,
-                   l_cond=None, l_order=None, opt=None, limit=None):
+                   l_cond=None, l_order=None, opt=None, limit=None,
+                   l_group=None):
         # now only "distinct" is allowed for opt
         sql_header = "select"
         if opt is not None and "distinct" in opt:
@@ -193,6 +207,8 @@ class Database(ABC):
                                         table_name)
         if l_cond is not None and len(l_cond) > 0:
             sql += " where {0}".format(cls._cond_state(l_cond))
+        if l_group is not None and len(l_group) > 0:
+            sql += " group by " + ", ".join(l_group)
         if l_order is not None and len(l_order) > 0:
             sql_order = ", ".join(["{0} {1}".format(col, order)
                                    for col, order in l_order])
@@ -228,5 +244,5 @@ class Database(ABC):
         return "drop table {0}".format(table_name)
 
     @staticmethod
-    def drop_index_sql(index_name):
+    def drop_index_sql(index_name, table_name=None):
         return "drop index {0}".format(index_name)
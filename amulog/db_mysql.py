@@ -41,6 +41,10 @@ class Mysql(db_common.Database):
         return self._dbname in [row[0] for row in cursor]
 
     def reset(self):
+        if self._connect is not None:
+            # release the locks of the database to drop
+            self._connect.close()
+            self._connect = None
         connect = self._connect_root()
         cursor = connect.cursor()
         sql = "drop database if exists {0}".format(self._dbname)
@@ -58,6 +62,14 @@ class Mysql(db_common.Database):
     def datetime(cls, ret):
         return ret
 
+    @staticmethod
+    def datetime_bin_sql(key, seconds):
+        # unix_timestamp converts values in the session time zone,
+        # which aligns bins to UTC instead of the local time of the values
+        return ("timestampadd(second, floor(timestampdiff(second, "
+                "'1970-01-01', {0}) / {1}) * {1}, '1970-01-01')").format(
+            key, int(seconds))
+
     @staticmethod
     def _ph(varname):
         return "%({0})s".format(varname)
@@ -113,6 +125,19 @@ class Mysql(db_common.Database):
         cursor = self.execute(sql)
         return [row[0] for row in cursor]
 
+    def get_indexes(self):
+        sql = ("select distinct index_name, table_name "
+               "from information_schema.statistics "
+               "where table_schema = database()")
+        cursor = self.execute(sql)
+        return {row[0]: row[1] for row in cursor}
+
+    @staticmethod
+    def drop_index_sql(index_name, table_name=None):
+        if table_name is None:
+            return "drop index {0}".format(index_name)
+        return "drop index {0} on {1}".format(index_name, table_name)
+
     def get_column_names(self, table_name):
         raise NotImplementedError
 
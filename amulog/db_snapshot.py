@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Export and import a whole amulog database as a snapshot file.
+
+A snapshot consists of a magic string and a sequence of frames.
+Every frame is a zlib-compressed pickle with a length prefix.
+Table rows are stored in chunks in a DBMS-independent format,
+so that a snapshot can be imported into another database backend
+(e.g., from sqlite3 to mysql).
+The internal data of template generation (manager.indata_filename)
+is also stored to continue the processing after importing.
+
+Note that archived blocks (see log_archive) are not included,
+copy database.archive_dir separately.
+"""
+
+import os
+import zlib
+import pickle
+import struct
+import logging
+
+from . import log_db
+
+_logger = logging.getLogger(__package__)
+
+SNAPSHOT_MAGIC = b"AMULOGSS"
+SNAPSHOT_VERSION = 1
+DEFAULT_CHUNK_SIZE = 100000
+
+FRAME_HEADER = "header"
+FRAME_ROWS = "rows"
+FRAME_INDATA = "indata"
+FRAME_END = "end"
+
+_LENGTH = struct.Struct(">Q")
+
+
+def _write_frame(f, obj):
+    data = zlib.compress(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+    f.write(_LENGTH.pack(len(data)))
+    f.write(data)
+
+
+def _read_frame(f):
+    buf = f.read(_LENGTH.size)
+    if len(buf) < _LENGTH.size:
+        raise IOError("unexpected end of snapshot")
+    length = _LENGTH.unpack(buf)[0]
+    data = f.read(length)
+    if len(data) < length:
+        raise IOError("unexpected end of snapshot")
+    return pickle.loads(zlib.decompress(data))
+
+
+def export_db(conf, filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Export DB tables and template generation data into a snapshot file.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        filename (str): Output snapshot file path.
+        chunk_size (int): Number of rows in one frame.
+
+    Returns:
+        dict: Number of exported rows for each table.
+    """
+    db = log_db.LogDB(conf, edit=False, reset_db=False)
+    tables = db.existing_tables()
+    d_cnt = {}
+    with open(filename, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        _write_frame(f, (FRAME_HEADER, SNAPSHOT_VERSION, tables))
+        for table_name in tables:
+            cnt = 0
+            buf = []
+            for row in db.iter_table_rows(table_name):
+                buf.append(row)
+                if len(buf) >= chunk_size:
+                    _write_frame(f, (FRAME_ROWS, table_name, buf))
+                    cnt += len(buf)
+                    buf = []
+            if len(buf) > 0:
+                _write_frame(f, (FRAME_ROWS, table_name, buf))
+                cnt += len(buf)
+            d_cnt[table_name] = cnt
+            _logger.info("export {0} rows in table {1}".format(
+                cnt, table_name))
+
+        indata_filename = conf.get("manager", "indata_filename")
+        if os.path.exists(indata_filename):
+            with open(indata_filename, "rb") as f_indata:
+                _write_frame(f, (FRAME_INDATA, f_indata.read()))
+        _write_frame(f, (FRAME_END,))
+    return d_cnt
+
+
+def import_db(conf, filename):
+    """Reset DB and load a snapshot file made with export_db.
+    Indexes are created after all rows are inserted.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        filename (str): Input snapshot file path.
+
+    Returns:
+        dict: Number of imported rows for each table.
+    """
+    with open(filename, "rb") as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise IOError("{0} is not an amulog snapshot".format(filename))
+        frame = _read_frame(f)
+        if frame[0] != FRAME_HEADER:
+            raise IOError("snapshot header not found")
+        _, version, tables = frame
+        if version != SNAPSHOT_VERSION:
+            raise IOError("unsupported snapshot version {0}".format(version))
+
+        db = log_db.LogDB(conf, edit=True, reset_db=True)
+        for table_name in tables:
+            if table_name not in db.existing_tables():
+                db.init_optional_table(table_name)
+        db.drop_index()
+
+        d_cnt = {table_name: 0 for table_name in tables}
+        while True:
+            frame = _read_frame(f)
+            if frame[0] == FRAME_ROWS:
+                _, table_name, rows = frame
+                db.add_table_rows(table_name, rows)
+                d_cnt[table_name] += len(rows)
+            elif frame[0] == FRAME_INDATA:
+                indata_filename = conf.get("manager", "indata_filename")
+                with open(indata_filename, "wb") as f_indata:
+                    f_indata.write(frame[1])
+            elif frame[0] == FRAME_END:
+                break
+            else:
+                raise IOError("invalid snapshot frame {0}".format(frame[0]))
+
+    for table_name, cnt in d_cnt.items():
+        _logger.info("import {0} rows in table {1}".format(cnt, table_name))
+    db.init_index()
+    db.commit()
+    return d_cnt
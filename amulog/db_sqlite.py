@@ -26,6 +26,9 @@ class Sqlite3(db_common.Database):
             return False
 
     def reset(self):
+        if self._connect is not None:
+            self._connect.close()
+            self._connect = None
         if os.path.exists(self._dbpath):
             os.remove(self._dbpath)
 
@@ -61,6 +64,11 @@ class Sqlite3(db_common.Database):
         cursor = self.execute(sql)
         return [row[0] for row in cursor]
 
+    def get_indexes(self):
+        sql = "select name, tbl_name from sqlite_master where type='index'"
+        cursor = self.execute(sql)
+        return {row[0]: row[1] for row in cursor}
+
     def get_column_names(self, table_name):
         sql = ("select sql from sqlite_master "
                "where type='table' and name='{0}'".format(table_name))
@@ -78,6 +86,13 @@ class Sqlite3(db_common.Database):
     def datetime(cls, ret):
         return cls.strptime(ret)
 
+    @staticmethod
+    def datetime_bin_sql(key, seconds):
+        # values are stored in local time without time zone,
+        # and strftime('%s') and 'unixepoch' read them as UTC
+        return ("datetime((strftime('%s', {0}) / {1}) * {1}, "
+                "'unixepoch')").format(key, int(seconds))
+
     @staticmethod
     def _ph(varname):
         return ":{0}".format(varname)
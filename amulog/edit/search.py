@@ -19,14 +19,18 @@ def agg_words(ld, target="all"):
 
     from .. import lt_common
     d_stats = defaultdict(int)
+    if target == "description":
+        # description words only depend on templates
+        for (ltid,), cnt in ld.count_by(keys=("ltid",)).items():
+            for w in ld.lt(ltid).ltw:
+                if w != lt_common.REPLACER:
+                    d_stats[w] += cnt
+        return d_stats
+
     for lm in ld.iter_all():
         if target == "all":
             for w in lm.l_w:
                 d_stats[w] += 1
-        elif target == "description":
-            for w in lm.lt.ltw:
-                if w != lt_common.REPLACER:
-                    d_stats[w] += 1
         elif target == "variable":
             for w in lm.var():
                 d_stats[w] += 1
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Buffered output of log lines that are not stored into DB.
+
+Failed lines are buffered and appended to manager.fail_output
+in a batch (optionally gzip-compressed), and the file is rotated
+when it exceeds the configured size.
+The number of failed lines is counted for every reason.
+"""
+
+import os
+import logging
+from collections import Counter
+
+_logger = logging.getLogger(__package__)
+
+FAIL_PARSE = "parse_error"
+FAIL_UNKNOWN_HOST = "unknown_host"
+FAIL_NO_TPL = "no_tpl"
+
+
+class FailureSink:
+    """Buffered writer of failed lines.
+
+    Args:
+        filename (str): Output file path.
+            If compress is True, ".gz" is added if not given.
+            If None, failed lines are only counted.
+        buffer_size (int): Number of lines to buffer before writing.
+        compress (bool): Write with gzip compression.
+        max_bytes (int): Rotate the file if its size exceeds this bytes.
+            If 0, the file is not rotated.
+        backup_count (int): Number of rotated files to keep,
+            renamed to filename.1, filename.2, ...
+
+    Attributes:
+        counts (collections.Counter): Number of failed lines
+            for every reason.
+    """
+
+    def __init__(self, filename, buffer_size=1000, compress=False,
+                 max_bytes=0, backup_count=5):
+        if compress and filename is not None and \
+                not filename.endswith(".gz"):
+            filename += ".gz"
+        self.filename = filename
+        self._buffer_size = buffer_size
+        self._compress = compress
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._buffer = []
+        self.counts = Counter()
+
+    def write(self, line, reason):
+        self.counts[reason] += 1
+        if self.filename is None:
+            return
+        self._buffer.append(line)
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def _open(self):
+        if self._compress:
+            import gzip
+            # appended as another gzip member, readable with gzip.open
+            return gzip.open(self.filename, "at")
+        else:
+            return open(self.filename, "a")
+
+    def flush(self):
+        if len(self._buffer) == 0:
+            return
+        with self._open() as f:
+            f.writelines(self._buffer)
+        self._buffer = []
+        if 0 < self._max_bytes <= os.path.getsize(self.filename):
+            self._rotate()
+
+    def _rotate(self):
+        if self._backup_count <= 0:
+            os.remove(self.filename)
+            return
+        for i in range(self._backup_count - 1, 0, -1):
+            src = "{0}.{1}".format(self.filename, i)
+            if os.path.exists(src):
+                os.replace(src, "{0}.{1}".format(self.filename, i + 1))
+        os.replace(self.filename, self.filename + ".1")
+
+    def __str__(self):
+        return "failed lines: {0}".format(", ".join(
+            "{0} {1}".format(cnt, reason)
+            for reason, cnt in sorted(self.counts.items())))
+
+
+def init_fail_sink(conf):
+    return FailureSink(
+        conf.get("manager", "fail_output"),
+        buffer_size=conf.getint("manager", "fail_output_buffer"),
+        compress=conf.getboolean("manager", "fail_output_compress"),
+        max_bytes=conf.getint("manager", "fail_output_max_bytes"),
+        backup_count=conf.getint("manager", "fail_output_backup_count"))
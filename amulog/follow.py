@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Continuous ingestion of growing log files (command db-follow).
+
+One LTManager is kept alive, and the target files are polled
+for appended lines like tail -F. Rotated files (replaced with
+a new file of the same path) are read to the end before switching
+to the new file, and truncated files are read again from the beginning.
+The read offsets are recorded in a state file on every DB commit,
+so that db-follow continues from the committed lines after restarting.
+"""
+
+import os
+import json
+import time
+import logging
+
+_logger = logging.getLogger(__package__)
+
+
+class FileFollower:
+    """Reader of lines appended to a file.
+
+    Args:
+        path (str): File path to follow.
+        inode (int, optional): Inode of the file read previously.
+        offset (int, optional): Byte offset read previously.
+            Used only if the inode is same as that of the current file.
+        encoding (str, optional)
+        errors (str, optional)
+    """
+
+    def __init__(self, path, inode=None, offset=0,
+                 encoding="utf-8", errors="ignore"):
+        self.path = path
+        self._encoding = encoding
+        self._errors = errors
+        self._fd = None
+        self._inode = inode
+        self._offset = offset
+        self._buf = b""
+
+    @property
+    def state(self):
+        """Tuple[int, int]: Inode and byte offset just after
+        the last line given by read_lines."""
+        return self._inode, self._offset
+
+    def _open(self):
+        try:
+            fd = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        inode = os.fstat(fd.fileno()).st_ino
+        if inode == self._inode and \
+                self._offset <= os.fstat(fd.fileno()).st_size:
+            fd.seek(self._offset)
+        else:
+            if self._inode is not None:
+                _logger.info("follow new file {0}".format(self.path))
+            self._inode = inode
+            self._offset = 0
+        self._fd = fd
+        self._buf = b""
+        return True
+
+    def _is_rotated(self):
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return True
+
+    def close(self):
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+    def read_lines(self):
+        """Read lines appended after the previous call.
+        A line without newline at the end of the file is kept
+        until the line is completed.
+
+        Yields:
+            str: A log message line.
+        """
+        if self._fd is None and not self._open():
+            return
+        if os.fstat(self._fd.fileno()).st_size < self._offset:
+            _logger.info("{0} is truncated".format(self.path))
+            self._fd.seek(0)
+            self._offset = 0
+            self._buf = b""
+
+        rotated = self._is_rotated()
+        # read to the end (of the rotated file)
+        for bline in self._fd:
+            if not bline.endswith(b"\n"):
+                self._buf += bline
+                break
+            bline = self._buf + bline
+            self._buf = b""
+            self._offset += len(bline)
+            yield bline.decode(self._encoding, self._errors)
+
+        if rotated:
+            if len(self._buf) > 0:
+                bline, self._buf = self._buf, b""
+                self._offset += len(bline)
+                yield bline.decode(self._encoding, self._errors) + "\n"
+            self.close()
+            yield from self.read_lines()
+
+
+def load_state(filename):
+    """Return read offsets of files recorded with save_state."""
+    if filename is None or not os.path.exists(filename):
+        return {}
+    with open(filename, "r") as f:
+        return {path: tuple(val) for path, val in json.load(f).items()}
+
+
+def save_state(filename, l_follower):
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "w") as f:
+        json.dump({fl.path: fl.state for fl in l_follower}, f)
+    os.replace(tmp_filename, filename)
+
+
+def follow_files(conf, targets, reset_db=False, max_polls=None):
+    """Add log messages to DB continuously from growing files.
+    Stopped with SIGINT or SIGTERM.
+
+    The processed lines are committed every manager.online_batchsize lines
+    or manager.follow_commit_interval seconds.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        targets (List[str]): A sequence of filepaths to follow.
+        reset_db (bool): True if DB needs to reset before adding.
+        max_polls (int, optional): Stop after polling the files
+            given times, mainly for testing.
+    """
+    def _sigterm_handler(*_):
+        raise KeyboardInterrupt
+
+    import signal
+    signal.signal(signal.SIGTERM, _sigterm_handler)
+
+    from . import log_db
+    from . import manager
+    poll_interval = conf.getfloat("manager", "follow_poll_interval")
+    commit_interval = conf.getfloat("manager", "follow_commit_interval")
+    state_filename = conf.get("manager", "follow_state_filename")
+    if state_filename.strip() == "":
+        state_filename = None
+    if reset_db and state_filename is not None \
+            and os.path.exists(state_filename):
+        os.remove(state_filename)
+
+    d_state = load_state(state_filename)
+    l_follower = []
+    for path in targets:
+        inode, offset = d_state.get(path, (None, 0))
+        l_follower.append(FileFollower(path, inode, offset))
+
+    ld = log_db.LogData(conf, edit=True, reset_db=reset_db)
+    ltm = manager.LTManager(conf, ld.db, ld.lttable, reset_db=reset_db)
+    ltm.load_internal_data()
+    last_commit = [time.time()]
+
+    def _commit_hook():
+        last_commit[0] = time.time()
+        if state_filename is not None:
+            save_state(state_filename, l_follower)
+
+    ltm.set_commit_hook(_commit_hook)
+    _logger.info("amulog follow {0} files".format(len(l_follower)))
+
+    n_poll = 0
+    n_uncommitted = 0
+    try:
+        while max_polls is None or n_poll < max_polls:
+            n_poll += 1
+            n_lines = 0
+            for fl in l_follower:
+                for line in fl.read_lines():
+                    ltm.process_line(line)
+                    n_lines += 1
+            n_uncommitted += n_lines
+            if n_uncommitted > 0 and \
+                    time.time() - last_commit[0] >= commit_interval:
+                ltm.commit_db()
+                n_uncommitted = 0
+            if n_lines == 0 and (max_polls is None or n_poll < max_polls):
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ltm.process_online_end()
+        ltm.commit_db()
+        ltm.dump()
+        for fl in l_follower:
+            fl.close()
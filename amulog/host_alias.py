@@ -2,10 +2,60 @@
 # coding: utf-8
 
 import ipaddress
+import functools
 from collections import defaultdict
 
 from . import config
 
+DEFAULT_CACHE_SIZE = 10000
+
+
+class PrefixTable(object):
+    """Longest prefix match of IP addresses on integer network addresses.
+    Networks are stored in a hash table for every prefix length,
+    and looked up from the longest prefix length.
+    """
+
+    def __init__(self):
+        # key = (version, prefixlen), val = dict(network int -> value)
+        self._d_table = {}
+        self._l_key = []
+
+    def __len__(self):
+        return sum(len(d) for d in self._d_table.values())
+
+    def add(self, net, value):
+        """
+        Args:
+            net (ipaddress.IPv4Network or ipaddress.IPv6Network)
+            value: Any object returned in lookup.
+        """
+        shift = net.max_prefixlen - net.prefixlen
+        key = (net.version, net.prefixlen)
+        if key not in self._d_table:
+            self._d_table[key] = {}
+            self._l_key = sorted(self._d_table.keys(),
+                                 key=lambda x: x[1], reverse=True)
+        self._d_table[key][int(net.network_address) >> shift] = value
+
+    def lookup(self, addr):
+        """Return the value of the longest matching network,
+        or None if the address is not included in any network.
+
+        Args:
+            addr (ipaddress.IPv4Address or ipaddress.IPv6Address)
+        """
+        version = addr.version
+        max_prefixlen = addr.max_prefixlen
+        iaddr = int(addr)
+        for key in self._l_key:
+            if key[0] != version:
+                continue
+            ret = self._d_table[key].get(iaddr >> (max_prefixlen - key[1]))
+            if ret is not None:
+                return ret
+        return None
+
 
 class HostAlias(object):
     """
@@ -15,14 +65,29 @@ class HostAlias(object):
         in log templates.
     """
 
-    def __init__(self, fn):
+    def __init__(self, fn, cache_size=DEFAULT_CACHE_SIZE):
         self._fn = fn
         self._d_alias = defaultdict(list)  # key = alias, val = List[host]
         self._d_ralias = {}  # key = host, val = alias
         self._d_group = defaultdict(list)  # key = group, val = List[host]
         self._d_rgroup = {}  # key = host, val = group
-        self._l_net = []
+        self._nets = PrefixTable()  # val = network string as the key
+        self._cache_size = cache_size
         self._open(self._fn)
+        self._init_cache()
+
+    def _init_cache(self):
+        self._lookup_key = functools.lru_cache(
+            maxsize=self._cache_size)(self._lookup_key_nocache)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lookup_key"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_cache()
 
     def _open(self, fn):
         group = "default"
@@ -65,10 +130,11 @@ class HostAlias(object):
         for name in l_name:
             if "/" in name:
                 try:
-                    net = str(ipaddress.ip_network(name))
+                    netobj = ipaddress.ip_network(name)
+                    net = str(netobj)
                     add_alias(net, alias)
                     add_groupdef(net, group)
-                    self._l_net.append(net)
+                    self._nets.add(netobj, net)
                 except ValueError:
                     add_alias(name, alias)
                     add_groupdef(name, group)
@@ -95,59 +161,46 @@ class HostAlias(object):
             print(" ".join([str(v) for v in val]))
             print()
 
-    def isknown(self, string):
+    def _lookup_key_nocache(self, string):
+        # return the defined host or network including string
+        if string in self._d_ralias:
+            return string
+        name = string.lower()
+        if name in self._d_ralias:
+            return name
+        if not (string[:1].isdigit() or ":" in string):
+            # not an IP address, avoid raising ValueError
+            return None
         try:
-            addr = str(ipaddress.ip_address(string))
-            for net in self._l_net:
-                if addr in net:
-                    return True
-            else:
-                if addr in self._d_ralias:
-                    return True
-                else:
-                    return False
+            addr = ipaddress.ip_address(string)
         except ValueError:
-            name = string.lower()
-            return name in self._d_ralias
+            return None
+        key = str(addr)
+        if key in self._d_ralias:
+            return key
+        return self._nets.lookup(addr)
+
+    def isknown(self, string):
+        return self._lookup_key(string) is not None
 
     def resolve_host(self, string):
-        try:
-            addr = str(ipaddress.ip_address(string))
-            for net in self._l_net:
-                if addr in net:
-                    return self._d_ralias[net]
-            else:
-                if addr in self._d_ralias:
-                    return self._d_ralias[addr]
-                else:
-                    return None
-        except ValueError:
-            name = string.lower()
-            if name in self._d_ralias:
-                return self._d_ralias[name]
-            else:
-                return None
+        key = self._lookup_key(string)
+        if key is None:
+            return None
+        return self._d_ralias[key]
+
+    def cache_info(self):
+        """Return statistics of the lookup cache (functools.lru_cache)."""
+        return self._lookup_key.cache_info()
 
     def group(self, group):
         return self._d_group[group]
 
     def get_group(self, string):
-        try:
-            addr = str(ipaddress.ip_address(string))
-            for net in self._l_net:
-                if addr in net:
-                    return self._d_rgroup[net]
-            else:
-                if addr in self._d_rgroup:
-                    return self._d_rgroup[addr]
-                else:
-                    return None
-        except ValueError:
-            name = string.lower()
-            if name in self._d_rgroup:
-                return self._d_rgroup[name]
-            else:
-                return None
+        key = self._lookup_key(string)
+        if key is None:
+            return None
+        return self._d_rgroup.get(key)
 
 
 def init_hostalias(conf):
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Write-ahead journal for online log template generation.
+
+The journal is an append-only file of pickled record frames.
+Every processed message is recorded with its input position
+(file index and byte offset after the line), the assigned lid and ltid,
+and the parsed contents to be stored in DB.
+A commit record with the last lid in DB is appended
+after every DB commit.
+
+If the online processing is killed, the DB keeps the messages
+until the last commit, and the journal keeps the messages
+until the last synced frame. In resuming, the messages before
+the last commit record are fed only to the template generator
+to reproduce its internal state, and the messages after that
+are stored into DB again. If DB has lids larger than the last
+commit record (i.e., killed between the DB commit and the journal
+commit), the messages after that are already stored in DB,
+and they are also fed only to the template generator.
+Then the processing restarts from the last journaled input position.
+
+When the internal data of template generation is written
+(at checkpoints, see manager.checkpoint_interval), the journal is
+rebased: it is replaced with a new header and a commit record
+at the current position. Resuming then loads the internal data and
+replays only the messages after it, so the journal and the replay
+do not grow with the whole input.
+"""
+
+import os
+import pickle
+import logging
+
+import log2seq
+
+_logger = logging.getLogger(__package__)
+
+JOURNAL_VERSION = 2
+
+RECORD_HEADER = "header"
+RECORD_LINE = "line"
+RECORD_COMMIT = "commit"
+
+
+class Journal:
+    """Append-only writer of the write-ahead journal.
+
+    Args:
+        filename (str): Journal file path.
+        sync_interval (int): Number of records to buffer
+            before writing and syncing them to the disk.
+    """
+
+    def __init__(self, filename, sync_interval=1000):
+        self._filename = filename
+        self._sync_interval = sync_interval
+        self._buffer = []
+        self._position = (0, 0)
+        self._fd = None
+        self._targets = []
+        self._n_uncommitted = 0
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def start(self, targets, reset_db, lid=0):
+        """Create a new journal, overwriting the existing one.
+        lid is the last lid stored in DB before processing."""
+        self._fd = open(self._filename, "wb")
+        self._targets = list(targets)
+        self._buffer.append((RECORD_HEADER, JOURNAL_VERSION,
+                             self._targets, reset_db, lid))
+        self.flush()
+
+    def reopen(self, targets, valid_size):
+        """Open an existing journal to append records after resuming.
+        Broken frames after valid_size bytes are discarded."""
+        self._targets = list(targets)
+        self._fd = open(self._filename, "r+b")
+        self._fd.truncate(valid_size)
+        self._fd.seek(valid_size)
+
+    def set_position(self, fid, offset):
+        """Set input position of the message to be processed next.
+
+        Args:
+            fid (int): Index of the input file in targets.
+            offset (int): Byte offset just after the message line.
+        """
+        self._position = (fid, offset)
+
+    def add_line(self, lm, pline):
+        """Record a message stored in DB.
+
+        Args:
+            lm (log_db.LogMessage): An annotated log message instance.
+            pline (dict): A parsed log message with log2seq.
+        """
+        fid, offset = self._position
+        self._buffer.append((RECORD_LINE, fid, offset, lm.lid, lm.lt.ltid,
+                             lm.dt, lm.host, lm.l_w,
+                             pline[log2seq.KEY_SYMBOLS]))
+        self._n_uncommitted += 1
+        if len(self._buffer) >= self._sync_interval:
+            self.flush()
+
+    def commit(self, lid):
+        """Record that the DB is committed until the current position,
+        and the last lid in the committed DB."""
+        fid, offset = self._position
+        self._buffer.append((RECORD_COMMIT, fid, offset, lid))
+        self.flush()
+        self._n_uncommitted = 0
+
+    def rebase(self, lid):
+        """Replace the journal with a header and a commit record
+        at the current position (written atomically). Called after
+        the internal data including all journaled messages is written.
+
+        Args:
+            lid (int): The last lid in the committed DB.
+
+        Returns:
+            bool: False if not rebased because of uncommitted records.
+        """
+        if self._fd is None or self._n_uncommitted > 0:
+            return False
+        fid, offset = self._position
+        frame = [(RECORD_HEADER, JOURNAL_VERSION, self._targets, False, lid),
+                 (RECORD_COMMIT, fid, offset, lid)]
+        tmp_filename = self._filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            f.write(pickle.dumps(frame))
+            f.flush()
+            os.fsync(f.fileno())
+        self._fd.close()
+        os.replace(tmp_filename, self._filename)
+        self._fd = open(self._filename, "ab")
+        return True
+
+    def flush(self, sync=True):
+        if self._fd is None or len(self._buffer) == 0:
+            return
+        self._fd.write(pickle.dumps(self._buffer))
+        self._fd.flush()
+        if sync:
+            os.fsync(self._fd.fileno())
+        self._buffer = []
+
+    def close(self, remove=True):
+        """Close the journal. If remove is True, the journal file is
+        removed because the processing is successfully finished."""
+        if self._fd is None:
+            return
+        self.flush()
+        self._fd.close()
+        self._fd = None
+        if remove:
+            os.remove(self._filename)
+
+
+class JournalState:
+    """Contents of an existing journal loaded for resuming.
+
+    Attributes:
+        targets (List[str]): Input files of the interrupted processing.
+        reset_db (bool): True if the interrupted processing reset DB.
+        committed (list): Line records before the last commit record.
+            The messages are already stored in DB.
+        uncommitted (list): Line records after the last commit record.
+            The messages need to be stored in DB again.
+        position (Tuple[int, int]): Last input position in the journal.
+        lid (int): Last lid in DB at the last commit record.
+        valid_size (int): Size of the journal without broken frames.
+    """
+
+    def __init__(self, targets, reset_db, lid):
+        self.targets = targets
+        self.reset_db = reset_db
+        self.committed = []
+        self.uncommitted = []
+        self.position = (0, 0)
+        self.lid = lid
+        self.valid_size = 0
+
+    def __len__(self):
+        return len(self.committed) + len(self.uncommitted)
+
+    @staticmethod
+    def record_to_pline(record):
+        """Restore a parsed message and its lid and ltid
+        from a line record."""
+        _, _, _, lid, ltid, dt, host, l_w, l_s = record
+        pline = {log2seq.KEY_TIMESTAMP: dt,
+                 "host": host,
+                 log2seq.KEY_WORDS: l_w,
+                 log2seq.KEY_SYMBOLS: l_s,
+                 "lid": lid}
+        return pline, ltid
+
+    @staticmethod
+    def record_to_line(record):
+        """Restore a pseudo original line from a line record."""
+        from . import strutil
+        _, _, _, _, _, dt, host, l_w, l_s = record
+        message = "".join(s + strutil.restore_esc(w)
+                          for w, s in zip(list(l_w) + [""], l_s))
+        return " ".join((str(dt), host, message)) + "\n"
+
+
+def load_journal(filename):
+    """Load an existing journal.
+
+    Returns:
+        JournalState
+
+    Raises:
+        IOError: If the journal is not found or have no valid header.
+    """
+    if not os.path.exists(filename):
+        raise IOError("journal {0} not found".format(filename))
+
+    state = None
+    with open(filename, "rb") as f:
+        while True:
+            try:
+                frame = pickle.load(f)
+            except EOFError:
+                break
+            except (pickle.UnpicklingError, ValueError, TypeError,
+                    AttributeError, IndexError):
+                # frame broken in writing
+                valid_size = 0 if state is None else state.valid_size
+                _logger.warning("discard broken frames in journal "
+                                "after {0} bytes".format(valid_size))
+                break
+            for record in frame:
+                if record[0] == RECORD_HEADER:
+                    if record[1] != JOURNAL_VERSION:
+                        raise IOError("unsupported journal version "
+                                      "{0}".format(record[1]))
+                    _, _, targets, reset_db, lid = record
+                    state = JournalState(targets, reset_db, lid)
+                elif state is None:
+                    raise IOError("journal {0} has no header".format(
+                        filename))
+                elif record[0] == RECORD_LINE:
+                    state.uncommitted.append(record)
+                    state.position = (record[1], record[2])
+                elif record[0] == RECORD_COMMIT:
+                    state.committed += state.uncommitted
+                    state.uncommitted = []
+                    state.position = (record[1], record[2])
+                    state.lid = record[3]
+            if state is None:
+                raise IOError("journal {0} has no header".format(filename))
+            state.valid_size = f.tell()
+
+    if state is None:
+        raise IOError("journal {0} is empty".format(filename))
+    return state
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Compressed cold storage for old log messages.
+
+Old log messages are moved from the log table into block files
+in the archive directory. Every block keeps the messages of one
+log template (ltid) in one day, compressed with zlib or zstd.
+The blocks are indexed with the archive table in DB,
+so that LogDB can read only the blocks needed for given conditions.
+"""
+
+import os
+import pickle
+import logging
+
+_logger = logging.getLogger(__package__)
+
+CODEC_ZLIB = b"z"
+CODEC_ZSTD = b"s"
+BLOCK_SUFFIX = ".blk"
+
+
+class LogArchive:
+    """Reader and writer of archived message blocks.
+
+    Args:
+        dirname (str): Directory to store block files.
+        compression (str): One of [zlib, zstd].
+            zstd requires zstandard package.
+    """
+
+    def __init__(self, dirname, compression="zlib"):
+        if dirname is None or dirname.strip() == "":
+            raise ValueError("database.archive_dir is not configured")
+        self._dirname = dirname
+        if compression == "zlib":
+            self._codec = CODEC_ZLIB
+        elif compression == "zstd":
+            self._codec = CODEC_ZSTD
+        else:
+            raise ValueError("invalid archive_compression {0}".format(
+                compression))
+
+    def _compress(self, data):
+        if self._codec == CODEC_ZSTD:
+            import zstandard
+            return self._codec + zstandard.ZstdCompressor().compress(data)
+        else:
+            import zlib
+            return self._codec + zlib.compress(data)
+
+    @staticmethod
+    def _decompress(data):
+        codec, body = data[:1], data[1:]
+        if codec == CODEC_ZSTD:
+            import zstandard
+            return zstandard.ZstdDecompressor().decompress(body)
+        elif codec == CODEC_ZLIB:
+            import zlib
+            return zlib.decompress(body)
+        else:
+            raise ValueError("unknown archive block codec")
+
+    def _path(self, filename):
+        return os.path.join(self._dirname, filename)
+
+    def write_block(self, filename, rows):
+        """Append a block of message rows to a block file.
+
+        Args:
+            filename (str): Block file name in the archive directory.
+            rows (List[tuple]): Message rows of (lid, ltid, dt, host, words).
+                dt is given as a string in database format.
+
+        Returns:
+            Tuple[int, int]: Offset and length of the block in the file.
+        """
+        if not os.path.isdir(self._dirname):
+            os.makedirs(self._dirname)
+        data = self._compress(pickle.dumps(rows))
+        with open(self._path(filename), "ab") as f:
+            offset = f.tell()
+            f.write(data)
+        return offset, len(data)
+
+    def remove_files(self, l_filename):
+        """Remove block files in the archive directory.
+
+        Args:
+            l_filename (List[str]): Block file names
+                (e.g., listed in the archive table).
+        """
+        for filename in l_filename:
+            path = self._path(filename)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def read_block(self, filename, offset, length):
+        """Read message rows in a block."""
+        with open(self._path(filename), "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        return pickle.loads(self._decompress(data))
+
+
+def init_archive(conf):
+    dirname = conf.get("database", "archive_dir")
+    compression = conf.get("database", "archive_compression")
+    return LogArchive(dirname, compression)
@@ -6,9 +6,12 @@ Construct and manage database of log messages, templates,
 and grouping definitions.
 """
 
+import re
+import time
+import heapq
 import datetime
 import logging
-from collections import defaultdict
+from collections import defaultdict, Counter
 from dateutil.tz import tzlocal
 
 from . import common
@@ -31,10 +34,13 @@ class LogMessage:
         dt (datetime.datetime): A timestamp for this message.
         host (str): A hostname that output this message.
         l_w (List(str)): A sequence of words in this message.
+        repeat (int): Number of identical messages collapsed into this one.
+        dt_last (datetime.datetime): A timestamp of the last
+            collapsed message. Equal to dt if not collapsed.
 
     """
 
-    def __init__(self, lid, lt, dt, host, l_w):
+    def __init__(self, lid, lt, dt, host, l_w, repeat=1, dt_last=None):
         """
         Args:
             lid (int): A message identifier in DB.
@@ -42,6 +48,9 @@ class LogMessage:
             dt (datetime.datetime): A timestamp for this message.
             host (str): A hostname that output this message.
             l_w (List(str)): A sequence of words in this message.
+            repeat (Optional[int]): Number of collapsed identical messages.
+            dt_last (Optional[datetime.datetime]): A timestamp of
+                the last collapsed message.
 
         """
         self.lid = lid
@@ -49,6 +58,11 @@ class LogMessage:
         self.dt = dt
         self.host = host
         self.l_w = l_w
+        self.repeat = repeat
+        if dt_last is None:
+            self.dt_last = dt
+        else:
+            self.dt_last = dt_last
 
     def __str__(self):
         """str: Show attributes in 1 string."""
@@ -88,6 +102,21 @@ class LogMessage:
         return " ".join((str(self.dt), str(self.host),
                          self.restore_message()))
 
+    def expand(self):
+        """Restore identical messages collapsed into this message.
+        The timestamps between dt and dt_last are linearly interpolated.
+
+        Yields:
+            LogMessage
+        """
+        if self.repeat <= 1:
+            yield self
+            return
+        step = (self.dt_last - self.dt) / (self.repeat - 1)
+        for i in range(self.repeat):
+            yield LogMessage(self.lid, self.lt, self.dt + step * i,
+                             self.host, self.l_w)
+
 
 class LogData:
     """Interface to get, add or edit log messages in DB.
@@ -161,10 +190,13 @@ class LogData:
                 The pattern follows that of SQL LIKE operator.
             host_regexp (str): A pattern to find host.
                 The pattern follows that of SQL REGEXP operator.
+            expand (bool): If True, identical messages collapsed
+                in database.collapse_repeat mode are yielded separately.
 
         Yields:
             LogMessage: An annotated log message instance
                 which satisfies all given conditions.
+                Archived messages (see archive_lines) are also yielded.
         """
         _logger.debug("iter_lines called ({0})".format(" ".join(
             ["{0}:{1}".format(k, v) for k, v in kwargs.items()
@@ -173,13 +205,22 @@ class LogData:
         limit = None
         if "limit" in kwargs:
             limit = kwargs.pop("limit")
+        expand = kwargs.pop("expand", False)
         assert len(kwargs) >= 1, "empty arguments"
         for d_line in self.db.iter_lines(kwargs, limit=limit):
-            yield self._row_to_lm(d_line)
+            lm = self._row_to_lm(d_line)
+            if expand:
+                yield from lm.expand()
+            else:
+                yield lm
 
-    def iter_all(self):
+    def iter_all(self, expand=False):
         for d_line in self.db.iter_all():
-            yield self._row_to_lm(d_line)
+            lm = self._row_to_lm(d_line)
+            if expand:
+                yield from lm.expand()
+            else:
+                yield lm
 
     def get_tags(self, **kwargs):
         """Search tags for given template identifiers.
@@ -218,6 +259,50 @@ class LogData:
         ) + datetime.timedelta(days=1)
         return top_dt, end_dt
 
+    def count_by(self, keys=("ltid",), bin=None, as_array=False, **kwargs):
+        """Count log messages for every combination of given keys.
+        The aggregation is processed in DB with GROUP BY.
+
+        Args:
+            keys (Sequence[str]): Subset of [ltid, ltgid, host, dt].
+            bin (Union[str, int, datetime.timedelta]): Size of time bins
+                for key dt, e.g., "1h", "10m", or seconds.
+            as_array (bool): If True, return numpy arrays.
+
+        Keyword Args:
+            Conditions same as iter_lines (e.g., dts, dte, host).
+
+        Returns:
+            dict: If as_array is False, key = tuple of values corresponding
+                to keys, val = number of messages.
+                If as_array is True, key = each of keys and "count",
+                val = numpy array of the values.
+        """
+        if bin is None:
+            bin_seconds = None
+        elif isinstance(bin, datetime.timedelta):
+            bin_seconds = int(bin.total_seconds())
+        elif isinstance(bin, str):
+            from . import config
+            bin_seconds = int(config.str2dur(bin).total_seconds())
+        else:
+            bin_seconds = int(bin)
+
+        d_cnt = self.db.count_by(keys, kwargs, bin_seconds=bin_seconds)
+        if not as_array:
+            return d_cnt
+
+        import numpy as np
+        items = sorted(d_cnt.items())
+        ret = {}
+        for idx, key in enumerate(keys):
+            if key in ("ltid", "ltgid"):
+                ret[key] = np.array([k[idx] for k, _ in items], dtype=int)
+            else:
+                ret[key] = np.array([k[idx] for k, _ in items], dtype=object)
+        ret["count"] = np.array([v for _, v in items], dtype=int)
+        return ret
+
     def whole_host_lt(self, dts=None, dte=None):
         """List[str, str]: Sequence of all combinations of
         hostname and ltids in DB."""
@@ -314,6 +399,17 @@ class LogData:
             buf.append(self.show_lt_info(ltobj.ltid))
         return "\n".join(buf)
 
+    def archive_lines(self, dte):
+        """Move log messages before dte into compressed archive files.
+
+        Args:
+            dte (datetime.datetime): Messages before 'dte' will be archived.
+
+        Returns:
+            int: Number of archived messages.
+        """
+        return self.db.archive_lines(dte)
+
     def commit_db(self):
         """Commit requested changes in LogDB.
         """
@@ -335,17 +431,44 @@ class LogDB:
     tablename_lt = "lt"
     tablename_ltg = "ltg"
     tablename_tag = "tag"
-    table_names = (tablename_log, tablename_lt, tablename_ltg, tablename_tag)
+    tablename_archive = "archive"
+    tablename_repeat = "log_repeat"
+    table_names = (tablename_log, tablename_lt, tablename_ltg, tablename_tag,
+                   tablename_archive, tablename_repeat)
     indexnames_log = ["log_index_lid", "log_index_ltid", "log_index_dt", "log_index_host"]
     indexnames_ltg = ["ltg_index"]
     indexnames_tag = ["tag_index"]
     index_names = indexnames_log + indexnames_ltg + indexnames_tag
     _tablename_tmp_footer = "_tmp"
+    table_columns = {
+        tablename_log: ("lid", "ltid", "dt", "host", "words"),
+        tablename_lt: ("ltid", "ltw", "lts", "count"),
+        tablename_ltg: ("ltid", "ltgid"),
+        tablename_tag: ("ltid", "tag"),
+        tablename_archive: ("ltid", "dts", "dte", "lid_min", "lid_max",
+                            "count", "filename",
+                            "block_offset", "block_length"),
+        tablename_repeat: ("lid", "count", "dt_last"),
+    }
+    _datetime_columns = ("dt", "dts", "dte", "dt_last")
 
     def __init__(self, conf, edit, reset_db):
         self._line_cnt = 0
         self._splitter = conf.get("database", "split_symbol")
         self._table_switch = {}
+        self._archive_dir = conf.get("database", "archive_dir")
+        self._archive_compression = conf.get("database", "archive_compression")
+        self._archive = None
+        # archive table is created with the first archive_lines call
+        self._use_archive = False
+
+        self._collapse_repeat = conf.getboolean("database", "collapse_repeat")
+        self._collapse_window = datetime.timedelta(
+            seconds=conf.getint("database", "collapse_window"))
+        self._last_line = {}
+        self._repeat_buf = {}
+        # repeat table is created with the first collapsed message
+        self._use_repeat = False
 
         db_type = conf.get("database", "database")
         if db_type == "sqlite3":
@@ -359,11 +482,19 @@ class LogDB:
                 db_type))
 
         if self._db.db_exists():
+            current_table_names = self._db.get_table_names()
+            self._use_archive = (self.tablename_archive
+                                 in current_table_names)
+            self._use_repeat = (self.tablename_repeat
+                                in current_table_names)
             if edit:
                 if reset_db:
                     # create mode
                     _logger.info("DB reset")
+                    self._clear_archive()
                     self._db.reset()
+                    self._use_archive = False
+                    self._use_repeat = False
                     self._init_tables()
                 else:
                     # append mode
@@ -429,6 +560,28 @@ class LogDB:
         sql = self._db.create_table_sql(table_name, l_key)
         self._db.execute(sql)
 
+    def _init_table_archive(self):
+        table_name = self.tablename_archive
+        l_key = [db_common.TableKey("ltid", "integer", tuple()),
+                 db_common.TableKey("dts", "datetime", tuple()),
+                 db_common.TableKey("dte", "datetime", tuple()),
+                 db_common.TableKey("lid_min", "integer", tuple()),
+                 db_common.TableKey("lid_max", "integer", tuple()),
+                 db_common.TableKey("count", "integer", tuple()),
+                 db_common.TableKey("filename", "text", tuple()),
+                 db_common.TableKey("block_offset", "integer", tuple()),
+                 db_common.TableKey("block_length", "integer", tuple())]
+        sql = self._db.create_table_sql(table_name, l_key)
+        self._db.execute(sql)
+
+    def _init_table_repeat(self):
+        table_name = self.tablename_repeat
+        l_key = [db_common.TableKey("lid", "integer", ("primary_key",)),
+                 db_common.TableKey("count", "integer", tuple()),
+                 db_common.TableKey("dt_last", "datetime", tuple())]
+        sql = self._db.create_table_sql(table_name, l_key)
+        self._db.execute(sql)
+
     def _init_index(self):
         self._init_index_log()
         self._init_index_ltg()
@@ -515,6 +668,9 @@ class LogDB:
                     print("no tag table, init table")
                     self._init_table_tag()
                     print("NOTE: try \"db-tag\" if you need afterward")
+                elif name in (self.tablename_archive, self.tablename_repeat):
+                    # optional, created only if used
+                    pass
 
         current_table_names = self._db.get_table_names()
 
@@ -541,6 +697,59 @@ class LogDB:
         current_table_names = self._db.get_table_names()
         print("now the db has {0}".format(current_table_names))
 
+    def existing_tables(self):
+        """List[str]: Names of tables in table_names that exist in DB."""
+        current_table_names = self._db.get_table_names()
+        return [name for name in self.table_names
+                if name in current_table_names]
+
+    def iter_table_rows(self, table_name):
+        """Yield all rows of a table as tuples of table_columns.
+        Datetime values are given as strings independent of DBMS."""
+        l_key = self.table_columns[table_name]
+        l_dtidx = [idx for idx, key in enumerate(l_key)
+                   if key in self._datetime_columns]
+        sql = self._db.select_sql(table_name, l_key)
+        for row in self._db.execute(sql):
+            if len(l_dtidx) == 0:
+                yield tuple(row)
+            else:
+                row = list(row)
+                for idx in l_dtidx:
+                    if row[idx] is not None:
+                        row[idx] = self._db.strftime(row[idx])
+                yield tuple(row)
+
+    def add_table_rows(self, table_name, rows):
+        """Insert rows given in the format of iter_table_rows."""
+        l_key = self.table_columns[table_name]
+        l_ss = [db_common.StateSet(key, key) for key in l_key]
+        sql = self._db.insert_sql(table_name, l_ss)
+        self._db.executemany(sql, [dict(zip(l_key, row)) for row in rows])
+
+    def init_optional_table(self, table_name):
+        """Create a table that is not created in initialization."""
+        if table_name == self.tablename_archive:
+            self._init_table_archive()
+            self._use_archive = True
+        elif table_name == self.tablename_repeat:
+            self._init_table_repeat()
+            self._use_repeat = True
+        else:
+            raise ValueError("invalid table name {0}".format(table_name))
+
+    def drop_index(self):
+        """Remove all indexes, e.g., before bulk insertion.
+        Use init_index to restore them."""
+        d_index = self._db.get_indexes()
+        for name in self.index_names:
+            if name in d_index:
+                sql = self._db.drop_index_sql(name, d_index[name])
+                self._db.execute(sql)
+
+    def init_index(self):
+        self._init_index()
+
     def switch_temporal_table(self, table_name):
         """Switch valid table to temporal one.
         Used for large data update."""
@@ -605,6 +814,7 @@ class LogDB:
             return table_name
 
     def commit(self):
+        self._flush_repeat()
         self._db.commit()
 
     def _parse_input(self, **kwargs):
@@ -629,6 +839,9 @@ class LogDB:
             d_line["l_w"] = []
         else:
             d_line["l_w"] = strutil.split_igesc(row[4], self._splitter)
+        if len(row) > 5 and row[5] is not None:
+            d_line["repeat"] = int(row[5])
+            d_line["dt_last"] = self._str2datetime(row[6])
         return d_line
 
     def _str2datetime(self, dtstr):
@@ -636,16 +849,35 @@ class LogDB:
         dt = dt.replace(tzinfo=tzlocal())
         return dt
 
+    @property
+    def last_lid(self):
+        """int: The largest lid given to the messages in edit mode."""
+        return self._line_cnt
+
     # def add_line(self, ltid, dt, host, l_w, lid=None):
-    def add_line(self, **kwargs):
+    def add_line(self, replay=False, **kwargs):
+        """Add a log message.
+
+        Args:
+            replay (bool, optional): True if the message is given again
+                with the lid assigned before (i.e., replaying a journal).
+                In collapse_repeat mode, a replayed message with a lid
+                already stored is counted as a repeat of the lid.
+        """
         assert "ltid" in kwargs
         assert "dt" in kwargs
         assert "host" in kwargs
         assert "l_w" in kwargs
-        d_val = self._parse_input(**kwargs)
+        if self._collapse_repeat:
+            lid = self._collapse_line(replay, **kwargs)
+            if lid is not None:
+                return lid
 
-        self._line_cnt += 1
-        if "lid" not in kwargs:
+        d_val = self._parse_input(**kwargs)
+        if "lid" in kwargs:
+            self._line_cnt = max(self._line_cnt, kwargs["lid"])
+        else:
+            self._line_cnt += 1
             d_val["lid"] = self._line_cnt
 
         table_name = self._valid_table_name(self.tablename_log)
@@ -653,20 +885,85 @@ class LogDB:
         sql = self._db.insert_sql(table_name, l_ss)
         self._db.execute(sql, d_val)
 
+        if self._collapse_repeat:
+            self._last_line[kwargs["host"]] = (d_val["lid"], kwargs["ltid"],
+                                               list(kwargs["l_w"]),
+                                               kwargs["dt"])
         return d_val["lid"]
 
+    def _collapse_line(self, replay, **kwargs):
+        """Count a message as a repeat of the last stored message
+        of the same host if they are identical (same ltid and words)
+        and their timestamps are within collapse_window.
+        A replayed message is counted as a repeat of its lid
+        if the lid is already stored.
+
+        Returns:
+            int: lid of the stored message, or None if not collapsed.
+        """
+        host = kwargs["host"]
+        dt = kwargs["dt"]
+        if replay and "lid" in kwargs:
+            if kwargs["lid"] > self._line_cnt:
+                return None
+            # a collapsed message given again
+            lid = kwargs["lid"]
+        else:
+            if host not in self._last_line:
+                return None
+            lid, ltid, l_w, dt_last = self._last_line[host]
+            if ltid != kwargs["ltid"] or l_w != kwargs["l_w"]:
+                return None
+            if abs(dt - dt_last) > self._collapse_window:
+                return None
+
+        if lid not in self._repeat_buf:
+            self._repeat_buf[lid] = self._get_repeat(lid, dt)
+        count, dt_last = self._repeat_buf[lid]
+        self._repeat_buf[lid] = (count + 1, max(dt_last, dt))
+        if host in self._last_line and self._last_line[host][0] == lid:
+            self._last_line[host] = self._last_line[host][:3] + (dt,)
+        return lid
+
+    def _get_repeat(self, lid, dt):
+        # current repeat status of a stored message
+        if self._use_repeat:
+            l_key = ["count", "dt_last"]
+            l_cond = [db_common.Condition("lid", "=", "lid", True)]
+            sql = self._db.select_sql(self.tablename_repeat, l_key, l_cond)
+            for row in self._db.execute(sql, {"lid": lid}):
+                return int(row[0]), self._db.datetime(row[1])
+        return 1, dt
+
+    def _flush_repeat(self):
+        if len(self._repeat_buf) == 0:
+            return
+        if not self._use_repeat:
+            self._init_table_repeat()
+            self._use_repeat = True
+
+        l_cond = [db_common.Condition("lid", "=", "lid", True)]
+        sql = self._db.delete_sql(self.tablename_repeat, l_cond)
+        self._db.executemany(sql, [{"lid": lid} for lid in self._repeat_buf])
+        l_ss = [db_common.StateSet("lid", "lid"),
+                db_common.StateSet("count", "count"),
+                db_common.StateSet("dt_last", "dt_last")]
+        sql = self._db.insert_sql(self.tablename_repeat, l_ss)
+        self._db.executemany(sql, [{"lid": lid, "count": count,
+                                    "dt_last": self._db.strftime(dt_last)}
+                                   for lid, (count, dt_last)
+                                   in self._repeat_buf.items()])
+        self._repeat_buf = {}
+
     def iter_all(self):
+        # archived messages are merged with log table in the order of lid,
+        # because messages can be given in the order different from dt
+        archived = (self._parse_archived_row(row)
+                    for row in self._iter_archive_lid_order())
         l_order = [("lid", "asc")]
-        for row in self._select_log({}, l_order=l_order):
-            d_line = {"lid": int(row[0]),
-                      "ltid": int(row[1]),
-                      "dt": self._str2datetime(row[2]),
-                      "host": row[3]}
-            if row[4] == "":
-                d_line["l_w"] = []
-            else:
-                d_line["l_w"] = strutil.split_igesc(row[4], self._splitter)
-            yield d_line
+        stored = (self._parse_row(row)
+                  for row in self._select_log({}, l_order=l_order))
+        yield from heapq.merge(archived, stored, key=lambda d: d["lid"])
 
     def iter_lines(self, conditions, limit=None):
         d_cond = {k: v for k, v in conditions.items()
@@ -680,6 +977,14 @@ class LogDB:
         if "end_dt" in d_cond and "dte" not in d_cond:
             d_cond["dte"] = d_cond.pop("end_dt")
 
+        cnt = 0
+        for row in self._iter_archive(d_cond):
+            if limit is not None and cnt >= limit:
+                return
+            cnt += 1
+            yield self._parse_archived_row(row)
+        if limit is not None:
+            limit = limit - cnt
         for row in self._select_log(d_cond, limit=limit):
             yield self._parse_row(row)
 
@@ -695,48 +1000,354 @@ class LogDB:
         if "end_dt" in d_cond and "dte" not in d_cond:
             d_cond["dte"] = d_cond.pop("end_dt")
 
+        for row in self._iter_archive(d_cond):
+            yield self._parse_archived_row(row)["l_w"]
         for row in self._select_log(d_cond):
             if row[4] == "":
                 yield []
             else:
                 yield strutil.split_igesc(row[4], self._splitter)
 
+    def _get_archive(self):
+        if self._archive is None:
+            from . import log_archive
+            self._archive = log_archive.LogArchive(
+                self._archive_dir, self._archive_compression
+            )
+        return self._archive
+
+    def _clear_archive(self):
+        # remove block files listed in the archive table reset with DB
+        if not self._use_archive:
+            return
+        sql = self._db.select_sql(self.tablename_archive, ["filename"],
+                                  opt=["distinct"])
+        l_filename = [row[0] for row in self._db.execute(sql)]
+        self._get_archive().remove_files(l_filename)
+
+    def _parse_archived_row(self, row):
+        # dt in archived rows is always a string
+        dt = self._db.strptime(row[2]).replace(tzinfo=tzlocal())
+        d_line = {"lid": row[0],
+                  "ltid": row[1],
+                  "dt": dt,
+                  "host": row[3]}
+        if row[4] == "":
+            d_line["l_w"] = []
+        else:
+            d_line["l_w"] = strutil.split_igesc(row[4], self._splitter)
+        if len(row) > 5 and row[5] is not None:
+            d_line["repeat"] = int(row[5])
+            d_line["dt_last"] = self._str2datetime(row[6])
+        return d_line
+
+    def archive_lines(self, dte):
+        """Move log messages before dte from log table into
+        compressed archive blocks. The blocks are separated by days and ltids,
+        and recorded in archive table as an index.
+
+        Archived messages are still available with iter_all, iter_lines,
+        iter_words, get_line, count_lines and dt_term,
+        but not with the other functions (e.g., whole_host).
+
+        Returns:
+            int: Number of archived messages.
+        """
+        from . import log_archive
+        archive = self._get_archive()
+        if not self._use_archive:
+            self._init_table_archive()
+            self._use_archive = True
+
+        l_index = []
+        d_block = defaultdict(list)
+        current_day = None
+
+        def _flush_blocks():
+            for ltid, rows in d_block.items():
+                filename = (current_day.replace("-", "")
+                            + log_archive.BLOCK_SUFFIX)
+                offset, length = archive.write_block(filename, rows)
+                l_index.append({"ltid": ltid,
+                                "dts": rows[0][2],
+                                "dte": rows[-1][2],
+                                "lid_min": min(row[0] for row in rows),
+                                "lid_max": max(row[0] for row in rows),
+                                "count": len(rows),
+                                "filename": filename,
+                                "block_offset": offset,
+                                "block_length": length})
+            d_block.clear()
+
+        cnt = 0
+        l_order = [("dt", "asc"), ("lid", "asc")]
+        for row in self._select_log({"dte": dte}, l_order=l_order):
+            dtstr = self._db.strftime(row[2])
+            day = dtstr[:10]
+            if day != current_day:
+                _flush_blocks()
+                current_day = day
+            d_block[int(row[1])].append((int(row[0]), int(row[1]), dtstr,
+                                         row[3], row[4]))
+            cnt += 1
+        _flush_blocks()
+
+        if len(l_index) > 0:
+            l_ss = [db_common.StateSet(k, k) for k in l_index[0].keys()]
+            sql = self._db.insert_sql(self.tablename_archive, l_ss)
+            self._db.executemany(sql, l_index)
+            l_cond = [db_common.Condition("dt", "<", "dte", True)]
+            sql = self._db.delete_sql(self.tablename_log, l_cond)
+            self._db.execute(sql, {"dte": self._db.strftime(dte)})
+        self._db.commit()
+        return cnt
+
+    def _iter_archive(self, d_cond):
+        """Yield archived message rows of (lid, ltid, dt, host, words)
+        that satisfy given conditions. dt is given as a string."""
+        for _, rows in self._iter_archive_blocks(d_cond):
+            yield from rows
+
+    def _iter_archive_lid_order(self):
+        # blocks are read in the order of lid_min, and the rows with lids
+        # smaller than lid_min of the next block are ready to yield
+        heap = []
+        for lid_min, rows in self._iter_archive_blocks({}):
+            while len(heap) > 0 and heap[0][0] < lid_min:
+                yield heapq.heappop(heap)
+            for row in rows:
+                heapq.heappush(heap, row)
+        while len(heap) > 0:
+            yield heapq.heappop(heap)
+
+    def _iter_archive_blocks(self, d_cond):
+        # yield lid_min and the matched rows of blocks in the order of lid_min
+        if not self._use_archive:
+            return
+
+        args = {}
+        l_cond = []
+        for c in d_cond.keys():
+            if c == "ltid":
+                l_cond.append(db_common.Condition("ltid", "=", c, True))
+                args[c] = d_cond[c]
+            elif c == "ltgid":
+                sql = self._db.select_sql("ltg", ["ltid"],
+                                          [db_common.Condition(c, "=", c, True)])
+                l_cond.append(db_common.Condition("ltid", "in", sql, False))
+                args[c] = d_cond[c]
+            elif c == "dts":
+                l_cond.append(db_common.Condition("dte", ">=", c, True))
+                args[c] = self._db.strftime(d_cond[c])
+            elif c == "dte":
+                l_cond.append(db_common.Condition("dts", "<", c, True))
+                args[c] = self._db.strftime(d_cond[c])
+            elif c == "lid":
+                l_cond.append(db_common.Condition("lid_min", "<=", c, True))
+                l_cond.append(db_common.Condition("lid_max", ">=", c, True))
+                args[c] = d_cond[c]
+        l_key = ["lid_min", "filename", "block_offset", "block_length"]
+        l_order = [("lid_min", "asc")]
+        sql = self._db.select_sql(self.tablename_archive, l_key,
+                                  l_cond, l_order)
+        l_block = list(self._db.execute(sql, args))
+        if len(l_block) == 0:
+            return
+
+        archive = self._get_archive()
+        match = self._archive_row_matcher(d_cond)
+        for lid_min, filename, offset, length in l_block:
+            rows = [row for row in archive.read_block(filename, offset, length)
+                    if match(row)]
+            if self._use_repeat and len(rows) > 0:
+                d_repeat = self._select_repeat(min(row[0] for row in rows),
+                                               max(row[0] for row in rows))
+                rows = [row + d_repeat.get(row[0], (None, None))
+                        for row in rows]
+            yield int(lid_min), rows
+
+    def _select_repeat(self, lid_min, lid_max):
+        l_key = ["lid", "count", "dt_last"]
+        l_cond = [db_common.Condition("lid", ">=", "lid_min", True),
+                  db_common.Condition("lid", "<=", "lid_max", True)]
+        sql = self._db.select_sql(self.tablename_repeat, l_key, l_cond)
+        args = {"lid_min": lid_min, "lid_max": lid_max}
+        return {int(row[0]): (row[1], row[2])
+                for row in self._db.execute(sql, args)}
+
+    def _archive_row_matcher(self, d_cond):
+        # the same conditions as _select_log, evaluated on archived rows
+        l_func = []
+        for c, v in d_cond.items():
+            if c == "lid":
+                l_func.append(lambda row, v=v: row[0] == v)
+            elif c == "ltid":
+                l_func.append(lambda row, v=v: row[1] == v)
+            elif c == "dts":
+                v = self._db.strftime(v)
+                l_func.append(lambda row, v=v: row[2] >= v)
+            elif c == "dte":
+                v = self._db.strftime(v)
+                l_func.append(lambda row, v=v: row[2] < v)
+            elif c == "host":
+                l_func.append(lambda row, v=v: row[3] == v)
+            elif c == "host_like":
+                pattern = "".join(".*" if char == "%" else
+                                  "." if char == "_" else re.escape(char)
+                                  for char in v)
+                reobj = re.compile("^" + pattern + "$", re.IGNORECASE)
+                l_func.append(lambda row, r=reobj: r.match(row[3]) is not None)
+            elif c == "host_regexp":
+                reobj = re.compile(v)
+                l_func.append(lambda row, r=reobj: r.search(row[3]) is not None)
+            elif c == "ltgid":
+                # already filtered with archive index
+                pass
+            else:
+                raise KeyError(c)
+        return lambda row: all(func(row) for func in l_func)
+
     def _select_log(self, d_cond, l_order=None, limit=None):
         # if len(d_cond) == 0:
         #     raise ValueError("called select with empty condition")
-        args = d_cond.copy()
-
         table_name = self.tablename_log
         l_key = ["lid", "ltid", "dt", "host", "words"]
+        prefix = ""
+        if self._use_repeat:
+            # add repeat count and last timestamp of collapsed messages
+            table_name = self._db.join_sql("left outer",
+                                           self.tablename_log,
+                                           self.tablename_repeat,
+                                           "lid", "lid")
+            prefix = self.tablename_log + "."
+            l_key = [prefix + key for key in l_key]
+            l_key += [self.tablename_repeat + ".count",
+                      self.tablename_repeat + ".dt_last"]
+            if l_order is not None:
+                l_order = [(prefix + col, order) for col, order in l_order]
+        l_cond, args = self._log_conditions(d_cond, prefix)
+        sql = self._db.select_sql(table_name, l_key, l_cond, l_order,
+                                  limit=limit)
+        return self._db.execute(sql, args)
+
+    def _log_conditions(self, d_cond, prefix=""):
+        # prefix: table name with "." to avoid ambiguous columns in joins
+        args = d_cond.copy()
         l_cond = []
         for c in d_cond.keys():
             if c == "ltgid":
                 sql = self._db.select_sql("ltg", ["ltid"],
                                           [db_common.Condition(c, "=", c, True)])
-                l_cond.append(db_common.Condition("ltid", "in", sql, False))
+                l_cond.append(db_common.Condition(prefix + "ltid", "in",
+                                                  sql, False))
             elif c == "dts":
-                l_cond.append(db_common.Condition("dt", ">=", c, True))
+                l_cond.append(db_common.Condition(prefix + "dt", ">=",
+                                                  c, True))
                 args[c] = self._db.strftime(d_cond[c])
             elif c == "dte":
-                l_cond.append(db_common.Condition("dt", "<", c, True))
+                l_cond.append(db_common.Condition(prefix + "dt", "<",
+                                                  c, True))
                 args[c] = self._db.strftime(d_cond[c])
             elif c == "host_like":
-                l_cond.append(db_common.Condition("host", "like", c, True))
+                l_cond.append(db_common.Condition(prefix + "host", "like",
+                                                  c, True))
             elif c == "host_regexp":
-                l_cond.append(db_common.Condition("host", "regexp", c, True))
+                l_cond.append(db_common.Condition(prefix + "host", "regexp",
+                                                  c, True))
             else:
-                l_cond.append(db_common.Condition(c, "=", c, True))
-        sql = self._db.select_sql(table_name, l_key, l_cond, l_order, limit)
-        return self._db.execute(sql, args)
+                l_cond.append(db_common.Condition(prefix + c, "=", c, True))
+        return l_cond, args
 
-    def get_line(self, lid):
+    def count_by(self, keys, conditions, bin_seconds=None):
+        """Count log messages grouped by given keys with SQL GROUP BY.
+
+        Args:
+            keys (Sequence[str]): Subset of [ltid, ltgid, host, dt].
+            conditions (dict): Same as iter_lines.
+            bin_seconds (int): Size of time bins for key dt.
+
+        Returns:
+            dict: key = tuple of values corresponding to keys,
+                val = number of messages.
+                Values of dt are the head of time bins.
+        """
+        d_cond = {k: v for k, v in conditions.items() if v is not None}
+        if "dt" in keys and bin_seconds is None:
+            raise ValueError("bin_seconds is required for key dt")
+
+        prefix = self.tablename_log + "."
         table_name = self.tablename_log
-        l_key = ["lid", "ltid", "dt", "host", "words"]
-        l_cond = [db_common.Condition("lid", "=", "lid", True)]
-        sql = self._db.select_sql(table_name, l_key, l_cond)
-        args = {"lid": lid}
+        if "ltgid" in keys:
+            table_name += " left outer join {0} on {1}ltid = {0}.ltid".format(
+                self.tablename_ltg, prefix)
+        if self._use_repeat:
+            table_name += " left outer join {0} on {1}lid = {0}.lid".format(
+                self.tablename_repeat, prefix)
+            count_expr = "sum(coalesce({0}.count, 1))".format(
+                self.tablename_repeat)
+        else:
+            count_expr = "count(*)"
+
+        l_group = []
+        for key in keys:
+            if key in ("ltid", "host"):
+                l_group.append(prefix + key)
+            elif key == "ltgid":
+                # templates without group definition are regarded as groups
+                l_group.append("coalesce({0}.ltgid, {1}ltid)".format(
+                    self.tablename_ltg, prefix))
+            elif key == "dt":
+                l_group.append(self._db.datetime_bin_sql(prefix + "dt",
+                                                         bin_seconds))
+            else:
+                raise KeyError(key)
+
+        l_cond, args = self._log_conditions(d_cond, prefix)
+        sql = self._db.select_sql(table_name, l_group + [count_expr], l_cond,
+                                  l_group=l_group)
+        d_cnt = defaultdict(int)
+        for row in self._db.execute(sql, args):
+            key = []
+            for k, val in zip(keys, row):
+                if k == "dt":
+                    key.append(self._str2datetime(val))
+                elif k == "host":
+                    key.append(val)
+                else:
+                    key.append(int(val))
+            d_cnt[tuple(key)] += int(row[-1])
+
+        if self._use_archive:
+            # archived messages are counted without SQL
+            d_ltgid = dict(self.iter_ltg_def())
+            epoch = datetime.datetime(1970, 1, 1)
+            for row in self._iter_archive(d_cond):
+                key = []
+                for k in keys:
+                    if k == "ltid":
+                        key.append(row[1])
+                    elif k == "ltgid":
+                        key.append(d_ltgid.get(row[1], row[1]))
+                    elif k == "host":
+                        key.append(row[3])
+                    elif k == "dt":
+                        dt = self._db.strptime(row[2])
+                        sec = int((dt - epoch).total_seconds())
+                        dt = epoch + datetime.timedelta(
+                            seconds=sec // bin_seconds * bin_seconds)
+                        key.append(dt.replace(tzinfo=tzlocal()))
+                if len(row) > 5 and row[5] is not None:
+                    d_cnt[tuple(key)] += int(row[5])
+                else:
+                    d_cnt[tuple(key)] += 1
+        return dict(d_cnt)
 
-        ret = [self._parse_row(row) for row in self._db.execute(sql, args)]
+    def get_line(self, lid):
+        args = {"lid": lid}
+        ret = [self._parse_row(row) for row in self._select_log(args)]
+        if len(ret) == 0:
+            ret = [self._parse_archived_row(row)
+                   for row in self._iter_archive(args)]
         assert len(ret) > 0, "lid {0} not found".format(lid)
         assert len(ret) == 1, "lid {0} duplicated".format(lid)
         return ret[0]
@@ -778,6 +1389,13 @@ class LogDB:
         sql = self._db.select_sql(table_name, l_key)
         cursor = self._db.execute(sql)
         tmp = cursor.fetchone()[0]
+        if self._use_archive:
+            sql = self._db.select_sql(self.tablename_archive, ["max(lid_max)"])
+            tmp_archive = self._db.execute(sql).fetchone()[0]
+            if tmp is None:
+                tmp = tmp_archive
+            elif tmp_archive is not None:
+                tmp = max(int(tmp), int(tmp_archive))
         if tmp is None:
             return 0
         else:
@@ -789,6 +1407,16 @@ class LogDB:
         sql = self._db.select_sql(table_name, l_key)
         cursor = self._db.execute(sql)
         top_dtstr, end_dtstr = cursor.fetchone()
+        if self._use_archive:
+            sql = self._db.select_sql(self.tablename_archive,
+                                      ["min(dts)", "max(dte)"])
+            top_archive, end_archive = self._db.execute(sql).fetchone()
+            if top_archive is not None:
+                if top_dtstr is None:
+                    top_dtstr, end_dtstr = top_archive, end_archive
+                else:
+                    # archived messages are older than the others
+                    top_dtstr = top_archive
         if None in (top_dtstr, end_dtstr):
             raise ValueError("No data found in DB")
         return self._str2datetime(top_dtstr), self._str2datetime(end_dtstr)
@@ -1030,6 +1658,59 @@ class LogDB:
         self._db.reset()
 
 
+class CountingDB:
+    """Replacement of LogDB for dry runs (e.g., db-make --dry-run).
+
+    Nothing is stored, and the requested writes are counted
+    to measure the throughput of log template generation.
+
+    Attributes:
+        counts (collections.Counter): Number of requested writes
+            (lines, lt_added, lt_updated, lt_removed, commits).
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self._start = time.time()
+
+    def add_line(self, **kwargs):
+        self.counts["lines"] += 1
+        return self.counts["lines"]
+
+    def add_lt(self, ltline):
+        self.counts["lt_added"] += 1
+
+    def add_ltg(self, ltid, ltgid):
+        pass
+
+    def update_lt(self, ltid, ltw, lts, count=None):
+        self.counts["lt_updated"] += 1
+
+    def remove_lt(self, ltid):
+        self.counts["lt_removed"] += 1
+
+    def reset_ltg(self):
+        pass
+
+    def iter_ltg_def(self):
+        return iter(())
+
+    def commit(self):
+        self.counts["commits"] += 1
+
+    def report(self):
+        """str: Summary of the counts, throughput and peak memory."""
+        elapsed = time.time() - self._start
+        lines = self.counts["lines"]
+        mem_self, mem_children = common.peak_memory()
+        return ("dry run: {0} lines in {1:.1f}s ({2:.1f} lines/s), "
+                "{3} templates created ({4} updates), "
+                "peak memory {5:.1f} MB (child processes {6:.1f} MB)").format(
+            lines, elapsed, lines / elapsed if elapsed > 0 else 0.,
+            self.counts["lt_added"], self.counts["lt_updated"],
+            mem_self / 2 ** 20, mem_children / 2 ** 20)
+
+
 class RestoreOriginalData(object):
 
     def __init__(self, dirname, style="date", method="commit",
@@ -1107,17 +1788,13 @@ def info(conf):
 
 
 def info_term(conf, top_dt, end_dt):
-    cnt_line = 0
-    s_ltid = set()
-    s_gid = set()
-    s_host = set()
-
     ld = LogData(conf)
-    for line in ld.iter_lines(top_dt=top_dt, end_dt=end_dt):
-        cnt_line += 1
-        s_ltid.add(line.lt.ltid)
-        s_gid.add(line.lt.ltgid)
-        s_host.add(line.host)
+    d_cnt = ld.count_by(keys=("ltid", "ltgid", "host"),
+                        dts=top_dt, dte=end_dt)
+    cnt_line = sum(d_cnt.values())
+    s_ltid = {ltid for ltid, _, _ in d_cnt}
+    s_gid = {ltgid for _, ltgid, _ in d_cnt}
+    s_host = {host for _, _, host in d_cnt}
 
     print("[DB status] in {0} - {1}".format(top_dt, end_dt))
     print("Registered log lines : {0}".format(cnt_line))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Memo cache of log template estimation for repeated messages.
+
+Messages with exactly the same word sequence are mapped to the template
+estimated for the first one, without calling the template generator again.
+The cache entries of a template are invalidated when the template
+is updated, because the update may change the estimation
+of the other messages.
+"""
+
+import logging
+from collections import OrderedDict, defaultdict
+
+_logger = logging.getLogger(__package__)
+
+
+class MemoCache:
+    """LRU cache of word sequences to template identifiers.
+
+    Args:
+        size (int): Maximum number of cached word sequences.
+
+    Attributes:
+        hit (int): Number of cache hits.
+        miss (int): Number of cache misses.
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._cache = OrderedDict()  # key: tuple of words, val: (tid, ltid)
+        self._rindex = defaultdict(set)  # key: tid, val: set of keys
+        self.hit = 0
+        self.miss = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, key):
+        """Return (tid, ltid) for a word sequence, or None if not cached."""
+        ret = self._cache.get(key)
+        if ret is None:
+            self.miss += 1
+        else:
+            self.hit += 1
+            self._cache.move_to_end(key)
+        return ret
+
+    def put(self, key, tid, ltid):
+        if key in self._cache:
+            self._remove_rindex(key, self._cache[key][0])
+        self._cache[key] = (tid, ltid)
+        self._cache.move_to_end(key)
+        self._rindex[tid].add(key)
+        while len(self._cache) > self._size:
+            old_key, (old_tid, _) = self._cache.popitem(last=False)
+            self._remove_rindex(old_key, old_tid)
+
+    def invalidate(self, tid):
+        """Remove all entries mapped to given template."""
+        for key in self._rindex.pop(tid, ()):
+            self._cache.pop(key, None)
+
+    def clear(self):
+        self._cache.clear()
+        self._rindex.clear()
+
+    def _remove_rindex(self, key, tid):
+        s_key = self._rindex.get(tid)
+        if s_key is not None:
+            s_key.discard(key)
+            if len(s_key) == 0:
+                del self._rindex[tid]
+
+    def hit_ratio(self):
+        total = self.hit + self.miss
+        if total == 0:
+            return 0.
+        return 1. * self.hit / total
+
+    def __str__(self):
+        return "memo cache: {0} hits, {1} misses ({2:.1%}), {3} entries".format(
+            self.hit, self.miss, self.hit_ratio(), len(self))
@@ -2,6 +2,7 @@
 # coding: utf-8
 
 import re
+import hashlib
 import logging
 from collections import defaultdict
 from abc import ABC, abstractmethod
@@ -13,6 +14,7 @@ REPLACER_HEAD = "*"
 REPLACER_TAIL = "*"
 REPLACER_REGEX = re.compile(r"\*[A-Z]*?\*")  # shortest match
 ANONYMIZED_DESC = "##"
+TEMPLATE_HASH_MAX = 2 ** 63  # content-based tids fit in signed 64-bit
 
 _logger = logging.getLogger(__package__)
 
@@ -125,14 +127,24 @@ class LogTemplate:
 
 
 class TemplateTable:
-    """Temporal template table for log template generator."""
+    """Temporal template table for log template generator.
 
-    def __init__(self):
+    Args:
+        hash_tid (bool, optional): Use content-based template ids
+            (see template_hash) instead of sequential ones,
+            so that parallel workers can give ids to new templates
+            independently. Note that the id of a template
+            is not changed when the template is replaced.
+    """
+
+    def __init__(self, hash_tid=False):
+        self._hash_tid = hash_tid
         self._d_tpl = {}  # key = tid, val = template
         self._d_rtpl = {}  # key = key_template, val = tid
         self._d_ltid = {}  # key = tid, val = ltid
         self._d_cand = defaultdict(list)  # key = tid, val = List[ltid]
         self._last_modified = None  # used for LTGenJoint
+        self._s_dirty = set()  # tids changed after the last dump_delta
 
     def __str__(self):
         ret = []
@@ -166,6 +178,9 @@ class TemplateTable:
     def tids(self):
         return self._d_tpl.keys()
 
+    def has_tid(self, tid):
+        return tid in self._d_tpl
+
     @staticmethod
     def _key_template(template):
         # l_word = [strutil.add_esc(w) for w in template]
@@ -183,22 +198,71 @@ class TemplateTable:
     def get_template(self, tid):
         return self._d_tpl[tid]
 
-    def add(self, template):
-        tid = self.next_tid()
+    def _new_tid(self, template):
+        if not self._hash_tid:
+            return self.next_tid()
+        tid = template_hash(template)
+        while tid in self._d_tpl:
+            # hash collision, or the tid of another template
+            # that is replaced from this template
+            _logger.warning("template id {0} in use, "
+                            "another id is given to {1}".format(
+                                tid, template))
+            tid = (tid + 1) % TEMPLATE_HASH_MAX
+        return tid
+
+    def add(self, template, tid=None):
+        """Add a new template.
+
+        Args:
+            template (List[str]): A template.
+            tid (int, optional): The id of the template
+                given by another table (e.g., in parallel workers).
+
+        Returns:
+            int: The template id.
+        """
+        if tid is None:
+            tid = self._new_tid(template)
         self._d_tpl[tid] = template
         self._d_rtpl[self._key_template(template)] = tid
+        self._s_dirty.add(tid)
         return tid
 
+    def merge(self, template, tid):
+        """Add a template with the id given by another table
+        (e.g., in parallel workers), if not added yet.
+
+        Args:
+            template (List[str]): A template.
+            tid (int): The id of the template in the other table.
+
+        Returns:
+            int: The template id in this table. Another id is given
+            if tid is used for another template in this table.
+        """
+        if self.exists(template):
+            return self.get_tid(template)
+        elif tid in self._d_tpl:
+            return self.add(template)
+        else:
+            return self.add(template, tid)
+
     def replace(self, tid, template):
         self._last_modified = self._d_tpl[tid]
         self._d_tpl[tid] = template
         self._d_rtpl[self._key_template(template)] = tid
+        self._s_dirty.add(tid)
 
     def get_updated(self):
         return self._last_modified
 
     def add_ltid(self, tid, ltid):
         self._d_ltid[tid] = ltid
+        self._s_dirty.add(tid)
+
+    def has_ltid(self, tid):
+        return tid in self._d_ltid
 
     def get_ltid(self, tid):
         return self._d_ltid[tid]
@@ -210,12 +274,34 @@ class TemplateTable:
 #        self._d_cand[tid].append(ltid)
 
     def load(self, obj):
-        self._d_tpl, self._d_cand = obj
+        if len(obj) == 2:
+            # old format without ltids
+            self._d_tpl, self._d_cand = obj
+        else:
+            self._d_tpl, self._d_cand, self._d_ltid = obj
         for tid, tpl in self._d_tpl.items():
             self._d_rtpl[self._key_template(tpl)] = tid
+        self._s_dirty = set()
 
     def dumpobj(self):
-        return self._d_tpl, self._d_cand
+        return self._d_tpl, self._d_cand, self._d_ltid
+
+    def dump_delta(self):
+        """Return templates and ltids changed after the last call.
+        Apply them to another table with load_delta."""
+        delta = [(tid, self._d_tpl[tid], self._d_ltid.get(tid))
+                 for tid in sorted(self._s_dirty)]
+        self._s_dirty = set()
+        return delta
+
+    def load_delta(self, delta):
+        for tid, tpl, ltid in delta:
+            if tid in self._d_tpl:
+                self._d_rtpl.pop(self._key_template(self._d_tpl[tid]), None)
+            self._d_tpl[tid] = tpl
+            self._d_rtpl[self._key_template(tpl)] = tid
+            if ltid is not None:
+                self._d_ltid[tid] = ltid
 
 
 class LTGen(ABC):
@@ -232,12 +318,20 @@ class LTGen(ABC):
     def is_stateful(self):
         return True
 
+    def is_memo_safe(self):
+        """True if a message with the same words as a processed message
+        is always given the same template unless the template is updated,
+        and skipping process_line for it does not change the generator state.
+        Used to decide whether lt_cache.MemoCache is available."""
+        return not self.is_stateful()
+
     def get_tpl(self, tid):
         return self._table[tid]
 
     def add_tpl(self, ltw, tid=None):
         if tid is None:
-            tid = self._table.add(ltw)
+            # words of a compact parsed line are given as a tuple
+            tid = self._table.add(list(ltw))
         return tid
 
     def update_tpl(self, ltw, tid):
@@ -305,6 +399,20 @@ class LTGen(ABC):
     def dumpobj(self):
         raise NotImplementedError
 
+    def dump_delta(self):
+        """Return changes of the internal state after the last call
+        of dump_delta (or load), to be applied with load_delta.
+        Used for incremental checkpoints.
+
+        Returns:
+            The changes, or None if not supported
+            (then the whole dumpobj is checkpointed).
+        """
+        return None
+
+    def load_delta(self, delta):
+        raise NotImplementedError
+
 
 class LTGenOffline(LTGen, ABC):
 
@@ -349,6 +457,12 @@ class LTGenStateless(LTGen, ABC):
         # stateless
         return None
 
+    def dump_delta(self):
+        return ()
+
+    def load_delta(self, delta):
+        pass
+
 
 class LTGenSupervised(LTGen, ABC):
 
@@ -392,6 +506,9 @@ class LTGenJoint(LTGen):
     def is_stateful(self):
         return any([ltgen.is_stateful() for ltgen in self._l_ltgen])
 
+    def is_memo_safe(self):
+        return all([ltgen.is_memo_safe() for ltgen in self._l_ltgen])
+
     def _update_ltmap(self, pline, index, tid, state):
         from .lt_import import LTGenImport
         if (self._import_index is not None) and \
@@ -431,6 +548,16 @@ class LTGenJoint(LTGen):
     def dumpobj(self):
         return [ltgen.dumpobj() for ltgen in self._l_ltgen]
 
+    def dump_delta(self):
+        l_delta = [ltgen.dump_delta() for ltgen in self._l_ltgen]
+        if any(delta is None for delta in l_delta):
+            return None
+        return l_delta
+
+    def load_delta(self, delta):
+        for ltgen, ltgen_delta in zip(self._l_ltgen, delta):
+            ltgen.load_delta(ltgen_delta)
+
 
 #class LTGenMultiProcess(LTGenOffline):
 #
@@ -668,6 +795,20 @@ def merged_template(m1, m2):
     return ret
 
 
+def template_hash(template):
+    """Return a content-based template id: a 63-bit hash of the words,
+    stable over processes and runs (unlike the built-in hash).
+
+    Args:
+        template (List[str]): A template.
+
+    Returns:
+        int
+    """
+    h = hashlib.blake2b("\0".join(template).encode("utf-8"), digest_size=8)
+    return int.from_bytes(h.digest(), "big") % TEMPLATE_HASH_MAX
+
+
 def template_from_messages(l_lm):
     """Generate a log template as the common part of given instances.
 
@@ -686,3 +827,29 @@ def template_from_messages(l_lm):
         else:
             tpl.append(REPLACER)
     return tpl
+
+
+def is_flat_dump(loadobj, version):
+    """Check the format of the internal data given to LTGen.load.
+
+    Tree-based generators dump their state in a flat, versioned form
+    (a dict with "version" and arrays of node ids), which is loaded
+    much faster than the pickled object graph used before.
+
+    Args:
+        loadobj: The data dumped with LTGen.dumpobj.
+        version (int): The latest format version of the generator.
+
+    Returns:
+        bool: True if loadobj is in the flat format,
+        False if in the old format (pickled generator objects).
+
+    Raises:
+        ValueError: If the version of loadobj is not supported.
+    """
+    if not isinstance(loadobj, dict) or "version" not in loadobj:
+        return False
+    if loadobj["version"] > version:
+        raise ValueError("internal data format version {0} is not "
+                         "supported".format(loadobj["version"]))
+    return True
@@ -352,7 +352,8 @@ class LTSearchTreeNew(LTSearch):
                 # go the word or wildcard node
                 # If both exists, push wildcard to stack
                 if self.KEY_WILDCARD in current:
-                    stack_path.append((current, deque(tmp_ltwords), ret_path))
+                    stack_path.append((current, deque(tmp_ltwords),
+                                       list(ret_path)))
                 current = current[w]
             elif self.KEY_WILDCARD in current:
                 # w is not in children, but have wildcard node
@@ -364,7 +365,7 @@ class LTSearchTreeNew(LTSearch):
                     return None
                 else:
                     node, tmp_ltwords, ret_path = stack_path.pop()
-                    current = current[self.KEY_WILDCARD]
+                    current = node[self.KEY_WILDCARD]
 
             ret_path.append(current)
 
@@ -377,7 +378,7 @@ class LTSearchTreeNew(LTSearch):
                 else:
                     # no template to match, go back with stack or end
                     node, tmp_ltwords, ret_path = stack_path.pop()
-                    current = current[self.KEY_WILDCARD]
+                    current = node[self.KEY_WILDCARD]
                     ret_path.append(current)
 
     def search(self, words):
@@ -1,6 +1,8 @@
 import os
-import pickle
 import sys
+import time
+import datetime
+import contextlib
 import logging
 from typing import Optional
 from importlib import import_module
@@ -11,10 +13,16 @@ from amulog import strutil
 from amulog import lt_common
 from amulog import log_db
 from amulog import host_alias
+from amulog import fail_sink
+from amulog import metrics
+from amulog import checkpoint
+from amulog import pline_store
 
 _logger = logging.getLogger(__package__)
 
 ONLINE_COMMIT_INTERVAL = 1000
+READER_CHUNK_LINES = 10000
+READER_QUEUE_CHUNKS = 4
 _MULTIPROCESS_LOCAL_OBJECTS = dict()
 
 
@@ -28,21 +36,43 @@ class LTManager(object):
 
     # adding lt to db (ltgen do not add)
 
-    def __init__(self, conf, db, lttable, reset_db=False, parallel=False):
+    def __init__(self, conf, db, lttable, reset_db=False, parallel=False,
+                 dry_run=False):
         self._conf = conf
         self._reset_db = reset_db
+        self._dry_run = dry_run  # no outputs except DB (log_db.CountingDB)
         self._filename = conf["manager"]["indata_filename"]
-        self._fail_output = conf["manager"]["fail_output"]
+        self._checkpointer = checkpoint.Checkpointer(self._filename)
+        self._checkpoint_interval = conf.getfloat("manager",
+                                                  "checkpoint_interval")
+        self._checkpoint_compact = conf.getint("manager",
+                                               "checkpoint_compact")
+        self._last_checkpoint = time.time()
+        if dry_run:
+            # failed lines are only counted
+            self._fail = fail_sink.FailureSink(None)
+        else:
+            self._fail = fail_sink.init_fail_sink(conf)
         self._online_batchsize = conf.getint("manager", "online_batchsize")
         self._online_counter = 0
         self._offline_batchsize = conf.getint("manager", "offline_batchsize")
+        self._compact_pline = conf.getboolean("manager",
+                                              "offline_compact_pline")
         self._drop_undefhost = conf.getboolean("manager", "undefined_host")
         self._shuffle_import = conf.getboolean("log_template_import", "shuffle")
 
         self._db = db
         self._lttable = lttable
-        self._table = lt_common.TemplateTable()
+        self._table = lt_common.TemplateTable(
+            hash_tid=conf.getboolean("manager", "template_id_hash"))
         self._ltgen: Optional[lt_common.LTGen] = None
+        self._journal = None
+        self._commit_hook = None
+        self._metrics = metrics.init_metrics(conf)
+        self._memo = None
+        self._matcher = None
+        self._seeder = None
+        self._seed_pending = False
 
         self._pool = None
         if parallel:
@@ -51,6 +81,11 @@ class LTManager(object):
                 n_proc = int(tmp_n_proc)
             else:
                 n_proc = os.cpu_count()
+            tmp_inflight = conf["manager"]["offline_inflight"]
+            if tmp_inflight.isdigit():
+                self._n_inflight = int(tmp_inflight)
+            else:
+                self._n_inflight = 2 * n_proc
             ltgen_kwargs = {"conf": conf,
                             "table": None,  # individual table for child process
                             "shuffle": self._shuffle_import}
@@ -63,6 +98,19 @@ class LTManager(object):
             self._ha = host_alias.init_hostalias(self._conf)
             self._drop_undefhost = conf.getboolean("manager", "undefined_host")
             self._ltgen = init_ltgen_methods(self._conf, self._table)
+            memo_size = conf.getint("manager", "memo_cache_size")
+            if memo_size > 0:
+                if self._ltgen.is_memo_safe():
+                    from . import lt_cache
+                    self._memo = lt_cache.MemoCache(memo_size)
+                else:
+                    _logger.warning("memo cache is not available "
+                                    "for the ltgen methods, ignored")
+            if conf.getboolean("manager", "fast_matcher"):
+                from . import lt_search
+                self._matcher = lt_search.LTSearchTreeNew()
+                self._matcher_hit = 0
+                self._matcher_miss = 0
 
         self._ltgroup = init_ltgroup(self._conf, self._lttable)
         if (not self._reset_db) and (self._ltgroup is not None):
@@ -72,6 +120,17 @@ class LTManager(object):
     def template_table(self):
         return self._table
 
+    @property
+    def memo_cache(self):
+        """lt_cache.MemoCache: None if not used."""
+        return self._memo
+
+    @property
+    def fail_counts(self):
+        """collections.Counter: Number of lines failed to be stored
+        for every reason (fail_sink.FAIL_*)."""
+        return self._fail.counts
+
     @staticmethod
     def _init_pool(ltgen_kwargs):
         objects = {}
@@ -79,6 +138,13 @@ class LTManager(object):
         objects["lp"] = load_log2seq(conf)
         objects["ha"] = host_alias.init_hostalias(conf)
         objects["drop_undefhost"] = conf.getboolean("manager", "undefined_host")
+        objects["compact_pline"] = conf.getboolean("manager",
+                                                   "offline_compact_pline")
+        if conf.getboolean("manager", "template_id_hash"):
+            # tids of the templates already sent to the parent
+            objects["sent_tids"] = set()
+        else:
+            objects["sent_tids"] = None
 
         ltgen = init_ltgen_methods(**ltgen_kwargs)
         assert not ltgen.is_stateful(), \
@@ -94,81 +160,194 @@ class LTManager(object):
         ha = _MULTIPROCESS_LOCAL_OBJECTS["ha"]
         ltgen = _MULTIPROCESS_LOCAL_OBJECTS["ltgen"]
         drop_undefhost = _MULTIPROCESS_LOCAL_OBJECTS["drop_undefhost"]
-
+        compact = _MULTIPROCESS_LOCAL_OBJECTS["compact_pline"]
+        sent_tids = _MULTIPROCESS_LOCAL_OBJECTS["sent_tids"]
+
+        # [pline, tid, tpl]: with content-based tids, the template is sent
+        # only in the first time for the worker (chunks are handled
+        # by the parent in the order of dispatch, so the parent
+        # already knows the template in the later chunks)
+        # the worker is identified with pid to remap its tids
+        # [None, None, reason] for the lines failed to be parsed
         ret = []
-        for message_id, line in batch:
-            pline = parse_line(strutil.add_esc(line), lp)
-            pline = normalize_pline(pline, ha, drop_undefhost)
+        for line in batch:
+            pline, reason = parse_pline(line, lp, ha, drop_undefhost,
+                                        compact)
             if pline is None:
-                ret.append([message_id, None, None])
+                ret.append([None, None, reason])
+                continue
+            tpl = ltgen.generate_tpl(pline)
+            if sent_tids is None or tpl is None:
+                ret.append([pline, None, tpl])
             else:
-                tpl = ltgen.generate_tpl(pline)
-                ret.append([message_id, pline, tpl])
-        return ret
-
-    def _process_offline_parallel(self, iterable_lines):
-        def _sigterm_handler():
+                tid = lt_common.template_hash(tpl)
+                if tid in sent_tids:
+                    ret.append([pline, tid, None])
+                else:
+                    sent_tids.add(tid)
+                    ret.append([pline, tid, tpl])
+        return os.getpid(), ret
+
+    def _process_offline_parallel(self, iterable_lines, s_added):
+        """Dispatch contiguous chunks of lines to the pool, and store
+        the results of every chunk into DB in the input order.
+        At most offline_inflight chunks are kept on memory
+        in the workers or waiting to be stored."""
+        def _sigterm_handler(*_):
             raise KeyboardInterrupt
 
         import signal
+        import threading
         signal.signal(signal.SIGTERM, _sigterm_handler)
 
-        l_input = [(mid, line)
-                   for mid, line in enumerate(iterable_lines)]
-        iter_batch = (l_input[i::self._offline_batchsize]
-                      for i in range(self._offline_batchsize))
+        semaphore = threading.Semaphore(self._n_inflight)
+        pending = {}
+        # key = (worker, tid given by the worker), val = tid in the table,
+        # for content-based tids used by other templates in the table
+        d_remap = {}
+
+        def _iter_batch():
+            # called in the task handler thread of the pool
+            for idx, chunk in enumerate(iter_chunks(iterable_lines,
+                                                    self._offline_batchsize)):
+                semaphore.acquire()
+                pending[idx] = chunk
+                yield chunk
 
         try:
-            d_pline = {}
-            d_tid = {}
-            for ret in self._pool.imap_unordered(self._pool_task, iter_batch):
-                for mid, pline, tpl in ret:
+            for idx, (worker, ret) in enumerate(
+                    self._pool.imap(self._pool_task, _iter_batch())):
+                list_lines = pending.pop(idx)
+                d_pline = {}
+                d_tid = {}
+                d_fail = {}
+                for mid, (pline, tid, tpl) in enumerate(ret):
+                    if pline is None:
+                        d_fail[mid] = tpl
+                        continue
                     d_pline[mid] = pline
-                    if tpl is None:
+                    if tid is not None:
+                        # content-based tid given by the worker
+                        if (worker, tid) in d_remap:
+                            tid = d_remap[(worker, tid)]
+                        elif tpl is not None:
+                            new_tid = self._table.merge(tpl, tid)
+                            if new_tid != tid:
+                                d_remap[(worker, tid)] = new_tid
+                                tid = new_tid
+                    elif tpl is None:
                         continue
-                    if self._table.exists(tpl):
+                    elif self._table.exists(tpl):
                         tid = self._table.get_tid(tpl)
                     else:
                         tid = self._table.add(tpl)
                     d_tid[mid] = tid
+                self._store_offline(list_lines, d_pline, d_tid, s_added,
+                                    d_fail)
+                self.commit_db()
+                semaphore.release()
             self._pool.close()
         except KeyboardInterrupt:
+            for _ in range(self._n_inflight):
+                semaphore.release()
             self._pool.terminate()
             exit()
-        else:
-            return d_pline, d_tid
 
     def _process_offline_single(self, iterable_lines):
-        d_pline = {}
+        m = self._metrics
+        if m is not None:
+            t = m.now()
+        # d_pline: parsed lines except failed ones,
+        # spilled to a scratch file with offline_pline_memory
+        d_pline = pline_store.init_pline_store(self._conf)
+        d_fail = {}
+        n_lines = 0
         for mid, line in enumerate(iterable_lines):
-            pline = parse_line(strutil.add_esc(line), self._lp)
-            pline = normalize_pline(pline, self._ha, self._drop_undefhost)
-            d_pline[mid] = pline
+            n_lines += 1
+            pline, reason = self._parse_line(line, self._compact_pline)
+            if pline is None:
+                d_fail[mid] = reason
+            else:
+                d_pline[mid] = pline
+        if m is not None and n_lines > 0:
+            # parse includes normalize in offline processing
+            t = m.lap(metrics.STAGE_PARSE, t, n_lines)
+
+        d_tid = self._ltgen.process_offline(d_pline)
+        if m is not None and len(d_pline) > 0:
+            m.lap(metrics.STAGE_TEMPLATE, t, len(d_pline))
+        return d_pline, d_tid, d_fail
 
-        offline_input = {mid: pline for mid, pline in d_pline.items()
-                         if pline is not None}
-        d_tid = self._ltgen.process_offline(offline_input)
-        return d_pline, d_tid
+    def process_offline(self, iterable_lines):
+        """Generate log templates for all given lines together,
+        and store them into DB.
 
-    def process_offline(self, list_lines):
+        With stateless ltgen methods, the lines are processed
+        in chunks of offline_batchsize lines and stored into DB one by one,
+        so that the memory usage does not depend on the input size.
+        The other methods need all lines at once.
+
+        Args:
+            iterable_lines (Iterable[str]): Log message lines.
+        """
+        # tids already added as ltids, including the templates
+        # in the internal data loaded to append to the existing DB
+        s_added = {tid for tid in self._table.tids()
+                   if self._table.has_ltid(tid)}
         if self._pool is None:
-            d_pline, d_tid = self._process_offline_single(list_lines)
+            if self._ltgen.is_stateful():
+                list_lines = list(iterable_lines)
+                d_pline, d_tid, d_fail = self._process_offline_single(
+                    list_lines)
+                self._store_offline(list_lines, d_pline, d_tid, s_added,
+                                    d_fail)
+            else:
+                for list_lines in iter_chunks(iterable_lines,
+                                              self._offline_batchsize):
+                    d_pline, d_tid, d_fail = self._process_offline_single(
+                        list_lines)
+                    self._store_offline(list_lines, d_pline, d_tid, s_added,
+                                        d_fail)
+                    self.commit_db()
         else:
             if (not self._reset_db) and self._ltgen.is_stateful():
                 msg = ("offline additional change is limited "
                        "to stateless ltgen methods")
                 raise ValueError(msg)
-            d_pline, d_tid = self._process_offline_parallel(list_lines)
+            self._process_offline_parallel(iterable_lines, s_added)
 
-        s_added = set()
-        for mid, pline in d_pline.items():
-            if pline is None or mid not in d_tid:
-                self.fail_dump(list_lines[mid])
+        self.commit_db()
+        self.dump()
+        if self._metrics is not None:
+            self._metrics.report()
+
+    def _store_offline(self, list_lines, d_pline, d_tid, s_added,
+                       d_fail=None):
+        # s_added: tids already added as ltids, shared in a process_offline
+        # d_fail: reasons of the lines failed to be parsed, if known
+        m = self._metrics
+        if m is not None:
+            t = m.now()
+        self._store_offline_lines(list_lines, d_pline, d_tid, s_added, d_fail)
+        if m is not None and len(list_lines) > 0:
+            m.lap(metrics.STAGE_DB, t, len(list_lines))
+            m.end_line(len(self._lttable), len(list_lines))
+
+    def _store_offline_lines(self, list_lines, d_pline, d_tid, s_added,
+                             d_fail):
+        # lines failed to be parsed are None or not given in d_pline
+        for mid, line in enumerate(list_lines):
+            pline = d_pline.get(mid)
+            if pline is None:
+                reason = fail_sink.FAIL_PARSE
+                if d_fail is not None:
+                    reason = d_fail.get(mid, reason)
+                self.fail_dump(line, reason)
                 continue
 
-            tid = d_tid[mid]
+            tid = d_tid.get(mid)
             if tid is None:
-                self.fail_dump(list_lines[mid])
+                self.fail_dump(line, fail_sink.FAIL_NO_TPL)
                 continue
             elif tid in s_added:
                 ltid = self._table.get_ltid(tid)
@@ -176,40 +355,186 @@ class LTManager(object):
                 ltline = self._lttable[ltid]
             else:
                 tpl = self._table.get_template(tid)
-                ltline = self.add_lt(tpl, pline[log2seq.KEY_SYMBOLS])
+                ltline = self.add_lt(tpl, list(pline[log2seq.KEY_SYMBOLS]))
                 self._table.add_ltid(tid, ltline.ltid)
                 s_added.add(tid)
             self.add_line(pline, ltline)
 
-        self.commit_db()
-        self.dump()
-
     def get_parsed_line(self, line):
+        return self._parse_line(line)[0]
+
+    def _parse_line(self, line, compact=False):
+        # return parsed line, or None and the reason of failure
+        return parse_pline(line, self._lp, self._ha, self._drop_undefhost,
+                           compact)
+
+    def set_journal(self, journal):
+        """Record processed messages into a write-ahead journal.
+
+        Args:
+            journal (amulog.journal.Journal)
+        """
+        self._journal = journal
+
+    def set_commit_hook(self, func):
+        """Set a function called without arguments after every DB commit
+        (e.g., to record input positions of the committed messages)."""
+        self._commit_hook = func
+
+    @property
+    def metrics(self):
+        """metrics.Metrics: None if not used."""
+        return self._metrics
+
+    def process_line(self, line):
+        if self._metrics is not None:
+            return self._process_line_metrics(line)
+        pline, reason = self._parse_line(line)
+        if pline is None:
+            self.fail_dump(line, reason)
+            return None
+        return self.process_pline(pline, line)
+
+    def _process_line_metrics(self, line):
+        m = self._metrics
+        t = m.now()
+        if m.last is not None:
+            m.lap(metrics.STAGE_INPUT, m.last)
+        ret = None
         pline = parse_line(strutil.add_esc(line), self._lp)
-        if pline is not None:
+        t = m.lap(metrics.STAGE_PARSE, t)
+        if pline is None:
+            self.fail_dump(line, fail_sink.FAIL_PARSE)
+        else:
             pline = normalize_pline(pline, self._ha, self._drop_undefhost)
-        return pline
+            m.lap(metrics.STAGE_NORMALIZE, t)
+            if pline is None:
+                self.fail_dump(line, fail_sink.FAIL_UNKNOWN_HOST)
+            else:
+                ret = self._process_pline(pline, line)
+        m.end_line(len(self._lttable))
+        return ret
 
-    def process_line(self, line):
-        pline = self.get_parsed_line(line)
+    def process_pline(self, pline, line, replay=False,
+                      reason=fail_sink.FAIL_PARSE):
+        """Generate a log template for a parsed message
+        and store the message into DB.
+
+        Args:
+            pline (dict): A parsed log message with log2seq.
+                None if the message failed to be parsed
+                (or from an undefined host).
+            line (str): The original log message line.
+            replay (bool, optional): True if the message is replayed
+                from a journal with the lid assigned before.
+            reason (str, optional): The reason of failure
+                (fail_sink.FAIL_*) if pline is None.
+
+        Returns:
+            lt_common.LogTemplate: A log template of the message.
+        """
+        m = self._metrics
+        if m is None:
+            return self._process_pline(pline, line, replay, reason)
+        if m.last is not None:
+            m.lap(metrics.STAGE_INPUT, m.last)
+        ret = self._process_pline(pline, line, replay, reason)
+        m.end_line(len(self._lttable))
+        return ret
+
+    def _process_pline(self, pline, line, replay=False,
+                       reason=fail_sink.FAIL_PARSE):
         if pline is None:
-            self.fail_dump(line)
+            self.fail_dump(line, reason)
+            return None
+
+        m = self._metrics
+        if m is not None:
+            t = m.now()
+        if self._memo is None:
+            ltline = self._process_template(pline)
+        else:
+            key = tuple(pline[log2seq.KEY_WORDS])
+            ret = self._memo.get(key)
+            if ret is None:
+                ltline = self._process_template(pline, key)
+            else:
+                _, ltid = ret
+                self.count_lt(ltid)
+                ltline = self._lttable[ltid]
+        if m is not None:
+            t = m.lap(metrics.STAGE_TEMPLATE, t)
+        if ltline is None:
+            self.fail_dump(line, fail_sink.FAIL_NO_TPL)
             return None
 
+        lm = self.add_line(pline, ltline, replay)
+        if self._journal is not None:
+            self._journal.add_line(lm, pline)
+        self._online_counter += 1
+        if self._online_counter >= self._online_batchsize:
+            self.commit_db()
+        if m is not None:
+            m.lap(metrics.STAGE_DB, t)
+        return ltline
+
+    def _match_template(self, pline):
+        # search existing templates before the template generator
+        tid = self._matcher.search(pline[log2seq.KEY_WORDS])
+        if tid is None:
+            self._matcher_miss += 1
+        else:
+            self._matcher_hit += 1
+        return tid
+
+    def _update_matcher(self, tid, state):
+        if state == lt_common.LTGen.state_added:
+            self._matcher.add(tid, self._table[tid])
+        elif state == lt_common.LTGen.state_changed:
+            self._matcher.remove(self._table.get_updated())
+            self._matcher.add(tid, self._table[tid])
+
+    def _process_template(self, pline, memo_key=None):
+        if self._matcher is not None:
+            tid = self._match_template(pline)
+            if tid is not None:
+                ltid = self._table.get_ltid(tid)
+                self.count_lt(ltid)
+                ltline = self._lttable[ltid]
+                if memo_key is not None:
+                    self._memo.put(memo_key, tid, ltid)
+                return ltline
+
         tid, state = self._ltgen.process_line(pline)
+        if tid is not None and self._matcher is not None:
+            self._update_matcher(tid, state)
         if tid is None:
-            self.fail_dump(line)
             return None
         elif state == lt_common.LTGen.state_added:
             tpl = self._ltgen.get_tpl(tid)
-            ltline = self.add_lt(tpl, pline[log2seq.KEY_SYMBOLS],
-                                 add_group=True)
+            ltid = self._search_seed(pline[log2seq.KEY_WORDS])
+            if ltid is None:
+                ltline = self.add_lt(tpl, pline[log2seq.KEY_SYMBOLS],
+                                     add_group=True)
+            else:
+                self.count_lt(ltid)
+                ltline = self._lttable[ltid]
             self._table.add_ltid(tid, ltline.ltid)
+            if self._memo is not None and self._ltgen.is_stateful():
+                # new template may change the estimation of cached messages
+                self._memo.clear()
         elif state == lt_common.LTGen.state_changed:
             tpl = self._ltgen.get_tpl(tid)
             ltid = self._table.get_ltid(tid)
+            old_tpl = self._lttable[ltid].ltw
+            if self._seeder is not None and len(old_tpl) == len(tpl):
+                # seeded templates are not made more specific
+                # than the stored messages
+                tpl = lt_common.merged_template(old_tpl, tpl)
             self.replace_and_count_lt(ltid, tpl)
             ltline = self._lttable[ltid]
+            if self._memo is not None:
+                self._memo.invalidate(tid)
         elif state == lt_common.LTGen.state_unchanged:
             ltid = self._table.get_ltid(tid)
             self.count_lt(ltid)
@@ -217,23 +542,56 @@ class LTManager(object):
         else:
             raise AssertionError
 
-        self.add_line(pline, ltline)
-        self._online_counter += 1
-        if self._online_counter >= self._online_batchsize:
-            self.commit_db()
-            self._online_counter = 0
+        if memo_key is not None:
+            self._memo.put(memo_key, tid, ltline.ltid)
         return ltline
 
+    def restore_pline(self, pline, ltid):
+        """Feed a message already stored in DB to the template generator.
+        Used to reproduce the generator state in resuming from a journal.
+
+        Args:
+            pline (dict): A parsed log message with log2seq.
+            ltid (int): The log template identifier assigned to the message.
+        """
+        if self._matcher is not None:
+            tid = self._match_template(pline)
+            if tid is not None:
+                state = lt_common.LTGen.state_unchanged
+            else:
+                tid, state = self._ltgen.process_line(pline)
+                self._update_matcher(tid, state)
+        else:
+            tid, state = self._ltgen.process_line(pline)
+        if state == lt_common.LTGen.state_added:
+            self._table.add_ltid(tid, ltid)
+        elif self._table.get_ltid(tid) != ltid:
+            msg = ("journal replay mismatch: "
+                   "ltid {0} expected but {1} given".format(
+                       ltid, self._table.get_ltid(tid)))
+            raise ValueError(msg)
+
     def process_online_end(self):
         if isinstance(self._ltgroup, lt_common.LTGroupOffline):
             self.remake_ltg()
-
-    def add_line(self, pline, ltline):
+        if self._memo is not None:
+            _logger.info(str(self._memo))
+        if self._matcher is not None:
+            _logger.info("fast matcher: {0} hits, {1} misses".format(
+                self._matcher_hit, self._matcher_miss))
+        if len(self._fail.counts) > 0:
+            _logger.info(str(self._fail))
+        if self._metrics is not None:
+            self._metrics.report()
+
+    def add_line(self, pline, ltline, replay=False):
         """Add a log message to DB.
 
         Args:
             ltline (lt_common.LogTemplate): A log template object.
             pline (dict): A parsed log message with log2seq.
+            replay (bool, optional): True if the message is replayed
+                from a journal with the lid assigned before.
 
         Returns:
             LogMessage: An annotated log message instance.
@@ -247,7 +605,7 @@ class LTManager(object):
                   "l_w": l_w}
         if "lid" in pline:
             kwargs["lid"] = pline["lid"]
-        new_lid = self._db.add_line(**kwargs)
+        new_lid = self._db.add_line(replay=replay, **kwargs)
         return log_db.LogMessage(new_lid, ltline,
                                  dt, host, l_w)
 
@@ -291,23 +649,93 @@ class LTManager(object):
             self._db.add_ltg(ltline.ltid, ltline.ltgid)
 
     def load_internal_data(self):
-        if os.path.exists(self._filename) and not self._reset_db:
+        """Load the internal data to continue template generation,
+        if DB is not reset and the data is available."""
+        if self._ltgen is None or self._reset_db:
+            return
+        if os.path.exists(self._filename):
             self.load()
+        # templates in DB are seeded at the first new template,
+        # after the messages replayed from a journal are restored
+        self._seed_pending = True
+
+    def _search_seed(self, words):
+        if self._seed_pending:
+            self._seed_templates()
+            self._seed_pending = False
+        if self._seeder is None:
+            return None
+        return self._seeder.search(words)
+
+    def _seed_templates(self):
+        # templates in DB without the generator state
+        # (e.g., made in host-sharded processing) are searched
+        # before adding new templates for the generated ones
+        s_ltid = {self._table.get_ltid(tid) for tid in self._table.tids()
+                  if self._table.has_ltid(tid)}
+        l_ltline = [ltline for ltline in self._lttable
+                    if ltline.ltid not in s_ltid]
+        if len(l_ltline) == 0:
+            return
+        from . import lt_search
+        self._seeder = lt_search.LTSearchTreeNew()
+        for ltline in l_ltline:
+            self._seeder.add(ltline.ltid, ltline.ltw)
+        _logger.info("{0} templates in DB are not found in the internal data,"
+                     " used for matching messages".format(len(l_ltline)))
+
+    def remove_internal_data(self):
+        """Remove the internal data and its checkpoints
+        (e.g., if it is not reproduced in processing)."""
+        self._checkpointer.remove()
 
     def commit_db(self):
         """Commit requested changes in LogDB.
         """
         self._db.commit()
+        self._fail.flush()
+        self._online_counter = 0
+        if self._journal is not None:
+            self._journal.commit(self._db.last_lid)
+        if self._commit_hook is not None:
+            self._commit_hook()
+        if self._checkpoint_interval > 0 and \
+                time.time() - self._last_checkpoint >= \
+                self._checkpoint_interval:
+            self.checkpoint()
 
     def load(self):
-        with open(self._filename, 'rb') as f:
-            obj = pickle.load(f)
+        """Load the internal data with the checkpoints after it."""
+        obj, l_delta = self._checkpointer.load()
         table_data, ltgen_data, ltgroup_data = obj
         self._table.load(table_data)
         self._ltgen.load(ltgen_data)
-        self._ltgroup.load(ltgroup_data)
-
-    def dump(self):
+        if self._ltgroup is not None:
+            self._ltgroup.load(ltgroup_data)
+        for table_delta, ltgen_full, ltgen_data, ltgroup_data in l_delta:
+            self._table.load_delta(table_delta)
+            if ltgen_full:
+                self._ltgen.load(ltgen_data)
+            else:
+                self._ltgen.load_delta(ltgen_data)
+            if self._ltgroup is not None:
+                self._ltgroup.load(ltgroup_data)
+        self._restore_ltids()
+        if self._matcher is not None:
+            for tid in self._table.tids():
+                self._matcher.add(tid, self._table[tid])
+
+    def _restore_ltids(self):
+        # internal data of old format does not have ltids of templates
+        d_ltid = {tuple(ltline.ltw): ltline.ltid for ltline in self._lttable}
+        for tid in self._table.tids():
+            if not self._table.has_ltid(tid):
+                ltid = d_ltid.get(tuple(self._table[tid]))
+                if ltid is not None:
+                    self._table.add_ltid(tid, ltid)
+        self._table.dump_delta()
+
+    def _dumpobj(self):
         table_data = self._table.dumpobj()
         if self._ltgen is None:
             ltgen_data = None
@@ -317,13 +745,62 @@ class LTManager(object):
             ltgroup_data = None
         else:
             ltgroup_data = self._ltgroup.dumpobj()
-        obj = (table_data, ltgen_data, ltgroup_data)
-        with open(self._filename, 'wb') as f:
-            pickle.dump(obj, f)
+        return table_data, ltgen_data, ltgroup_data
+
+    def dump(self):
+        """Write the whole internal data (written atomically),
+        and remove the checkpoints included in it."""
+        if self._dry_run:
+            return
+        obj = self._dumpobj()
+        # changes until now are included
+        self._table.dump_delta()
+        if self._ltgen is not None:
+            self._ltgen.dump_delta()
+        self._checkpointer.write_base(obj)
+        self._last_checkpoint = time.time()
+        self._rebase_journal()
+
+    def checkpoint(self):
+        """Write the changes of the internal data after the last checkpoint.
+        The whole data is written instead in every
+        manager.checkpoint_compact checkpoints."""
+        if self._ltgen is None or self._dry_run:
+            # parallel processing does not keep the generator state,
+            # and dry runs do not write anything
+            return
+        if self._checkpointer.needs_base or \
+                self._checkpointer.n_delta >= self._checkpoint_compact:
+            self.dump()
+            return
+        table_delta = self._table.dump_delta()
+        ltgen_data = self._ltgen.dump_delta()
+        ltgen_full = ltgen_data is None
+        if ltgen_full:
+            ltgen_data = self._ltgen.dumpobj()
+        if self._ltgroup is None:
+            ltgroup_data = None
+        else:
+            ltgroup_data = self._ltgroup.dumpobj()
+        self._checkpointer.write_delta(
+            (table_delta, ltgen_full, ltgen_data, ltgroup_data))
+        self._last_checkpoint = time.time()
+        self._rebase_journal()
+
+    def _rebase_journal(self):
+        # the journaled messages are included in the written internal data
+        if self._journal is not None:
+            self._journal.rebase(self._db.last_lid)
 
-    def fail_dump(self, msg):
-        with open(self._fail_output, 'a') as f:
-            f.write(msg)
+    def fail_dump(self, msg, reason=fail_sink.FAIL_PARSE):
+        """Output a line not stored into DB. The output is buffered
+        and written on every DB commit.
+
+        Args:
+            msg (str): The original log message line.
+            reason (str): One of fail_sink.FAIL_*.
+        """
+        self._fail.write(msg, reason)
 
 
 def init_manager(ld):
@@ -455,7 +932,19 @@ def parse_line(line, lp):
             return parsed_line
 
 
-def normalize_pline(pline, ha, drop_undefhost=False):
+def normalize_pline(pline, ha, drop_undefhost=False, compact=False):
+    """Resolve the host name of a parsed line with host_alias.
+
+    Args:
+        pline (dict): A parsed line given by parse_line.
+        ha (host_alias.HostAlias)
+        drop_undefhost (bool, optional): Return None for undefined hosts.
+        compact (bool, optional): Return pline_store.ParsedLine
+            instead of the dict.
+
+    Returns:
+        dict: The normalized parsed line, or None if failed.
+    """
     if pline is None:
         return None
 
@@ -471,15 +960,37 @@ def normalize_pline(pline, ha, drop_undefhost=False):
             else:
                 host = org_host
         pline["host"] = host
+        if compact:
+            return pline_store.ParsedLine.from_pline(pline)
     except KeyError:
         return None
 
     return pline
 
 
-def _open_file(fp, **kwargs):
+def parse_pline(line, lp, ha, drop_undefhost=False, compact=False):
+    """Parse a line with parse_line and normalize_pline.
+
+    Returns:
+        Tuple[dict, str]: The parsed line and None, or None and the reason
+        of failure (fail_sink.FAIL_PARSE or fail_sink.FAIL_UNKNOWN_HOST).
+    """
+    pline = parse_line(strutil.add_esc(line), lp)
+    if pline is None:
+        return None, fail_sink.FAIL_PARSE
+    pline = normalize_pline(pline, ha, drop_undefhost, compact)
+    if pline is None:
+        return None, fail_sink.FAIL_UNKNOWN_HOST
+    return pline, None
+
+
+def _open_file(fp, mode='rt', gzip_command=None, **kwargs):
     ext = os.path.splitext(fp)[-1].lstrip(".")
-    if ext == "bz2":
+    if ext == "gz" and gzip_command:
+        _logger.info("processing gz file {0} with {1}".format(
+            fp, gzip_command))
+        return _open_command(gzip_command, fp, mode, **kwargs)
+    elif ext == "bz2":
         import bz2
         open_func = bz2.open
     elif ext == "gz":
@@ -490,10 +1001,43 @@ def _open_file(fp, **kwargs):
         open_func = open
 
     _logger.info("processing {0} file {1}".format(ext, fp))
-    return open_func(fp, 'rt', **kwargs)
+    return open_func(fp, mode, **kwargs)
+
+
+@contextlib.contextmanager
+def _open_command(command, fp, mode='rt', **kwargs):
+    """Open the standard output of an external decompression command
+    (e.g., pigz -dc) given the filepath as the last argument."""
+    import io
+    import shlex
+    import subprocess
+    proc = subprocess.Popen(shlex.split(command) + [fp],
+                            stdout=subprocess.PIPE)
+    try:
+        if "b" in mode:
+            yield proc.stdout
+        else:
+            yield io.TextIOWrapper(proc.stdout, **kwargs)
+    finally:
+        proc.stdout.close()
+        if proc.wait() not in (0, -13):  # -13: SIGPIPE if closed early
+            raise IOError("{0} failed to decompress {1}".format(
+                command, fp))
+
 
+def _check_gzip_command(gzip_command):
+    if gzip_command is None or gzip_command.strip() == "":
+        return None
+    import shlex
+    import shutil
+    if shutil.which(shlex.split(gzip_command)[0]) is None:
+        _logger.warning("gzip_command {0} not found, use gzip module".format(
+            gzip_command))
+        return None
+    return gzip_command
 
-def iter_lines(targets, encoding="utf-8", errors="ignore"):
+
+def _iter_target_files(targets):
     for fp in targets:
         if os.path.isdir(fp):
             sys.stderr.write(
@@ -501,11 +1045,163 @@ def iter_lines(targets, encoding="utf-8", errors="ignore"):
             sys.stderr.write(
                 "Use -r if you need to search log data recursively\n")
         else:
-            if not os.path.isfile(fp):
-                raise IOError("File {0} not found".format(fp))
-            with _open_file(fp, encoding=encoding, errors=errors) as f:
-                for line in f:
-                    yield line
+            yield fp
+
+
+def iter_lines(targets, encoding="utf-8", errors="ignore",
+               n_reader=0, gzip_command=None):
+    """Yield lines in target files in the given order.
+
+    Args:
+        targets (List[str]): A sequence of filepaths to process.
+        encoding (str, optional)
+        errors (str, optional)
+        n_reader (int, optional): Number of files to read and decompress
+            concurrently in reader processes. If 0 or 1, files are read
+            sequentially.
+        gzip_command (str, optional): External command to decompress
+            gzip files (e.g., pigz -dc).
+
+    Raises:
+        IOError: If a file in targets not found.
+    """
+    gzip_command = _check_gzip_command(gzip_command)
+    if n_reader > 1:
+        yield from _iter_lines_concurrent(targets, n_reader, encoding,
+                                          errors, gzip_command)
+        return
+
+    for fp in _iter_target_files(targets):
+        if not os.path.isfile(fp):
+            raise IOError("File {0} not found".format(fp))
+        with _open_file(fp, gzip_command=gzip_command,
+                        encoding=encoding, errors=errors) as f:
+            for line in f:
+                yield line
+
+
+def _read_file_task(fp, que, encoding, errors, gzip_command):
+    # runs in a reader process, so that decompression and decoding
+    # of the files are not serialized with the main process by GIL
+    import signal
+    # stopped with terminate from the main process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    try:
+        if not os.path.isfile(fp):
+            raise IOError("File {0} not found".format(fp))
+        with _open_file(fp, gzip_command=gzip_command,
+                        encoding=encoding, errors=errors) as f:
+            for chunk in iter_chunks(f, READER_CHUNK_LINES):
+                que.put(chunk)
+    except Exception as e:
+        que.put(e)
+        return
+    que.put(None)
+
+
+def _get_chunk(que, proc):
+    import queue
+    while True:
+        try:
+            return que.get(timeout=1)
+        except queue.Empty:
+            if not proc.is_alive() and que.empty():
+                raise RuntimeError("reader process {0} exited "
+                                   "unexpectedly".format(proc.name))
+
+
+def _iter_lines_concurrent(targets, n_reader, encoding, errors,
+                           gzip_command):
+    from multiprocessing import Process, Queue
+
+    def _start(fp):
+        que = Queue(maxsize=READER_QUEUE_CHUNKS)
+        proc = Process(target=_read_file_task,
+                       args=(fp, que, encoding, errors, gzip_command),
+                       name="reader-{0}".format(os.path.basename(fp)))
+        proc.start()
+        return que, proc
+
+    l_waiting = list(_iter_target_files(targets))
+    l_running = []
+    try:
+        # at most n_reader files are read ahead in the order of files,
+        # and a reader of a later file waits on its bounded queue
+        # until the preceding files are consumed
+        while len(l_waiting) > 0 or len(l_running) > 0:
+            while len(l_waiting) > 0 and len(l_running) < n_reader:
+                l_running.append(_start(l_waiting.pop(0)))
+            que, proc = l_running[0]
+            while True:
+                item = _get_chunk(que, proc)
+                if item is None:
+                    break
+                elif isinstance(item, Exception):
+                    raise item
+                yield from item
+            proc.join()
+            l_running.pop(0)
+    finally:
+        for que, proc in l_running:
+            proc.terminate()
+            proc.join()
+
+
+def iter_lines_conf(conf, targets):
+    """iter_lines with the reader options in manager section of conf."""
+    return iter_lines(targets,
+                      n_reader=conf.getint("manager", "input_reader"),
+                      gzip_command=conf.get("manager", "gzip_command"))
+
+
+def iter_chunks(iterable, size):
+    """Yield lists of at most size items from iterable."""
+    import itertools
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def iter_lines_offset(targets, position=None,
+                      encoding="utf-8", errors="ignore"):
+    """Same as iter_lines, but also yields the input position of lines.
+
+    Args:
+        targets (List[str]): A sequence of filepaths to process.
+        position (Tuple[int, int], optional): Start position to read,
+            given as file index in targets and byte offset in the file.
+        encoding (str, optional)
+        errors (str, optional)
+
+    Yields:
+        Tuple[int, int, str]: File index in targets, byte offset just after
+            the line (in the decompressed stream), and the line.
+    """
+    start_fid, start_offset = (0, 0) if position is None else position
+    for fid, fp in enumerate(targets):
+        if fid < start_fid:
+            continue
+        if os.path.isdir(fp):
+            sys.stderr.write(
+                "{0} is a directory, fail to process\n".format(fp))
+            sys.stderr.write(
+                "Use -r if you need to search log data recursively\n")
+            continue
+        if not os.path.isfile(fp):
+            raise IOError("File {0} not found".format(fp))
+        with _open_file(fp, mode='rb') as f:
+            offset = 0
+            if fid == start_fid and start_offset > 0:
+                f.seek(start_offset)
+                offset = start_offset
+            for bline in f:
+                offset += len(bline)
+                yield fid, offset, bline.decode(encoding, errors)
 
 
 def iter_plines(conf, targets, pass_none=True):
@@ -513,27 +1209,119 @@ def iter_plines(conf, targets, pass_none=True):
     ha = host_alias.init_hostalias(conf)
     drop_undefhost = conf.getboolean("manager", "undefined_host")
 
-    for line in iter_lines(targets):
+    def _parse(line):
         pline = parse_line(strutil.add_esc(line), lp)
-        pline = normalize_pline(pline, ha, drop_undefhost)
+        return normalize_pline(pline, ha, drop_undefhost)
+
+    if conf.getboolean("manager", "parse_cache"):
+        from . import parse_cache
+        iterobj = parse_cache.iter_plines_cached(conf, targets, _parse)
+    else:
+        iterobj = (_parse(line) for line in iter_lines_conf(conf, targets))
+
+    for pline in iterobj:
         if pline is None and pass_none:
             pass
         else:
             yield pline
 
 
-def process_files_online(conf, targets, reset_db):
+def _timestamp_key(dt):
+    # naive timestamps are local time: compared in naive UTC
+    # so that naive and tz-aware timestamps are ordered together
+    return dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _iter_file_plines(fp, lp, ha, drop_undefhost, window, gzip_command):
+    # keys: (0,) for unparsed lines before any timestamp,
+    # (1, timestamp in naive UTC) for the others
+    import heapq
+    buf = []
+    key = (0,)
+    for seq, line in enumerate(iter_lines([fp], gzip_command=gzip_command)):
+        pline, reason = parse_pline(line, lp, ha, drop_undefhost)
+        if pline is not None:
+            key = (1, _timestamp_key(pline[log2seq.KEY_TIMESTAMP]))
+        # unparsed lines follow the preceding message in the file
+        heapq.heappush(buf, (key, seq, line, pline, reason))
+        if len(buf) > window:
+            yield heapq.heappop(buf)
+    while len(buf) > 0:
+        yield heapq.heappop(buf)
+
+
+def iter_plines_time_ordered(conf, targets, window=None):
+    """Merge lines of all target files in the order of timestamps.
+    All files are opened together, and only a bounded window of lines
+    is kept on memory for each file.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        targets (List[str]): A sequence of filepaths to process.
+        window (int, optional): Number of lines to reorder in each file.
+            If 0, each file is assumed to be ordered by timestamps.
+            Defaults to manager.input_order_window.
+
+    Yields:
+        Tuple[str, dict, str]: A line, the parsed line, and the reason
+        of failure (fail_sink.FAIL_*). The parsed line is None
+        if the line failed to be parsed (or from an undefined host).
+    """
+    import heapq
+    if window is None:
+        window = conf.getint("manager", "input_order_window")
+    lp = load_log2seq(conf)
+    ha = host_alias.init_hostalias(conf)
+    drop_undefhost = conf.getboolean("manager", "undefined_host")
+    gzip_command = _check_gzip_command(conf.get("manager", "gzip_command"))
+
+    l_iter = [_iter_file_plines(fp, lp, ha, drop_undefhost,
+                                window, gzip_command)
+              for fp in _iter_target_files(targets)]
+    # heapq.merge keeps the order of targets for the same timestamp
+    for _, _, line, pline, reason in heapq.merge(*l_iter,
+                                                 key=lambda x: x[0]):
+        yield line, pline, reason
+
+
+def _input_time_ordered(conf):
+    input_order = conf.get("manager", "input_order")
+    if input_order == "time":
+        return True
+    elif input_order == "file":
+        return False
+    else:
+        raise ValueError("invalid input_order {0}".format(input_order))
+
+
+def _init_db(conf, reset_db, dry_run):
+    # DB and lttable for LTManager
+    if dry_run:
+        return log_db.CountingDB(), lt_common.LTTable()
+    ld = log_db.LogData(conf, edit=True, reset_db=reset_db)
+    return ld.db, ld.lttable
+
+
+def process_files_online(conf, targets, reset_db, dry_run=False):
     """Add log messages to DB from files.
 
+    If manager.online_parse_process is given, lines are parsed
+    in parallel processes and the templates are generated
+    in the main process (available also for stateful ltgen methods).
+    If manager.shard_process is given, messages are processed
+    in host-sharded processes (see amulog.shard).
+
     Args:
         conf (config.ExtendedConfigParser): A common configuration object.
         targets (List[str]): A sequence of filepaths to process.
         reset_db (bool): True if DB needs to reset before adding.
+        dry_run (bool, optional): Process the messages without DB
+            and other outputs, and report the throughput.
 
     Raises:
         IOError: If a file in targets not found.
     """
-    def _sigterm_handler():
+    def _sigterm_handler(*_):
         raise KeyboardInterrupt
 
     import signal
@@ -542,33 +1330,239 @@ def process_files_online(conf, targets, reset_db):
     msg = "amulog online processing"
     _logger.info(msg)
 
-    ld = log_db.LogData(conf, edit=True, reset_db=reset_db)
-    ltm = LTManager(conf, ld.db, ld.lttable, reset_db=reset_db)
+    journal = None if dry_run else init_journal(conf)
+    time_ordered = _input_time_ordered(conf)
+    if journal is not None and time_ordered:
+        raise ValueError("journal is not available with input_order = time")
+    if conf.getint("manager", "shard_process") > 0:
+        if journal is not None:
+            raise ValueError("journal is not available with shard_process")
+        if dry_run:
+            raise ValueError("dry run is not available with shard_process")
+        from . import shard
+        shard.process_files_sharded(conf, targets, reset_db)
+        return
+    if journal is not None and os.path.exists(journal.filename):
+        if reset_db:
+            _logger.warning("discard existing journal {0}".format(
+                journal.filename))
+        else:
+            msg = ("journal {0} of interrupted processing found, "
+                   "use db-resume or remove it".format(journal.filename))
+            raise ValueError(msg)
+
+    db, lttable = _init_db(conf, reset_db, dry_run)
+    ltm = LTManager(conf, db, lttable, reset_db=reset_db, dry_run=dry_run)
+    ltm.load_internal_data()
+
+    if time_ordered:
+        iterobj = ((None, None, line, pline, reason)
+                   for line, pline, reason
+                   in iter_plines_time_ordered(conf, targets))
+        _process_online(conf, ltm, iterobj, parsed=True)
+    elif journal is None:
+        iterobj = ((None, None, line)
+                   for line in iter_lines_conf(conf, targets))
+        _process_online(conf, ltm, iterobj)
+    else:
+        journal.start(targets, reset_db, db.last_lid)
+        ltm.set_journal(journal)
+        iterobj = iter_lines_offset(targets)
+        _process_online(conf, ltm, iterobj, journal)
+    if dry_run:
+        _logger.info(db.report())
+
 
+def _process_online(conf, ltm, iterobj, journal=None, parsed=False):
+    # parsed: iterobj yields parsed lines in addition to the lines
+    n_parse_proc = conf.getint("manager", "online_parse_process")
     try:
-        for line in iter_lines(targets):
-            ltm.process_line(line)
+        if not parsed and n_parse_proc > 0:
+            batchsize = conf.getint("manager", "online_batchsize")
+            iterobj = iter_plines_pipeline(conf, iterobj, n_parse_proc,
+                                           batchsize)
+            parsed = True
+        if parsed:
+            for fid, offset, line, pline, reason in iterobj:
+                if journal is not None:
+                    journal.set_position(fid, offset)
+                ltm.process_pline(pline, line, reason=reason)
+        else:
+            for fid, offset, line in iterobj:
+                if journal is not None:
+                    journal.set_position(fid, offset)
+                ltm.process_line(line)
     except KeyboardInterrupt:
         pass
     finally:
         ltm.process_online_end()
         ltm.commit_db()
         ltm.dump()
+        if journal is not None:
+            journal.close(remove=True)
+
+
+def _init_parse_pool(conf):
+    import signal
+    # the handler of the main process (raising KeyboardInterrupt) is
+    # inherited with fork, and blocks Pool.terminate in exiting workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    objects = {"lp": load_log2seq(conf),
+               "ha": host_alias.init_hostalias(conf),
+               "drop_undefhost": conf.getboolean("manager", "undefined_host")}
+    global _MULTIPROCESS_LOCAL_OBJECTS
+    _MULTIPROCESS_LOCAL_OBJECTS = objects
+
+
+def _parse_pool_task(batch):
+    lp = _MULTIPROCESS_LOCAL_OBJECTS["lp"]
+    ha = _MULTIPROCESS_LOCAL_OBJECTS["ha"]
+    drop_undefhost = _MULTIPROCESS_LOCAL_OBJECTS["drop_undefhost"]
+    return [parse_pline(line, lp, ha, drop_undefhost) for line in batch]
+
+
+def iter_plines_pipeline(conf, iterobj, n_proc, batchsize, n_inflight=None):
+    """Parse lines in worker processes, keeping the input order.
+    Used to feed stateful ltgen methods in the main process.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        iterobj (Iterable[Tuple[int, int, str]]): Lines with input positions,
+            same as iter_lines_offset.
+        n_proc (int): Number of parsing processes.
+        batchsize (int): Number of lines in a chunk for a process.
+        n_inflight (int, optional): Maximum number of chunks
+            parsed or waiting to be consumed. Defaults to twice n_proc.
+
+    Yields:
+        Tuple[int, int, str, dict, str]: Input position, line, parsed line,
+        and the reason of failure (fail_sink.FAIL_*). The parsed line
+        is None if the line failed to be parsed (or from an undefined host).
+    """
+    import threading
+    from multiprocessing import Pool
+
+    if n_inflight is None:
+        n_inflight = 2 * n_proc
+    semaphore = threading.Semaphore(n_inflight)
+    pending = {}
+
+    def _iter_batch():
+        # called in the task handler thread of the pool
+        for idx, chunk in enumerate(iter_chunks(iterobj, batchsize)):
+            semaphore.acquire()
+            pending[idx] = chunk
+            yield [line for _, _, line in chunk]
+
+    pool = Pool(processes=n_proc, initializer=_init_parse_pool,
+                initargs=(conf,))
+    try:
+        for idx, l_parsed in enumerate(pool.imap(_parse_pool_task,
+                                                 _iter_batch())):
+            for (fid, offset, line), (pline, reason) in zip(pending.pop(idx),
+                                                            l_parsed):
+                yield fid, offset, line, pline, reason
+            semaphore.release()
+        pool.close()
+    finally:
+        for _ in range(n_inflight):
+            semaphore.release()
+        pool.terminate()
+
+
+def init_journal(conf):
+    """Return a write-ahead journal object if manager.journal_filename
+    is configured. Otherwise, return None."""
+    fn = conf.get("manager", "journal_filename")
+    if len(fn.strip()) == 0:
+        return None
+    from . import journal
+    sync_interval = conf.getint("manager", "journal_sync_interval")
+    return journal.Journal(fn, sync_interval)
+
+
+def resume_files_online(conf):
+    """Resume online processing interrupted by a crash
+    with the write-ahead journal.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+
+    Raises:
+        IOError: If the journal is not available.
+    """
+    def _sigterm_handler(*_):
+        raise KeyboardInterrupt
+
+    import signal
+    signal.signal(signal.SIGTERM, _sigterm_handler)
+
+    journal = init_journal(conf)
+    if journal is None:
+        raise IOError("manager.journal_filename is not configured")
+    from . import journal as journal_mod
+    state = journal_mod.load_journal(journal.filename)
+    msg = ("amulog online processing resumed from journal "
+           "({0} committed, {1} uncommitted lines)".format(
+               len(state.committed), len(state.uncommitted)))
+    _logger.info(msg)
+
+    # DB keeps the messages until the last commit
+    ld = log_db.LogData(conf, edit=True, reset_db=False)
+    ltm = LTManager(conf, ld.db, ld.lttable, reset_db=False)
+    if not state.reset_db:
+        # internal data written before the journal or at its last rebase
+        ltm.load_internal_data()
+
+    # reproduce template generator state without DB updates
+    for record in state.committed:
+        pline, ltid = state.record_to_pline(record)
+        ltm.restore_pline(pline, ltid)
+
+    # DB committed but journal not committed: the uncommitted messages
+    # are already stored in DB (lids at or below the last lid in DB)
+    stored = ld.db.last_lid > state.lid
+    if stored:
+        _logger.info("uncommitted lines already stored in DB")
+    # the journal keeps the uncommitted messages, so they are
+    # not journaled again to replay them in resuming again
+    for record in state.uncommitted:
+        pline, ltid = state.record_to_pline(record)
+        if stored:
+            ltm.restore_pline(pline, ltid)
+        else:
+            # the line is restored to be output if failed
+            ltm.process_pline(pline, state.record_to_line(record),
+                              replay=True)
+    journal.reopen(state.targets, state.valid_size)
+    journal.set_position(*state.position)
+    ltm.set_journal(journal)
+    ltm.commit_db()
 
+    iterobj = iter_lines_offset(state.targets, position=state.position)
+    _process_online(conf, ltm, iterobj, journal)
 
-def process_files_offline(conf, targets, reset_db, parallel=False):
+
+def process_files_offline(conf, targets, reset_db, parallel=False,
+                          dry_run=False):
     """Add log messages to DB from files. This function do NOT process
     messages incrementally. Use this to avoid bad-start problem of
     log template generation with clustering or training methods.
 
     Note:
-        This function needs large memory space.
+        This function needs large memory space,
+        except with stateless ltgen methods (e.g., re, import, crf)
+        processed in chunks.
 
     Args:
         conf (config.ExtendedConfigParser): A common configuration object.
         targets (List[str]): A sequence of filepaths to process.
         reset_db (bool): True if DB needs to reset before adding.
         parallel (bool, optional): Use multiprocessing.
+        dry_run (bool, optional): Process the messages without DB
+            and other outputs, and report the throughput.
 
     Raises:
         IOError: If a file in targets not found.
@@ -578,12 +1572,20 @@ def process_files_offline(conf, targets, reset_db, parallel=False):
         msg += " in parallel"
     _logger.info(msg)
 
-    ld = log_db.LogData(conf, edit=True, reset_db=reset_db)
-    ltm = LTManager(conf, ld.db, ld.lttable, reset_db=reset_db,
-                    parallel=parallel)
+    db, lttable = _init_db(conf, reset_db, dry_run)
+    ltm = LTManager(conf, db, lttable, reset_db=reset_db,
+                    parallel=parallel, dry_run=dry_run)
+    ltm.load_internal_data()
 
-    l_line = [line for line in iter_lines(targets)]
-    ltm.process_offline(l_line)
+    if _input_time_ordered(conf):
+        # lines are parsed again in process_offline
+        iterobj = (line for line, _, _
+                   in iter_plines_time_ordered(conf, targets))
+    else:
+        iterobj = iter_lines_conf(conf, targets)
+    ltm.process_offline(iterobj)
+    if dry_run:
+        _logger.info(db.report())
 
 
 def data_from_data(conf, targets, dirname, method, reset):
@@ -591,7 +1593,7 @@ def data_from_data(conf, targets, dirname, method, reset):
     lp = load_log2seq(conf)
     ha = host_alias.init_hostalias(conf)
     drop_undefhost = conf.getboolean("database", "undefined_host")
-    for line in iter_lines(targets):
+    for line in iter_lines_conf(conf, targets):
         pline = parse_line(line, lp)
         pline = normalize_pline(pline, ha, drop_undefhost)
         if pline is None:
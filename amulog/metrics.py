@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Throughput and latency metrics of processing stages in LTManager.
+
+Stages:
+    input: waiting for the next line (file reading and decompression)
+    parse: log2seq parsing
+    normalize: host name normalization (host_alias)
+    template: log template generation
+    db: storing messages into DB
+
+Every stage has a counter of lines, total time and a latency histogram
+with power-of-2 buckets, to estimate percentiles with small overhead.
+In offline processing, the stages are measured for every chunk,
+and the histograms record the average latency per line in the chunk.
+"""
+
+import os
+import json
+import math
+import time
+import logging
+
+_logger = logging.getLogger(__package__)
+
+STAGE_INPUT = "input"
+STAGE_PARSE = "parse"
+STAGE_NORMALIZE = "normalize"
+STAGE_TEMPLATE = "template"
+STAGE_DB = "db"
+STAGES = [STAGE_INPUT, STAGE_PARSE, STAGE_NORMALIZE, STAGE_TEMPLATE, STAGE_DB]
+
+# bucket i: latency < 2 ** (i + MIN_EXP) seconds (2 ** -20 is about 1us)
+MIN_EXP = -20
+N_BUCKETS = 28
+
+
+class Histogram:
+    """Latency histogram with power-of-2 buckets."""
+
+    def __init__(self):
+        self.buckets = [0] * N_BUCKETS
+        self.count = 0
+        self.total = 0.
+
+    def add(self, seconds, n=1):
+        self.count += n
+        self.total += seconds * n
+        if seconds <= 0:
+            idx = 0
+        else:
+            # frexp: seconds = m * 2 ** e with 0.5 <= m < 1
+            idx = min(max(math.frexp(seconds)[1] - MIN_EXP, 0),
+                      N_BUCKETS - 1)
+        self.buckets[idx] += n
+
+    def percentile(self, q):
+        """Return the upper bound of the bucket including q-quantile."""
+        if self.count == 0:
+            return 0.
+        threshold = q * self.count
+        cumsum = 0
+        for idx, cnt in enumerate(self.buckets):
+            cumsum += cnt
+            if cumsum >= threshold:
+                return 2. ** (idx + MIN_EXP)
+        return 2. ** (N_BUCKETS - 1 + MIN_EXP)
+
+
+class Metrics:
+    """Per-stage metrics, reported periodically.
+
+    Args:
+        interval (float): Interval (seconds) to report.
+        output (str, optional): File to output the metrics in every report.
+            Prometheus textfile format if the name ends with ".prom",
+            otherwise JSON.
+    """
+
+    def __init__(self, interval=60., output=None):
+        self._interval = interval
+        self._output = output
+        self._d_hist = {stage: Histogram() for stage in STAGES}
+        self.lines = 0
+        self.templates = 0
+        self._start = time.perf_counter()
+        self._last_report = self._start
+        self._last_lines = 0
+        self._last_templates = 0
+        self.last = None  # time of the end of the last line processing
+
+    @staticmethod
+    def now():
+        return time.perf_counter()
+
+    def lap(self, stage, t, n=1):
+        """Add the time since t to a stage, and return the current time."""
+        now = time.perf_counter()
+        self._d_hist[stage].add((now - t) / n, n)
+        return now
+
+    def end_line(self, n_templates, n=1):
+        """Called after processing lines."""
+        self.lines += n
+        self.templates = n_templates
+        self.last = time.perf_counter()
+        if self.last - self._last_report >= self._interval:
+            self.report()
+
+    def summary(self):
+        now = time.perf_counter()
+        elapsed = now - self._start
+        interval = now - self._last_report
+        d = {"lines": self.lines,
+             "elapsed": elapsed,
+             "lines_per_second": self.lines / elapsed if elapsed > 0 else 0.,
+             "recent_lines_per_second":
+                 ((self.lines - self._last_lines) / interval
+                  if interval > 0 else 0.),
+             "templates": self.templates,
+             "recent_templates_added": self.templates - self._last_templates,
+             "stages": {}}
+        for stage, hist in self._d_hist.items():
+            d["stages"][stage] = {"count": hist.count,
+                                  "seconds": hist.total,
+                                  "p50": hist.percentile(0.5),
+                                  "p99": hist.percentile(0.99)}
+        return d
+
+    def report(self):
+        d = self.summary()
+        _logger.info("metrics: {0} lines ({1:.1f} lines/s), {2} templates "
+                     "(+{3})".format(d["lines"], d["recent_lines_per_second"],
+                                     d["templates"],
+                                     d["recent_templates_added"]))
+        for stage in STAGES:
+            ds = d["stages"][stage]
+            if ds["count"] == 0:
+                continue
+            _logger.info("metrics: {0} {1:.3f}s total, p50 {2:.2e}s, "
+                         "p99 {3:.2e}s".format(stage, ds["seconds"],
+                                               ds["p50"], ds["p99"]))
+        if self._output:
+            self._dump(d)
+        self._last_report = time.perf_counter()
+        self._last_lines = self.lines
+        self._last_templates = self.templates
+
+    def _dump(self, d):
+        tmp_filename = self._output + ".tmp"
+        with open(tmp_filename, "w") as f:
+            if self._output.endswith(".prom"):
+                f.write(to_prometheus(d))
+            else:
+                json.dump(d, f)
+        os.replace(tmp_filename, self._output)
+
+
+def to_prometheus(d):
+    """Format a summary of Metrics in Prometheus text exposition format."""
+    buf = ["# TYPE amulog_lines_total counter",
+           "amulog_lines_total {0}".format(d["lines"]),
+           "# TYPE amulog_templates gauge",
+           "amulog_templates {0}".format(d["templates"]),
+           "# TYPE amulog_stage_seconds_total counter"]
+    for stage, ds in d["stages"].items():
+        buf.append('amulog_stage_seconds_total{{stage="{0}"}} {1}'.format(
+            stage, ds["seconds"]))
+    buf.append("# TYPE amulog_stage_latency_seconds summary")
+    for stage, ds in d["stages"].items():
+        for q, key in ((0.5, "p50"), (0.99, "p99")):
+            buf.append('amulog_stage_latency_seconds'
+                       '{{stage="{0}",quantile="{1}"}} {2}'.format(
+                           stage, q, ds[key]))
+        buf.append('amulog_stage_latency_seconds_count'
+                   '{{stage="{0}"}} {1}'.format(stage, ds["count"]))
+    return "\n".join(buf) + "\n"
+
+
+def init_metrics(conf):
+    """Return Metrics if manager.metrics is true. Otherwise, return None."""
+    if not conf.getboolean("manager", "metrics"):
+        return None
+    output = conf.get("manager", "metrics_output").strip()
+    return Metrics(conf.getfloat("manager", "metrics_interval"),
+                   output if output else None)
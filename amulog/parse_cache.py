@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Persistent cache of parsed lines of input files (manager.parse_cache).
+
+manager.iter_plines parses the input files with log2seq and host_alias
+in every invocation (e.g., eval commands repeated over the same data).
+With the cache, the parsed lines of every file are stored
+in general.cache_dir, and reused while the file and the parser
+configuration are unchanged. The cache file is named with the hash of
+the file path, size and mtime, the contents of manager.parser_script
+and manager.host_alias_filename, and manager.undefined_host.
+
+A cache file is a sequence of zlib-compressed chunks of
+lines encoded with pline_store.PlineCodec.
+Cache files of changed inputs are not removed automatically.
+"""
+
+import os
+import zlib
+import struct
+import marshal
+import hashlib
+import logging
+
+import log2seq
+
+from . import pline_store
+
+_logger = logging.getLogger(__package__)
+
+CACHE_VERSION = 1
+CACHE_MAGIC = b"AMULOGPC"
+CHUNK_LINES = 10000
+_HEADER = struct.Struct("<8sI")
+_CHUNK_HEADER = struct.Struct("<I")
+
+
+def _config_file_digest(fp):
+    if len(fp.strip()) == 0:
+        return ""
+    with open(fp, "rb") as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
+def cache_filename(conf, fp):
+    """Return the cache file path for an input file
+    with the current parser configuration."""
+    stat = os.stat(fp)
+    items = (CACHE_VERSION, getattr(log2seq, "__version__", ""),
+             os.path.realpath(fp), stat.st_size, stat.st_mtime_ns,
+             _config_file_digest(conf.get("manager", "parser_script")),
+             _config_file_digest(conf.get("manager", "host_alias_filename")),
+             conf.getboolean("manager", "undefined_host"))
+    key = hashlib.blake2b(repr(items).encode("utf-8"),
+                          digest_size=16).hexdigest()
+    return os.path.join(conf.get("general", "cache_dir"),
+                        "amulog_parse_{0}.cache".format(key))
+
+
+def _write_chunk(f, codec, chunk):
+    # the state is given with the first line
+    records = [codec.encode(pline) for pline in chunk]
+    data = marshal.dumps((codec.state, records))
+    data = zlib.compress(data, 1)
+    f.write(_CHUNK_HEADER.pack(len(data)))
+    f.write(data)
+
+
+def _iter_chunks(f):
+    while True:
+        header = f.read(_CHUNK_HEADER.size)
+        if len(header) == 0:
+            return
+        if len(header) < _CHUNK_HEADER.size:
+            raise EOFError("truncated parse cache")
+        size, = _CHUNK_HEADER.unpack(header)
+        data = f.read(size)
+        if len(data) < size:
+            raise EOFError("truncated parse cache")
+        yield marshal.loads(zlib.decompress(data))
+
+
+def _is_valid(filename):
+    try:
+        with open(filename, "rb") as f:
+            header = f.read(_HEADER.size)
+    except OSError:
+        return False
+    return header == _HEADER.pack(CACHE_MAGIC, CACHE_VERSION)
+
+
+def load_plines(filename):
+    """Yield parsed lines (None for lines failed to be parsed)
+    stored in a cache file."""
+    with open(filename, "rb") as f:
+        f.seek(_HEADER.size)
+        for state, records in _iter_chunks(f):
+            codec = pline_store.PlineCodec(state)
+            for data in records:
+                yield codec.decode(data)
+
+
+def store_plines(filename, iterobj):
+    """Yield parsed lines from iterobj, and store them into a cache file.
+    The cache file is made only if iterobj is consumed to the end."""
+    from . import manager
+    tmp_filename = "{0}.{1}.tmp".format(filename, os.getpid())
+    completed = False
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    try:
+        with open(tmp_filename, "wb") as f:
+            f.write(_HEADER.pack(CACHE_MAGIC, CACHE_VERSION))
+            codec = pline_store.PlineCodec()
+            for chunk in manager.iter_chunks(iterobj, CHUNK_LINES):
+                _write_chunk(f, codec, chunk)
+                yield from chunk
+        os.replace(tmp_filename, filename)
+        completed = True
+    finally:
+        if not completed and os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+
+def iter_plines_cached(conf, targets, parse_func):
+    """Yield parsed lines of target files, reusing the cache files.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        targets (List[str]): A sequence of filepaths to process.
+        parse_func (Callable[[str], dict]): Function to parse a line,
+            used for the files without valid cache.
+
+    Yields:
+        dict: A parsed line, or None if the line failed to be parsed.
+    """
+    from . import manager
+    for fp in manager._iter_target_files(targets):
+        if not os.path.isfile(fp):
+            raise IOError("File {0} not found".format(fp))
+        filename = cache_filename(conf, fp)
+        if _is_valid(filename):
+            _logger.debug("use parse cache {0} for {1}".format(filename, fp))
+            yield from load_plines(filename)
+        else:
+            iterobj = (parse_func(line)
+                       for line in manager.iter_lines_conf(conf, [fp]))
+            yield from store_plines(filename, iterobj)
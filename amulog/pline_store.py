@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Compact parsed lines.
+
+ParsedLine (manager.offline_compact_pline) keeps only the items
+of a parsed line used in template generation and DB.
+
+PlineCodec encodes parsed lines into compact bytes: values for the keys
+common to the lines are encoded with marshal (timestamps in microseconds),
+and the other lines are pickled. It is also used in amulog.parse_cache.
+
+PlineStore (manager.offline_pline_memory) is a memory-bounded container
+of parsed lines for offline processing. The encoded records are stored
+in a memory buffer up to the given size, and moved to an anonymous
+scratch file once the size is exceeded. The scratch file is read
+through mmap, so that offline ltgen methods can iterate the lines
+multiple times without keeping them all in RAM.
+"""
+
+import sys
+import mmap
+import pickle
+import marshal
+import datetime
+import bisect
+import logging
+import tempfile
+from array import array
+from collections.abc import Mapping, ItemsView, ValuesView
+
+_logger = logging.getLogger(__package__)
+
+_MARSHAL = b"m"
+_PICKLE = b"p"
+_EPOCH = datetime.datetime(1970, 1, 1)
+_USEC = datetime.timedelta(microseconds=1)
+
+
+class ParsedLine(Mapping):
+    """Compact read-only form of a parsed line (dict given by log2seq).
+
+    Only timestamp, host, words, symbols (and lid if given) are kept,
+    and they are accessed with the keys as the dict. The raw message
+    is dropped, so ltgen methods using it (i.e., import_ext)
+    do not work with this form.
+    Words and symbols are tuples, and the strings (also host names)
+    are interned to share the words repeated in log messages.
+
+    Args:
+        timestamp (datetime.datetime)
+        host (str)
+        words (Sequence[str])
+        symbols (Sequence[str])
+        lid (int, optional)
+    """
+
+    __slots__ = ("timestamp", "host", "words", "symbols", "lid")
+
+    def __init__(self, timestamp, host, words, symbols, lid=None):
+        self.timestamp = timestamp
+        self.host = sys.intern(host) if isinstance(host, str) else host
+        self.words = tuple(sys.intern(w) for w in words)
+        self.symbols = tuple(sys.intern(sym) for sym in symbols)
+        self.lid = lid
+
+    @classmethod
+    def from_pline(cls, pline):
+        """Return the compact form of a parsed line (dict)."""
+        return cls(pline["timestamp"], pline["host"], pline["words"],
+                   pline["symbols"], pline.get("lid"))
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            val = getattr(self, key)
+            if val is not None or key != "lid":
+                return val
+        raise KeyError(key)
+
+    def __iter__(self):
+        for key in self.__slots__:
+            if key != "lid" or self.lid is not None:
+                yield key
+
+    def __len__(self):
+        return len(self.__slots__) - (self.lid is None)
+
+    def __reduce__(self):
+        return self.__class__, (self.timestamp, self.host, self.words,
+                                self.symbols, self.lid)
+
+    def __repr__(self):
+        return "{0}({1})".format(self.__class__.__name__, dict(self))
+
+
+class PlineCodec:
+    """Encoder of parsed lines into compact bytes.
+
+    Values of the lines with the same type and keys as the first line
+    are encoded with marshal (naive timestamps in microseconds),
+    and the other lines are pickled. None is encoded into empty bytes.
+
+    Args:
+        state (tuple, optional): The state of another codec
+            to decode the bytes given by it.
+    """
+
+    def __init__(self, state=None):
+        self._pline_type = None
+        self._pline_keys = None
+        self._dt_index = ()
+        if state is not None and state[1] is not None:
+            compact, keys, dt_index = state
+            self._pline_type = ParsedLine if compact else dict
+            self._pline_keys = tuple(keys)
+            self._dt_index = tuple(dt_index)
+
+    @property
+    def state(self):
+        """tuple: Format of the lines given by the first line,
+        serializable with marshal."""
+        return (self._pline_type is ParsedLine, self._pline_keys,
+                self._dt_index)
+
+    def encode(self, pline):
+        if pline is None:
+            return b""
+        if self._pline_keys is None:
+            self._pline_type = type(pline)
+            self._pline_keys = tuple(pline.keys())
+            self._dt_index = tuple(
+                idx for idx, val in enumerate(pline.values())
+                if isinstance(val, datetime.datetime) and val.tzinfo is None)
+        if type(pline) is self._pline_type and \
+                tuple(pline.keys()) == self._pline_keys:
+            values = list(pline.values())
+            try:
+                for idx in self._dt_index:
+                    if values[idx].tzinfo is not None:
+                        raise TypeError
+                    values[idx] = (values[idx] - _EPOCH) // _USEC
+                return _MARSHAL + marshal.dumps(tuple(values))
+            except (TypeError, AttributeError, ValueError):
+                pass
+        return _PICKLE + pickle.dumps(pline,
+                                      protocol=pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data):
+        if len(data) == 0:
+            return None
+        elif data[0] == _PICKLE[0]:
+            return pickle.loads(data[1:])
+        values = list(marshal.loads(data[1:]))
+        for idx in self._dt_index:
+            values[idx] = _EPOCH + datetime.timedelta(microseconds=values[idx])
+        if self._pline_type is ParsedLine:
+            return ParsedLine(**dict(zip(self._pline_keys, values)))
+        return dict(zip(self._pline_keys, values))
+
+
+class _ItemsView(ItemsView):
+
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+
+class _ValuesView(ValuesView):
+
+    def __iter__(self):
+        for _, pline in self._mapping.iter_items():
+            yield pline
+
+
+class PlineStore(Mapping):
+    """Mapping of message ids to parsed lines, filled in the
+    increasing order of the ids and spilled to a scratch file
+    if the encoded records exceed memory_limit bytes.
+
+    Parsed lines are decoded into new dicts every time they are read,
+    so changes to the given dicts are not reflected.
+
+    Args:
+        memory_limit (int): Maximum size (bytes) of the encoded
+            records on memory. If 0, the records are never spilled.
+        dirname (str, optional): Directory of the scratch file.
+            If None, the default temporary directory is used.
+    """
+
+    def __init__(self, memory_limit=0, dirname=None):
+        self._memory_limit = memory_limit
+        self._dirname = dirname
+        self._keys = array("q")
+        self._offsets = array("q", [0])
+        self._buf = bytearray()
+        self._fd = None
+        self._mm = None
+        self._codec = PlineCodec()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __contains__(self, key):
+        return self._index(key) is not None
+
+    def __getitem__(self, key):
+        idx = self._index(key)
+        if idx is None:
+            raise KeyError(key)
+        return self._decode(self._buffer()[self._offsets[idx]:
+                                           self._offsets[idx + 1]])
+
+    def __setitem__(self, key, pline):
+        self.add(key, pline)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def items(self):
+        return _ItemsView(self)
+
+    def values(self):
+        return _ValuesView(self)
+
+    @property
+    def spilled(self):
+        """bool: True if the records are stored in the scratch file."""
+        return self._fd is not None
+
+    def add(self, key, pline):
+        """Add a parsed line.
+
+        Args:
+            key (int): Message id, larger than those already added.
+            pline (dict): Parsed line.
+        """
+        if len(self._keys) > 0 and key <= self._keys[-1]:
+            raise ValueError("keys of PlineStore must be added "
+                             "in increasing order")
+        data = self._encode(pline)
+        if self._fd is None:
+            if 0 < self._memory_limit < len(self._buf) + len(data):
+                self._spill()
+        if self._fd is None:
+            self._buf += data
+        else:
+            self._fd.write(data)
+        self._keys.append(key)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def iter_items(self):
+        """Yield message ids and parsed lines in the order of addition."""
+        buf = self._buffer()
+        offsets = self._offsets
+        for idx, key in enumerate(self._keys):
+            yield key, self._decode(buf[offsets[idx]:offsets[idx + 1]])
+
+    def close(self):
+        """Release the memory buffer and remove the scratch file."""
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+        self._buf = bytearray()
+        self._keys = array("q")
+        self._offsets = array("q", [0])
+
+    def _index(self, key):
+        idx = bisect.bisect_left(self._keys, key)
+        if idx < len(self._keys) and self._keys[idx] == key:
+            return idx
+        return None
+
+    def _encode(self, pline):
+        return self._codec.encode(pline)
+
+    def _decode(self, data):
+        return self._codec.decode(data)
+
+    def _spill(self):
+        self._fd = tempfile.TemporaryFile(prefix="amulog_pline_",
+                                          dir=self._dirname)
+        self._fd.write(self._buf)
+        self._buf = bytearray()
+        _logger.info("parsed lines exceed {0} bytes, spilled to "
+                     "a scratch file".format(self._memory_limit))
+
+    def _buffer(self):
+        if self._fd is None:
+            return self._buf
+        size = self._offsets[-1]
+        if self._mm is None or len(self._mm) < size:
+            self._fd.flush()
+            if self._mm is not None:
+                self._mm.close()
+            self._mm = mmap.mmap(self._fd.fileno(), size,
+                                 access=mmap.ACCESS_READ)
+        return self._mm
+
+
+def init_pline_store(conf):
+    """Return a container of parsed lines for offline processing:
+    a PlineStore if manager.offline_pline_memory is given, or a dict."""
+    memory_limit = conf.getint("manager", "offline_pline_memory")
+    if memory_limit <= 0:
+        return {}
+    dirname = conf.get("manager", "offline_pline_dir").strip()
+    return PlineStore(memory_limit, dirname if dirname else None)
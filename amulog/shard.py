@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Host-sharded online processing (manager.shard_process).
+
+Parsed messages are partitioned by the hash of their host names
+into shard processes. Every shard process runs its own LTManager,
+so that stateful ltgen methods (e.g., drain) work on multiple cores,
+and stores the messages into a temporary sqlite DB of the shard.
+After all messages are processed, the templates of the shards are
+reconciled into the global DB: identical templates, and templates
+covered by more general ones (with variables on the differing words),
+are merged into one log template. Then the messages of the shards
+are copied into the global DB in bulk with the reconciled ltids.
+
+The internal data of template generation (manager.indata_filename)
+is not reproduced from the shards, and not written in sharded processing
+(removed if DB is reset). The following db-add restarts template
+generation, giving the reconciled templates in DB to the messages
+matching them (see LTManager.load_internal_data).
+"""
+
+import os
+import copy
+import heapq
+import queue
+import shutil
+import logging
+import tempfile
+import zlib
+from collections import defaultdict
+
+from . import lt_common
+
+_logger = logging.getLogger(__package__)
+
+SHARD_QUEUE_BATCHES = 4
+INSERT_CHUNK_ROWS = 10000
+
+
+def shard_index(host, n_shard):
+    """Return the shard of a host, stable over processes and runs."""
+    return zlib.crc32(str(host).encode("utf-8")) % n_shard
+
+
+def _shard_conf(conf, dirname, sid):
+    # shard DB and outputs in the temporary directory
+    shard_conf = copy.deepcopy(conf)
+    prefix = os.path.join(dirname, "shard{0}".format(sid))
+    shard_conf["database"]["database"] = "sqlite3"
+    shard_conf["database"]["sqlite3_filename"] = prefix + ".db"
+    shard_conf["manager"]["indata_filename"] = prefix + ".dump"
+    shard_conf["manager"]["checkpoint_interval"] = "0"
+    shard_conf["manager"]["fail_output"] = prefix + ".fail"
+    shard_conf["manager"]["fail_output_compress"] = "false"
+    shard_conf["manager"]["fail_output_max_bytes"] = "0"
+    shard_conf["manager"]["metrics_output"] = ""
+    # groups are made for the reconciled templates
+    shard_conf["log_template"]["ltgroup_alg"] = "none"
+    return shard_conf
+
+
+def _shard_worker(shard_conf, que):
+    import signal
+    # stopped with the end of input from the main process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    from . import log_db
+    from . import manager
+    # new DB in the temporary directory
+    ld = log_db.LogData(shard_conf, edit=True, reset_db=False)
+    ltm = manager.LTManager(shard_conf, ld.db, ld.lttable, reset_db=True)
+    while True:
+        batch = que.get()
+        if batch is None:
+            break
+        for line, pline in batch:
+            ltm.process_pline(pline, line)
+    ltm.commit_db()
+
+
+def _put(que, proc, item):
+    while True:
+        try:
+            que.put(item, timeout=1)
+            return
+        except queue.Full:
+            if not proc.is_alive():
+                raise RuntimeError("shard process {0} exited "
+                                   "unexpectedly".format(proc.name))
+
+
+def _iter_input(conf, targets, ltm):
+    # yield lines with parsed lines (None if failed) and failure reasons
+    from . import manager
+    if manager._input_time_ordered(conf):
+        yield from manager.iter_plines_time_ordered(conf, targets)
+        return
+
+    iterobj = ((None, None, line)
+               for line in manager.iter_lines_conf(conf, targets))
+    n_parse_proc = conf.getint("manager", "online_parse_process")
+    if n_parse_proc > 0:
+        batchsize = conf.getint("manager", "online_batchsize")
+        for _, _, line, pline, reason in manager.iter_plines_pipeline(
+                conf, iterobj, n_parse_proc, batchsize):
+            yield line, pline, reason
+    else:
+        for _, _, line in iterobj:
+            yield (line,) + ltm._parse_line(line)
+
+
+def _dispatch(conf, targets, ltm, l_que, l_proc):
+    n_shard = len(l_que)
+    batchsize = conf.getint("manager", "online_batchsize")
+    d_batch = defaultdict(list)
+    for line, pline, reason in _iter_input(conf, targets, ltm):
+        if pline is None:
+            ltm.process_pline(pline, line, reason=reason)
+            continue
+        sid = shard_index(pline["host"], n_shard)
+        batch = d_batch[sid]
+        batch.append((line, pline))
+        if len(batch) >= batchsize:
+            _put(l_que[sid], l_proc[sid], batch)
+            d_batch[sid] = []
+    for sid, batch in d_batch.items():
+        if len(batch) > 0:
+            _put(l_que[sid], l_proc[sid], batch)
+
+
+def merge_templates(l_tpl, l_fixed=()):
+    """Find identical or mergeable templates.
+
+    A template is merged into another one of the same length
+    if every word is same or a variable in the other one.
+    Templates with more variables are considered first,
+    so that the specific templates are merged into the general ones.
+
+    Args:
+        l_tpl (List[List[str]]): Templates to merge.
+        l_fixed (List[List[str]], optional): Templates to keep
+            (e.g., already stored in DB). Templates in l_tpl
+            are merged into them if possible.
+
+    Returns:
+        Tuple[List[int], List[List[str]]]: Indexes of the merged templates
+        for the templates in l_tpl, and the merged templates
+        (starting with l_fixed).
+    """
+    merged = []
+    d_length = defaultdict(list)
+    d_exact = {}
+
+    def _add(tpl):
+        idx = len(merged)
+        merged.append(tpl)
+        d_length[len(tpl)].append(idx)
+        d_exact.setdefault(tuple(tpl), idx)
+        return idx
+
+    def _covers(general, tpl):
+        return all(w1 == w2 or w1 == lt_common.REPLACER
+                   for w1, w2 in zip(general, tpl))
+
+    for tpl in l_fixed:
+        _add(tpl)
+    ret = [None] * len(l_tpl)
+    order = sorted(range(len(l_tpl)),
+                   key=lambda i: -l_tpl[i].count(lt_common.REPLACER))
+    for i in order:
+        tpl = l_tpl[i]
+        idx = d_exact.get(tuple(tpl))
+        if idx is None:
+            for cand in d_length[len(tpl)]:
+                if _covers(merged[cand], tpl):
+                    idx = cand
+                    break
+            else:
+                idx = _add(tpl)
+        ret[i] = idx
+    return ret, merged
+
+
+def reconcile_shards(ltm, ld, l_shard_ld):
+    """Merge templates and messages of the shards into the global DB.
+
+    Args:
+        ltm (manager.LTManager): LTManager of the global DB.
+        ld (log_db.LogData): The global DB.
+        l_shard_ld (List[log_db.LogData]): DBs of the shards.
+    """
+    # templates
+    l_key = []
+    l_tpl = []
+    for sid, shard_ld in enumerate(l_shard_ld):
+        for ltline in shard_ld.iter_lt():
+            l_key.append((sid, ltline))
+            l_tpl.append(ltline.ltw)
+    l_existing = list(ld.lttable)
+    l_index, merged = merge_templates(
+        l_tpl, [ltline.ltw for ltline in l_existing])
+
+    d_members = defaultdict(list)
+    for key, idx in zip(l_key, l_index):
+        d_members[idx].append(key)
+    d_ltid = {}  # key: (sid, shard ltid), val: global ltid
+    for idx, tpl in enumerate(merged):
+        members = d_members.get(idx, [])
+        count = sum(ltline.count for _, ltline in members)
+        if idx < len(l_existing):
+            if count == 0:
+                continue
+            ltline = l_existing[idx]
+            ltm.replace_lt(ltline.ltid, ltline.ltw, None,
+                           ltline.count + count)
+        else:
+            ltline = ltm.add_lt(tpl, members[0][1].lts, count,
+                                add_group=True)
+        for sid, shard_ltline in members:
+            d_ltid[(sid, shard_ltline.ltid)] = ltline.ltid
+    _logger.info("reconciled {0} shard templates into {1} templates "
+                 "({2} new)".format(len(l_tpl), len(merged),
+                                    len(merged) - len(l_existing)))
+
+    # messages, renumbered in the order of timestamps
+    from . import manager
+    tablename_log = ld.db.tablename_log
+    tablename_repeat = ld.db.tablename_repeat
+    l_repeat = []
+    for shard_ld in l_shard_ld:
+        if tablename_repeat in shard_ld.db.existing_tables():
+            l_repeat.append({row[0]: row[1:] for row
+                             in shard_ld.db.iter_table_rows(tablename_repeat)})
+        else:
+            l_repeat.append({})
+    if any(len(d) > 0 for d in l_repeat) and \
+            tablename_repeat not in ld.db.existing_tables():
+        ld.db.init_optional_table(tablename_repeat)
+
+    def _iter_shard_rows(sid, shard_ld):
+        for lid, ltid, dt, host, words in \
+                shard_ld.db.iter_table_rows(tablename_log):
+            yield dt, sid, lid, d_ltid[(sid, ltid)], host, words
+
+    lid = ld.count_lines()
+    iterobj = heapq.merge(*[_iter_shard_rows(sid, shard_ld) for sid, shard_ld
+                            in enumerate(l_shard_ld)])
+    for chunk in manager.iter_chunks(iterobj, INSERT_CHUNK_ROWS):
+        rows = []
+        repeat_rows = []
+        for dt, sid, shard_lid, ltid, host, words in chunk:
+            lid += 1
+            rows.append((lid, ltid, dt, host, words))
+            if shard_lid in l_repeat[sid]:
+                repeat_rows.append((lid,) + l_repeat[sid][shard_lid])
+        ld.db.add_table_rows(tablename_log, rows)
+        if len(repeat_rows) > 0:
+            ld.db.add_table_rows(tablename_repeat, repeat_rows)
+    ld.commit_db()
+
+    # lines failed in shards
+    for shard_ld in l_shard_ld:
+        fail_fn = shard_ld.conf["manager"]["fail_output"]
+        if os.path.exists(fail_fn):
+            from . import fail_sink
+            with open(fail_fn, "r") as f:
+                for line in f:
+                    ltm.fail_dump(line, fail_sink.FAIL_NO_TPL)
+
+
+def process_files_sharded(conf, targets, reset_db):
+    """Add log messages to DB from files in host-sharded processes.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        targets (List[str]): A sequence of filepaths to process.
+        reset_db (bool): True if DB needs to reset before adding.
+    """
+    from multiprocessing import Process, Queue
+    from . import log_db
+    from . import manager
+
+    n_shard = conf.getint("manager", "shard_process")
+    shard_dir = conf.get("manager", "shard_dir").strip()
+    _logger.info("amulog online processing in {0} shards".format(n_shard))
+
+    ld = log_db.LogData(conf, edit=True, reset_db=reset_db)
+    # the generator state of the global manager is empty, never written
+    global_conf = copy.deepcopy(conf)
+    global_conf["manager"]["checkpoint_interval"] = "0"
+    ltm = manager.LTManager(global_conf, ld.db, ld.lttable,
+                            reset_db=reset_db)
+    if reset_db:
+        # the internal data for the DB before reset
+        ltm.remove_internal_data()
+    dirname = tempfile.mkdtemp(prefix="amulog_shard_",
+                               dir=shard_dir if shard_dir else None)
+    try:
+        l_shard_conf = [_shard_conf(conf, dirname, sid)
+                        for sid in range(n_shard)]
+        l_que = [Queue(maxsize=SHARD_QUEUE_BATCHES) for _ in range(n_shard)]
+        l_proc = [Process(target=_shard_worker, args=(shard_conf, que),
+                          name="shard{0}".format(sid))
+                  for sid, (shard_conf, que)
+                  in enumerate(zip(l_shard_conf, l_que))]
+        for proc in l_proc:
+            proc.start()
+        try:
+            _dispatch(conf, targets, ltm, l_que, l_proc)
+        except KeyboardInterrupt:
+            # messages already dispatched are stored
+            pass
+        except BaseException:
+            for proc in l_proc:
+                proc.terminate()
+            raise
+        for que, proc in zip(l_que, l_proc):
+            _put(que, proc, None)
+        for proc in l_proc:
+            proc.join()
+            if proc.exitcode != 0:
+                raise RuntimeError("shard process {0} failed "
+                                   "(exitcode {1})".format(proc.name,
+                                                           proc.exitcode))
+
+        l_shard_ld = [log_db.LogData(shard_conf)
+                      for shard_conf in l_shard_conf]
+        reconcile_shards(ltm, ld, l_shard_ld)
+    finally:
+        shutil.rmtree(dirname, ignore_errors=True)
+
+    ltm.process_online_end()
+    ltm.commit_db()
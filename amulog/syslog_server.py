@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Syslog receiver to add log messages to DB directly (command serve-syslog).
+
+Messages are received with asyncio over UDP and TCP
+(RFC6587 octet counting or newline-delimited framing).
+RFC5424 messages are converted into a line of
+"YYYY-MM-DD HH:MM:SS host app[procid]: message",
+and the priority part is removed from the other (RFC3164) messages,
+so that the lines are parsed with the log2seq parser as log files.
+
+Received lines are passed in batches through a bounded queue
+to a writer thread, which keeps one LTManager and DB connection.
+If the writer falls behind and the queue is full, TCP connections
+stop being read (backpressure) and UDP batches are dropped
+(counted in the statistics). Broken TCP frames (too long, with invalid
+length, or cut by the peer) are also dropped, and the connection
+is closed.
+"""
+
+import re
+import queue
+import asyncio
+import datetime
+import logging
+import threading
+from collections import Counter
+
+_logger = logging.getLogger(__package__)
+
+_PRI = re.compile(r"^<(\d{1,3})>")
+NILVALUE = "-"
+
+STAT_RECEIVED = "received"
+STAT_DROPPED = "dropped"
+STAT_PROCESSED = "processed"
+
+
+def _parse_5424_timestamp(ts):
+    if ts == NILVALUE:
+        return datetime.datetime.now()
+    if ts.endswith("Z"):
+        ts = ts[:-1] + "+00:00"
+    dt = datetime.datetime.fromisoformat(ts)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+def _split_5424_sd(rest):
+    # return message after structured data
+    if rest.startswith(NILVALUE):
+        return rest[len(NILVALUE):].lstrip(" ")
+    i = 0
+    in_param = False
+    while i < len(rest):
+        c = rest[i]
+        if c == "\\":
+            i += 1
+        elif c == '"':
+            in_param = not in_param
+        elif c == "]" and not in_param:
+            if i + 1 >= len(rest) or rest[i + 1] != "[":
+                return rest[i + 1:].lstrip(" ")
+        i += 1
+    return ""
+
+
+def convert_message(msg):
+    """Convert a received syslog message into a log line.
+
+    Args:
+        msg (str): A syslog message in RFC3164 or RFC5424.
+
+    Returns:
+        str: A log line without priority part.
+    """
+    msg = msg.rstrip("\r\n")
+    mo = _PRI.match(msg)
+    if mo is None:
+        return msg
+    body = msg[mo.end():]
+    if not body.startswith("1 "):
+        # RFC3164
+        return body
+
+    # RFC5424: VERSION TIMESTAMP HOSTNAME APP-NAME PROCID MSGID SD [MSG]
+    fields = body.split(" ", 6)
+    if len(fields) < 7:
+        fields += [NILVALUE] * (7 - len(fields))
+    _, ts, host, app, procid, _, rest = fields
+    try:
+        dt = _parse_5424_timestamp(ts)
+    except ValueError:
+        return body
+    message = _split_5424_sd(rest)
+    if message.startswith("\ufeff"):
+        message = message[1:]
+    if app != NILVALUE:
+        if procid != NILVALUE:
+            app = "{0}[{1}]".format(app, procid)
+        message = "{0}: {1}".format(app, message)
+    return "{0} {1} {2}".format(dt.strftime("%Y-%m-%d %H:%M:%S"),
+                                host, message)
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, server):
+        self._server = server
+
+    def datagram_received(self, data, addr):
+        for msg in data.decode("utf-8", "ignore").splitlines():
+            if msg.strip() != "":
+                self._server.add_message(msg)
+
+
+class SyslogServer:
+    """Receive syslog messages and add them to DB.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        reset_db (bool): True if DB needs to reset before adding.
+
+    Attributes:
+        stats (collections.Counter): Numbers of received, dropped
+            and processed messages.
+    """
+
+    def __init__(self, conf, reset_db=False):
+        self._conf = conf
+        self._reset_db = reset_db
+        self._host = conf.get("serve_syslog", "host")
+        self._udp_port = conf.getint("serve_syslog", "udp_port")
+        self._tcp_port = conf.getint("serve_syslog", "tcp_port")
+        self._batchsize = conf.getint("serve_syslog", "batchsize")
+        self._flush_interval = conf.getfloat("serve_syslog", "flush_interval")
+        self._commit_interval = conf.getfloat("serve_syslog",
+                                              "commit_interval")
+        self._queue = queue.Queue(maxsize=conf.getint("serve_syslog",
+                                                      "queue_size"))
+        self._buf = []
+        self._writer = None
+        self._transports = []
+        self._servers = []
+        self._tasks = []
+        self._connections = set()
+        self.stats = Counter()
+
+    @property
+    def addresses(self):
+        """Dict[str, tuple]: Bound address for each protocol."""
+        ret = {}
+        for transport in self._transports:
+            ret["udp"] = transport.get_extra_info("sockname")
+        for server in self._servers:
+            ret["tcp"] = server.sockets[0].getsockname()
+        return ret
+
+    def add_message(self, msg):
+        """Add a message received over UDP.
+        Batches are dropped if the queue is full."""
+        self.stats[STAT_RECEIVED] += 1
+        self._buf.append(convert_message(msg))
+        if len(self._buf) >= self._batchsize:
+            batch, self._buf = self._buf, []
+            try:
+                self._queue.put_nowait(batch)
+            except queue.Full:
+                self.stats[STAT_DROPPED] += len(batch)
+
+    async def _add_message_wait(self, msg):
+        # for TCP: wait for the writer if the queue is full,
+        # and the sender also waits as the connection is not read
+        self.stats[STAT_RECEIVED] += 1
+        self._buf.append(convert_message(msg))
+        if len(self._buf) >= self._batchsize:
+            await self._flush()
+
+    async def _flush(self):
+        batch, self._buf = self._buf, []
+        if len(batch) > 0:
+            try:
+                await self._put_batch(batch)
+            except asyncio.CancelledError:
+                # keep the batch to be flushed in stopping
+                self._buf = batch + self._buf
+                raise
+
+    async def _put_batch(self, batch):
+        while True:
+            if not self._writer.is_alive():
+                raise RuntimeError("syslog writer thread stopped")
+            try:
+                self._queue.put_nowait(batch)
+                return
+            except queue.Full:
+                await asyncio.sleep(self._flush_interval / 10)
+
+    def _drop_frame(self, reason):
+        # for TCP: a broken frame is counted as a dropped message
+        self.stats[STAT_RECEIVED] += 1
+        self.stats[STAT_DROPPED] += 1
+        _logger.warning("syslog TCP frame dropped ({0}), "
+                        "connection closed".format(reason))
+
+    async def _handle_tcp(self, reader, writer):
+        self._connections.add(asyncio.current_task())
+        try:
+            while True:
+                c = b""
+                try:
+                    c = await reader.readexactly(1)
+                    if c.isdigit():
+                        # octet counting: MSG-LEN SP SYSLOG-MSG
+                        length = int(c + (await reader.readuntil(b" "))[:-1])
+                        data = await reader.readexactly(length)
+                    else:
+                        # non-transparent framing with LF
+                        data = c + await reader.readuntil(b"\n")
+                except asyncio.IncompleteReadError as e:
+                    # connection closed
+                    data = c + e.partial
+                    if data.strip() == b"":
+                        pass
+                    elif c.isdigit():
+                        # in the middle of an octet-counted frame
+                        self._drop_frame("incomplete frame")
+                    else:
+                        # the last LF-framed message without trailing LF
+                        await self._add_message_wait(
+                            data.decode("utf-8", "ignore"))
+                    break
+                except asyncio.LimitOverrunError:
+                    self._drop_frame("frame exceeding the stream limit")
+                    break
+                except ValueError:
+                    self._drop_frame("invalid frame length")
+                    break
+                msg = data.decode("utf-8", "ignore")
+                if msg.strip() != "":
+                    await self._add_message_wait(msg)
+        finally:
+            writer.close()
+            self._connections.discard(asyncio.current_task())
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            await self._flush()
+
+    def _write(self):
+        # writer thread: DB connections are made in this thread
+        from . import log_db
+        from . import manager
+        ld = log_db.LogData(self._conf, edit=True, reset_db=self._reset_db)
+        ltm = manager.LTManager(self._conf, ld.db, ld.lttable,
+                                reset_db=self._reset_db)
+        ltm.load_internal_data()
+        n_uncommitted = 0
+        try:
+            while True:
+                try:
+                    batch = self._queue.get(timeout=self._commit_interval)
+                except queue.Empty:
+                    if n_uncommitted > 0:
+                        ltm.commit_db()
+                        n_uncommitted = 0
+                    continue
+                if batch is None:
+                    break
+                for line in batch:
+                    ltm.process_line(line + "\n")
+                self.stats[STAT_PROCESSED] += len(batch)
+                n_uncommitted += len(batch)
+        finally:
+            ltm.process_online_end()
+            ltm.commit_db()
+            ltm.dump()
+
+    async def start(self):
+        """Start the writer thread and listen on configured ports."""
+        self._writer = threading.Thread(target=self._write,
+                                        name="amulog-syslog-writer")
+        self._writer.start()
+        loop = asyncio.get_running_loop()
+        if self._udp_port >= 0:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _UDPProtocol(self),
+                local_addr=(self._host, self._udp_port))
+            self._transports.append(transport)
+        if self._tcp_port >= 0:
+            server = await asyncio.start_server(self._handle_tcp,
+                                                self._host, self._tcp_port)
+            self._servers.append(server)
+        self._tasks.append(asyncio.ensure_future(self._flush_periodically()))
+        _logger.info("amulog serve-syslog on {0}".format(self.addresses))
+
+    async def stop(self):
+        """Stop listening, and wait for the writer
+        to store all received messages."""
+        for transport in self._transports:
+            transport.close()
+        for server in self._servers:
+            server.close()
+        if len(self._connections) > 0:
+            # wait for senders to close the connections
+            _, pending = await asyncio.wait(list(self._connections),
+                                            timeout=self._commit_interval)
+            for task in pending:
+                task.cancel()
+        for server in self._servers:
+            await server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await self._flush()
+        await self._put_batch(None)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._writer.join)
+        _logger.info("amulog serve-syslog: {0} received, {1} dropped, "
+                     "{2} processed".format(self.stats[STAT_RECEIVED],
+                                            self.stats[STAT_DROPPED],
+                                            self.stats[STAT_PROCESSED]))
+
+    async def serve(self, stop_event=None):
+        """Run until stop_event is set (or forever if not given)."""
+        await self.start()
+        try:
+            if stop_event is None:
+                stop_event = asyncio.Event()
+            await stop_event.wait()
+        finally:
+            await self.stop()
+
+
+def serve_syslog(conf, reset_db=False):
+    """Receive syslog messages and add them to DB until SIGINT or SIGTERM.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        reset_db (bool): True if DB needs to reset before adding.
+    """
+    import signal
+
+    async def _main():
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+        server = SyslogServer(conf, reset_db=reset_db)
+        await server.serve(stop_event)
+
+    asyncio.run(_main())
@@ -2,6 +2,8 @@ import os
 import datetime
 import random
 import re
+import tempfile
+import unittest
 import configparser
 import numpy as np
 
@@ -212,6 +214,45 @@ class TestLogGenerator:
                                       line[1], line[2])) + "\n")
 
 
+class DBTestCase(unittest.TestCase):
+    """Base class of test cases running amulog on a generated log file.
+
+    The class config (cls._conf) points src_path, the sqlite DB and
+    the template generator dump to temporary files, which are removed
+    in tearDownClass. Tests should edit a copy.deepcopy of the config.
+    """
+
+    _path_testlog = None
+    _path_testdb = None
+    _path_ltgendump = None
+    _conf = None
+
+    @classmethod
+    def setUpClass(cls):
+        fd_testlog, cls._path_testlog = tempfile.mkstemp()
+        os.close(fd_testlog)
+        fd_testdb, cls._path_testdb = tempfile.mkstemp()
+        os.close(fd_testdb)
+        fd_ltgendump, cls._path_ltgendump = tempfile.mkstemp()
+        os.close(fd_ltgendump)
+
+        cls._conf = config.open_config(verbose=False)
+        cls._conf['general']['src_path'] = cls._path_testlog
+        cls._conf['database']['sqlite3_filename'] = cls._path_testdb
+        cls._conf['manager']['indata_filename'] = cls._path_ltgendump
+
+        tlg = TestLogGenerator(DEFAULT_CONFIG, seed=3)
+        tlg.dump_log(cls._path_testlog)
+
+    @classmethod
+    def tearDownClass(cls):
+        # the DB and the dump can be removed in tests (e.g., in resetting)
+        for path in (cls._path_testlog, cls._path_testdb,
+                     cls._path_ltgendump):
+            if os.path.exists(path):
+                os.remove(path)
+
+
 def generate_testdata(fn=None, output=None, seed=None):
     if fn is None:
         fn = DEFAULT_CONFIG
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import copy
+import glob
+import unittest
+
+from amulog import log_db
+from amulog import manager
+
+from amulog import testutil
+
+
+class TestCheckpoint(testutil.DBTestCase):
+
+    def test_checkpoint(self):
+        conf = copy.deepcopy(self._conf)
+        conf['manager']['checkpoint_interval'] = "0.000001"
+        conf['manager']['checkpoint_compact'] = "3"
+        with open(self._path_testlog) as f:
+            lines = f.readlines()
+
+        ld = log_db.LogData(conf, edit=True, reset_db=True)
+        ltm = manager.LTManager(conf, ld.db, ld.lttable, reset_db=True)
+        for i, line in enumerate(lines):
+            ltm.process_line(line)
+            if (i + 1) % 500 == 0:
+                ltm.commit_db()
+        ltm.commit_db()
+        # interrupted without dump
+        self.assertTrue(len(glob.glob(self._path_ltgendump + ".delta.*")) > 0)
+        table = ltm.template_table
+        d_tpl = {tid: (table[tid], table.get_ltid(tid))
+                 for tid in table.tids()}
+
+        ld = log_db.LogData(conf, edit=True)
+        ltm = manager.LTManager(conf, ld.db, ld.lttable)
+        ltm.load_internal_data()
+        table = ltm.template_table
+        self.assertEqual({tid: (table[tid], table.get_ltid(tid))
+                          for tid in table.tids()}, d_tpl)
+
+        # restored generator classifies the lines into existing templates
+        for line in lines[:1000]:
+            ltm.process_line(line)
+        self.assertEqual(len(ltm.template_table), len(d_tpl))
+        ltm.dump()
+        self.assertEqual(glob.glob(self._path_ltgendump + ".delta.*"), [])
+
+    def test_makedb_offline_append(self):
+        conf = copy.deepcopy(self._conf)
+        targets = [self._path_testlog]
+        manager.process_files_offline(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        l_lt = [(str(lt), lt.count) for lt in ld.iter_lt()]
+
+        # templates in the loaded internal data are not added again
+        manager.process_files_offline(conf, targets, reset_db=False)
+        ld = log_db.LogData(conf)
+        self.assertEqual(ld.count_lines(), 2 * 6539)
+        self.assertEqual([(str(lt), lt.count) for lt in ld.iter_lt()],
+                         [(ltstr, 2 * cnt) for ltstr, cnt in l_lt])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,45 +2,19 @@
 # coding: utf-8
 
 import os
+import copy
 import unittest
 import tempfile
 
 from amulog import common
-from amulog import config
 from amulog import log_db
+from amulog import lt_common
 from amulog import manager
 
 from amulog import testutil
 
 
-class TestDB(unittest.TestCase):
-
-    _path_testlog = None
-    _path_testdb = None
-    _path_ltgendump = None
-
-    @classmethod
-    def setUpClass(cls):
-        fd_testlog, cls._path_testlog = tempfile.mkstemp()
-        os.close(fd_testlog)
-        fd_testdb, cls._path_testdb = tempfile.mkstemp()
-        os.close(fd_testdb)
-        fd_ltgendump, cls._path_ltgendump = tempfile.mkstemp()
-        os.close(fd_ltgendump)
-
-        cls._conf = config.open_config(verbose=False)
-        cls._conf['general']['src_path'] = cls._path_testlog
-        cls._conf['database']['sqlite3_filename'] = cls._path_testdb
-        cls._conf['manager']['indata_filename'] = cls._path_ltgendump
-
-        tlg = testutil.TestLogGenerator(testutil.DEFAULT_CONFIG, seed=3)
-        tlg.dump_log(cls._path_testlog)
-
-    @classmethod
-    def tearDownClass(cls):
-        os.remove(cls._path_testlog)
-        os.remove(cls._path_testdb)
-        os.remove(cls._path_ltgendump)
+class TestDB(testutil.DBTestCase):
 
     def test_makedb_online(self):
         from amulog import __main__ as amulog_main
@@ -71,8 +45,7 @@ class TestDB(unittest.TestCase):
                          "(groups: {0})".format(ltg_num)))
 
     def test_makedb_parallel(self):
-        import copy
-        conf = copy.copy(self._conf)
+        conf = copy.deepcopy(self._conf)
         conf["manager"]["n_process"] = "2"
         conf["log_template"]["lt_methods"] = "re"
         conf["log_template_re"]["variable_rule"] = \
@@ -93,6 +66,284 @@ class TestDB(unittest.TestCase):
                         ("log template generation fails? "
                          "(groups: {0})".format(ltg_num)))
 
+    def test_makedb_offline_chunked(self):
+        conf = copy.deepcopy(self._conf)
+        conf["log_template"]["lt_methods"] = "re"
+        conf["log_template_re"]["variable_rule"] = \
+            common.filepath_local(__file__, "test_re.conf")
+
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_offline(conf, targets, reset_db=True)
+        l_lt = [str(lt) for lt in log_db.LogData(conf).iter_lt()]
+
+        conf["manager"]["offline_batchsize"] = "500"
+        manager.process_files_offline(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        self.assertEqual(ld.count_lines(), 6539)
+        self.assertEqual([str(lt) for lt in ld.iter_lt()], l_lt)
+        l_lm = [str(lm) for lm in ld.iter_all()]
+
+        conf["manager"]["n_process"] = "2"
+        conf["manager"]["offline_inflight"] = "1"
+        manager.process_files_offline(conf, targets, reset_db=True,
+                                      parallel=True)
+        ld = log_db.LogData(conf)
+        self.assertEqual([str(lt) for lt in ld.iter_lt()], l_lt)
+        self.assertEqual([str(lm) for lm in ld.iter_all()], l_lm)
+
+    def test_makedb_parallel_hash_tid(self):
+        conf = copy.deepcopy(self._conf)
+        conf["log_template"]["lt_methods"] = "re"
+        conf["log_template_re"]["variable_rule"] = \
+            common.filepath_local(__file__, "test_re.conf")
+        conf["manager"]["n_process"] = "2"
+        conf["manager"]["offline_batchsize"] = "500"
+
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_offline(conf, targets, reset_db=True,
+                                      parallel=True)
+        ld = log_db.LogData(conf)
+        l_lt = [str(lt) for lt in ld.iter_lt()]
+        l_lm = [str(lm) for lm in ld.iter_all()]
+
+        conf["manager"]["template_id_hash"] = "true"
+        manager.process_files_offline(conf, targets, reset_db=True,
+                                      parallel=True)
+        ld = log_db.LogData(conf)
+        self.assertEqual([str(lt) for lt in ld.iter_lt()], l_lt)
+        self.assertEqual([str(lm) for lm in ld.iter_all()], l_lm)
+
+        table = lt_common.TemplateTable(hash_tid=True)
+        tid = table.add(["a", "**", "c"])
+        self.assertEqual(tid, lt_common.template_hash(["a", "**", "c"]))
+        self.assertEqual(table.get_tid(["a", "**", "c"]), tid)
+
+        # tid given by a worker is re-assigned if used for another template
+        tid_y = lt_common.template_hash(["y"])
+        table.add(["x"], tid_y)
+        tid = table.merge(["y"], tid_y)
+        self.assertNotEqual(tid, tid_y)
+        self.assertEqual(table.get_template(tid), ["y"])
+        self.assertEqual(table.merge(["y"], tid_y), tid)
+        self.assertEqual(table.merge(["x"], tid_y), tid_y)
+
+    def test_makedb_online_pipeline(self):
+        conf = copy.deepcopy(self._conf)
+
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_online(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        l_lt = [str(lt) for lt in ld.iter_lt()]
+        l_lm = [str(lm) for lm in ld.iter_all()]
+
+        conf['manager']['online_parse_process'] = "2"
+        conf['manager']['online_batchsize'] = "300"
+        manager.process_files_online(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        self.assertEqual([str(lt) for lt in ld.iter_lt()], l_lt)
+        self.assertEqual([str(lm) for lm in ld.iter_all()], l_lm)
+
+    def test_iter_lines_concurrent(self):
+        import gzip
+        import shutil
+        with open(self._path_testlog) as f:
+            lines = f.readlines()
+        dirname = tempfile.mkdtemp()
+        targets = []
+        for i in range(4):
+            fp = os.path.join(dirname, "part{0}".format(i))
+            if i % 2 == 0:
+                fp += ".gz"
+                f = gzip.open(fp, "wt")
+            else:
+                f = open(fp, "w")
+            with f:
+                f.writelines(lines[i::4])
+            targets.append(fp)
+
+        l_line = list(manager.iter_lines(targets))
+        self.assertEqual(len(l_line), len(lines))
+        self.assertEqual(list(manager.iter_lines(targets, n_reader=3)),
+                         l_line)
+        if shutil.which("gzip") is not None:
+            self.assertEqual(list(manager.iter_lines(
+                targets, n_reader=2, gzip_command="gzip -dc")), l_line)
+        shutil.rmtree(dirname)
+
+    def test_makedb_time_ordered(self):
+        import random
+        import shutil
+        conf = copy.deepcopy(self._conf)
+
+        with open(self._path_testlog) as f:
+            lines = f.readlines()
+        dirname = tempfile.mkdtemp()
+        targets = [os.path.join(dirname, "part{0}".format(i))
+                   for i in range(3)]
+        l_f = [open(fp, "w") for fp in targets]
+        for line in lines:
+            random.choice(l_f).write(line)
+        for f in l_f:
+            f.close()
+
+        conf['manager']['input_order'] = "time"
+        l_dt = [pline["timestamp"] for _, pline, _
+                in manager.iter_plines_time_ordered(conf, targets)]
+        self.assertEqual(len(l_dt), len(lines))
+        self.assertEqual(l_dt, sorted(l_dt))
+
+        manager.process_files_online(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        l_dt = [lm.dt for lm in ld.iter_all()]
+        self.assertEqual(len(l_dt), len(lines))
+        self.assertEqual(l_dt, sorted(l_dt))
+
+        # naive (local time) and tz-aware timestamps are merged together
+        with open(targets[0], "w") as f:
+            f.write("2020-01-01 00:00:00+09:00 host1 aware message\n"
+                    "2020-01-10 00:00:00+09:00 host1 aware message\n")
+        with open(targets[1], "w") as f:
+            f.write("2020-01-05 00:00:00 host2 naive message\n")
+        with open(targets[2], "w") as f:
+            pass
+        l_host = [pline["host"] for _, pline, _
+                  in manager.iter_plines_time_ordered(conf, targets)]
+        self.assertEqual(l_host, ["host1", "host2", "host1"])
+        shutil.rmtree(dirname)
+
+    def test_makedb_online_fast_matcher(self):
+        conf = copy.deepcopy(self._conf)
+
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_online(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        l_lt = [(str(lt), lt.count) for lt in ld.iter_lt()]
+
+        conf['manager']['fast_matcher'] = "true"
+        manager.process_files_online(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        self.assertEqual([(str(lt), lt.count) for lt in ld.iter_lt()], l_lt)
+
+    def test_makedb_dry_run(self):
+        dirname = tempfile.mkdtemp()
+        conf = copy.deepcopy(self._conf)
+        conf['database']['sqlite3_filename'] = os.path.join(dirname, "db")
+        conf['manager']['indata_filename'] = os.path.join(dirname, "dump")
+        conf['manager']['fail_output'] = os.path.join(dirname, "fail")
+
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        with self.assertLogs("amulog", level="INFO") as cm:
+            manager.process_files_online(conf, targets, reset_db=True,
+                                         dry_run=True)
+        self.assertTrue(any("dry run: 6539 lines" in msg
+                            for msg in cm.output))
+        with self.assertLogs("amulog", level="INFO") as cm:
+            manager.process_files_offline(conf, targets, reset_db=True,
+                                          dry_run=True)
+        self.assertTrue(any("dry run: 6539 lines" in msg
+                            for msg in cm.output))
+        self.assertEqual(os.listdir(dirname), [])
+        os.rmdir(dirname)
+
+    def test_collapse_repeat(self):
+        fd, path_log = tempfile.mkstemp()
+        with os.fdopen(fd, "w") as f:
+            for sec in (0, 10, 20):
+                f.write("2020-01-01 00:00:{0:02d} host1 "
+                        "interface eth0 down\n".format(sec))
+            f.write("2020-01-01 00:00:30 host2 interface eth0 down\n")
+            f.write("2020-01-01 00:00:40 host1 interface eth0 down\n")
+            f.write("2020-01-01 00:09:00 host1 interface eth0 down\n")
+        conf = copy.deepcopy(self._conf)
+        conf['general']['src_path'] = path_log
+        conf['database']['collapse_repeat'] = "true"
+        conf['database']['collapse_window'] = "60"
+
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_online(conf, targets, reset_db=True)
+        os.remove(path_log)
+
+        ld = log_db.LogData(conf)
+        l_lm = sorted(ld.iter_all(), key=lambda lm: lm.lid)
+        self.assertEqual([(lm.host, lm.repeat) for lm in l_lm],
+                         [("host1", 4), ("host2", 1), ("host1", 1)])
+        self.assertEqual(l_lm[0].dt_last.second, 40)
+        l_expanded = list(ld.iter_lines(host="host1", expand=True))
+        self.assertEqual(len(l_expanded), 5)
+
+        # explicit lids are collapsed only with the last line check,
+        # or as replayed messages
+        ld = log_db.LogData(conf, edit=True, reset_db=True)
+        dt = l_lm[0].dt
+        kwargs = {"ltid": 0, "dt": dt}
+        self.assertEqual(ld.db.add_line(lid=1, host="host1", l_w=["a"],
+                                        **kwargs), 1)
+        self.assertEqual(ld.db.add_line(lid=2, host="host2", l_w=["b"],
+                                        **kwargs), 2)
+        self.assertEqual(ld.db.add_line(lid=3, host="host1", l_w=["a"],
+                                        **kwargs), 1)
+        self.assertEqual(ld.db.add_line(lid=3, host="host2", l_w=["c"],
+                                        **kwargs), 3)
+        self.assertEqual(ld.db.add_line(lid=2, host="host2", l_w=["b"],
+                                        replay=True, **kwargs), 2)
+        ld.commit_db()
+        self.assertEqual([(d["lid"], d.get("repeat", 1))
+                          for d in ld.db.iter_all()],
+                         [(1, 2), (2, 2), (3, 1)])
+
+    def test_count_by(self):
+        import datetime
+        from collections import Counter
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(self._conf)
+        manager.process_files_online(self._conf, targets, reset_db=True)
+
+        ld = log_db.LogData(self._conf)
+        dts, dte = ld.whole_term()
+        dte = dts + datetime.timedelta(days=2)
+        expected = Counter()
+        for lm in ld.iter_lines(dts=dts, dte=dte):
+            dt_bin = lm.dt.replace(minute=0, second=0)
+            expected[(lm.lt.ltgid, lm.host, dt_bin)] += 1
+        d_cnt = ld.count_by(keys=("ltgid", "host", "dt"), bin="1h",
+                            dts=dts, dte=dte)
+        self.assertEqual(d_cnt, dict(expected))
+
+        d_array = ld.count_by(keys=("ltid",), as_array=True)
+        self.assertEqual(d_array["count"].sum(), 6539)
+
+    def test_count_by_local_time(self):
+        import time
+        from collections import Counter
+        from amulog import __main__ as amulog_main
+        tz_orig = os.environ.get("TZ")
+        # offset not in whole hours
+        os.environ["TZ"] = "Asia/Kolkata"
+        time.tzset()
+        try:
+            targets = amulog_main.get_targets_conf(self._conf)
+            manager.process_files_online(self._conf, targets, reset_db=True)
+            ld = log_db.LogData(self._conf)
+            for bin_str, d_replace in [("1h", {"minute": 0, "second": 0}),
+                                       ("1d", {"hour": 0, "minute": 0,
+                                               "second": 0})]:
+                expected = Counter((lm.dt.replace(**d_replace),)
+                                   for lm in ld.iter_all())
+                self.assertEqual(ld.count_by(keys=("dt",), bin=bin_str),
+                                 dict(expected))
+        finally:
+            if tz_orig is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = tz_orig
+            time.tzset()
+
     def test_anonymize_overwrite(self):
         from amulog import __main__ as amulog_main
         targets = amulog_main.get_targets_conf(self._conf)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import copy
+import shutil
+import unittest
+import tempfile
+
+from amulog import db_snapshot
+from amulog import log_db
+from amulog import manager
+
+from amulog import testutil
+
+
+class TestDBSnapshot(testutil.DBTestCase):
+
+    def test_snapshot(self):
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(self._conf)
+        manager.process_files_online(self._conf, targets, reset_db=True)
+
+        tmpdir = tempfile.mkdtemp()
+        path_snapshot = os.path.join(tmpdir, "snapshot")
+        db_snapshot.export_db(self._conf, path_snapshot)
+
+        conf = copy.deepcopy(self._conf)
+        conf['database']['sqlite3_filename'] = os.path.join(tmpdir, "db")
+        conf['manager']['indata_filename'] = os.path.join(tmpdir, "dump")
+        db_snapshot.import_db(conf, path_snapshot)
+
+        ld1 = log_db.LogData(self._conf)
+        ld2 = log_db.LogData(conf)
+        self.assertEqual(ld2.count_lines(), 6539)
+        self.assertEqual([str(lt) for lt in ld1.iter_lt()],
+                         [str(lt) for lt in ld2.iter_lt()])
+        self.assertEqual([str(lm) for lm in ld1.iter_lines(ltid=1)],
+                         [str(lm) for lm in ld2.iter_lines(ltid=1)])
+        self.assertTrue(os.path.exists(conf['manager']['indata_filename']))
+        shutil.rmtree(tmpdir)
+
+    def test_drop_index(self):
+        import sqlite3
+
+        def _get_index_names():
+            with sqlite3.connect(self._path_testdb) as conn:
+                cursor = conn.execute("select name from sqlite_master "
+                                      "where type='index'")
+                return {row[0] for row in cursor}
+
+        ld = log_db.LogData(self._conf, edit=True, reset_db=True)
+        ld.commit_db()
+        s_index = set(ld.db.index_names)
+        self.assertTrue(s_index <= _get_index_names())
+        ld.db.drop_index()
+        ld.commit_db()
+        self.assertFalse(s_index & _get_index_names())
+        ld.db.init_index()
+        ld.commit_db()
+        self.assertTrue(s_index <= _get_index_names())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import copy
+import gzip
+import shutil
+import unittest
+import tempfile
+
+from amulog import fail_sink
+from amulog import log_db
+from amulog import manager
+
+from amulog import testutil
+
+
+class TestFailSink(testutil.DBTestCase):
+
+    def test_fail_output(self):
+        dirname = tempfile.mkdtemp()
+        conf = copy.deepcopy(self._conf)
+        conf['manager']['fail_output'] = os.path.join(dirname, "fail")
+        conf['manager']['fail_output_compress'] = "true"
+        conf['manager']['fail_output_max_bytes'] = "100"
+        conf['manager']['fail_output_backup_count'] = "2"
+
+        ld = log_db.LogData(conf, edit=True, reset_db=True)
+        ltm = manager.LTManager(conf, ld.db, ld.lttable, reset_db=True)
+        l_fail = ["invalid line {0}\n".format(i) for i in range(3)]
+        for line in l_fail:
+            ltm.process_line(line)
+        ltm.commit_db()
+        path = os.path.join(dirname, "fail.gz")
+        with gzip.open(path, "rt") as f:
+            self.assertEqual(f.readlines(), l_fail)
+        self.assertEqual(ltm.fail_counts[fail_sink.FAIL_PARSE], 3)
+        shutil.rmtree(dirname)
+
+    def test_fail_reason(self):
+        dirname = tempfile.mkdtemp()
+        path_ha = os.path.join(dirname, "host_alias")
+        with open(path_ha, "w") as f:
+            f.write("[core]\nhost1\n")
+        path_log = os.path.join(dirname, "test.log")
+        with open(path_log, "w") as f:
+            f.write("2020-01-01 00:00:00 host1 known host message\n"
+                    "2020-01-01 00:00:01 host2 unknown host message\n"
+                    "invalid line\n")
+        conf = copy.deepcopy(self._conf)
+        conf['manager']['host_alias_filename'] = path_ha
+        conf['manager']['undefined_host'] = "true"
+        conf['manager']['fail_output'] = os.path.join(dirname, "fail")
+
+        # lines parsed out of LTManager
+        for key, val in [("online_parse_process", "2"),
+                         ("input_order", "time"),
+                         ("shard_process", "2")]:
+            tmp_conf = copy.deepcopy(conf)
+            tmp_conf['manager'][key] = val
+            with self.assertLogs("amulog", level="INFO") as cm:
+                manager.process_files_online(tmp_conf, [path_log],
+                                             reset_db=True)
+            self.assertTrue(any("1 parse_error, 1 unknown_host" in msg
+                                for msg in cm.output), key)
+            self.assertEqual(log_db.LogData(tmp_conf).count_lines(), 1)
+        shutil.rmtree(dirname)
+
+    def test_rotate(self):
+        dirname = tempfile.mkdtemp()
+        path = os.path.join(dirname, "fail_plain")
+        sink = fail_sink.FailureSink(path, buffer_size=10,
+                                     max_bytes=100, backup_count=2)
+        for i in range(4):
+            for _ in range(10):
+                sink.write("x" * 50 + "{0}\n".format(i), fail_sink.FAIL_NO_TPL)
+        self.assertFalse(os.path.exists(path))
+        with open(path + ".1") as f:
+            self.assertEqual(f.readline(), "x" * 50 + "3\n")
+        self.assertTrue(os.path.exists(path + ".2"))
+        self.assertFalse(os.path.exists(path + ".3"))
+        shutil.rmtree(dirname)
+
+
+if __name__ == "__main__":
+    unittest.main()
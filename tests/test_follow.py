@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import copy
+import shutil
+import unittest
+import tempfile
+
+from amulog import follow
+from amulog import log_db
+
+from amulog import testutil
+
+
+class TestFollow(testutil.DBTestCase):
+
+    def test_follow(self):
+        conf = copy.deepcopy(self._conf)
+        conf['manager']['follow_poll_interval'] = "0"
+        with open(self._path_testlog) as f:
+            lines = f.readlines()
+        dirname = tempfile.mkdtemp()
+        path = os.path.join(dirname, "follow.log")
+        conf['manager']['follow_state_filename'] = os.path.join(
+            dirname, "state.json")
+
+        # appended, partial and rotated lines
+        fl = follow.FileFollower(path)
+        with open(path, "w") as f:
+            f.writelines(lines[:10])
+            f.write(lines[10][:5])
+        self.assertEqual(list(fl.read_lines()), lines[:10])
+        with open(path, "a") as f:
+            f.write(lines[10][5:])
+            f.write(lines[11].rstrip("\n"))
+        os.rename(path, path + ".1")
+        with open(path, "w") as f:
+            f.writelines(lines[12:20])
+        self.assertEqual(list(fl.read_lines()), lines[10:20])
+        fl.close()
+
+        # continue from the recorded offsets after restarting
+        with open(path, "w") as f:
+            f.writelines(lines[:1000])
+        follow.follow_files(conf, [path], reset_db=True, max_polls=2)
+        with open(path, "a") as f:
+            f.writelines(lines[1000:])
+        follow.follow_files(conf, [path], reset_db=False, max_polls=2)
+        ld = log_db.LogData(conf)
+        self.assertEqual(ld.count_lines(), len(lines))
+        shutil.rmtree(dirname)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import pickle
+import unittest
+import tempfile
+
+from amulog import host_alias
+
+
+class TestHostAlias(unittest.TestCase):
+
+    _path_def = None
+
+    @classmethod
+    def setUpClass(cls):
+        fd, cls._path_def = tempfile.mkstemp()
+        with os.fdopen(fd, "w") as f:
+            f.write("[core]\n"
+                    "<rt1> 10.0.0.1 router1.example.com\n"
+                    "[srv]\n"
+                    "<lan> 10.0.0.0/8\n"
+                    "<sub> 10.1.0.0/16\n"
+                    "<lan6> 2001:db8::/32\n"
+                    "host3\n")
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls._path_def)
+
+    def test_resolve(self):
+        ha = host_alias.HostAlias(self._path_def)
+        d_answer = {"10.0.0.1": ("rt1", "core"),
+                    "router1.example.com": ("rt1", "core"),
+                    "10.2.3.4": ("lan", "srv"),
+                    "10.1.2.3": ("sub", "srv"),
+                    "2001:db8::5": ("lan6", "srv"),
+                    "HOST3": ("host3", "srv"),
+                    "11.0.0.1": (None, None),
+                    "1.2.3": (None, None),
+                    "unknown": (None, None)}
+        for _ in range(2):  # with and without cache
+            for name, (alias, group) in d_answer.items():
+                self.assertEqual(ha.resolve_host(name), alias)
+                self.assertEqual(ha.get_group(name), group)
+                self.assertEqual(ha.isknown(name), alias is not None)
+        self.assertTrue(ha.cache_info().hits > 0)
+
+        ha = pickle.loads(pickle.dumps(ha))
+        self.assertEqual(ha.resolve_host("10.1.2.3"), "sub")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import copy
+import itertools
+import unittest
+
+from amulog import log_db
+from amulog import manager
+
+from amulog import testutil
+
+
+class TestJournal(testutil.DBTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._conf['manager']['journal_filename'] = \
+            cls._path_testdb + ".journal"
+        cls._conf['manager']['journal_sync_interval'] = "100"
+
+    def test_makedb_online_resume(self):
+        conf = copy.deepcopy(self._conf)
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_online(conf, targets, reset_db=True)
+        self.assertFalse(os.path.exists(self._path_testdb + ".journal"))
+        n_lt = log_db.LogData(conf).count_lt()
+
+        # interrupted in the middle of a commit interval
+        ld = log_db.LogData(conf, edit=True, reset_db=True)
+        ltm = manager.LTManager(conf, ld.db, ld.lttable, reset_db=True)
+        journal = manager.init_journal(conf)
+        journal.start(targets, True)
+        ltm.set_journal(journal)
+        iterobj = manager.iter_lines_offset(targets)
+        for fid, offset, line in itertools.islice(iterobj, 2550):
+            journal.set_position(fid, offset)
+            ltm.process_line(line)
+        journal.flush()
+        ld.db._db._connect.rollback()
+        del ltm, ld
+
+        manager.resume_files_online(conf)
+        ld = log_db.LogData(conf)
+        self.assertEqual(ld.count_lines(), 6539)
+        self.assertEqual(ld.count_lt(), n_lt)
+        self.assertFalse(os.path.exists(self._path_testdb + ".journal"))
+
+    def test_makedb_online_resume_committed(self):
+        conf = copy.deepcopy(self._conf)
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_online(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        l_lt = [(str(lt), lt.count) for lt in ld.iter_lt()]
+        l_lm = [str(lm) for lm in ld.iter_all()]
+
+        # interrupted after DB commit but before journal commit
+        ld = log_db.LogData(conf, edit=True, reset_db=True)
+        ltm = manager.LTManager(conf, ld.db, ld.lttable, reset_db=True)
+        journal = manager.init_journal(conf)
+        journal.start(targets, True)
+        ltm.set_journal(journal)
+        iterobj = manager.iter_lines_offset(targets)
+        for fid, offset, line in itertools.islice(iterobj, 2550):
+            journal.set_position(fid, offset)
+            ltm.process_line(line)
+        journal.flush()
+        ld.commit_db()
+        del ltm, ld
+
+        manager.resume_files_online(conf)
+        ld = log_db.LogData(conf)
+        self.assertEqual([(str(lt), lt.count) for lt in ld.iter_lt()], l_lt)
+        self.assertEqual([str(lm) for lm in ld.iter_all()], l_lm)
+        self.assertFalse(os.path.exists(self._path_testdb + ".journal"))
+
+    def test_makedb_online_resume_checkpoint(self):
+        from amulog import journal as journal_mod
+        conf = copy.deepcopy(self._conf)
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_online(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        l_lt = [(str(lt), lt.count) for lt in ld.iter_lt()]
+        l_lm = [str(lm) for lm in ld.iter_all()]
+
+        # journal rebased at the checkpoints on DB commits
+        conf['manager']['online_batchsize'] = "1000"
+        conf['manager']['checkpoint_interval'] = "0.000001"
+        ld = log_db.LogData(conf, edit=True, reset_db=True)
+        ltm = manager.LTManager(conf, ld.db, ld.lttable, reset_db=True)
+        journal = manager.init_journal(conf)
+        journal.start(targets, True)
+        ltm.set_journal(journal)
+        iterobj = manager.iter_lines_offset(targets)
+        for fid, offset, line in itertools.islice(iterobj, 2550):
+            journal.set_position(fid, offset)
+            ltm.process_line(line)
+        journal.flush()
+        ld.db._db._connect.rollback()
+        del ltm, ld
+
+        state = journal_mod.load_journal(journal.filename)
+        self.assertFalse(state.reset_db)
+        self.assertEqual(state.lid, 2000)
+        self.assertEqual(len(state.committed), 0)
+        self.assertEqual(len(state.uncommitted), 550)
+
+        manager.resume_files_online(conf)
+        ld = log_db.LogData(conf)
+        self.assertEqual([(str(lt), lt.count) for lt in ld.iter_lt()], l_lt)
+        self.assertEqual([str(lm) for lm in ld.iter_all()], l_lm)
+        self.assertFalse(os.path.exists(self._path_testdb + ".journal"))
+
+    def test_record_to_line(self):
+        from amulog import journal as journal_mod
+        with open(self._path_testlog) as f:
+            lines = f.readlines()[:100]
+        l_pline = list(manager.iter_plines(self._conf, [self._path_testlog]))
+        for lid, (line, pline) in enumerate(zip(lines, l_pline), 1):
+            record = (journal_mod.RECORD_LINE, 0, 0, lid, 0,
+                      pline["timestamp"], pline["host"],
+                      pline["words"], pline["symbols"])
+            self.assertEqual(
+                journal_mod.JournalState.record_to_line(record), line)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import copy
+import shutil
+import unittest
+import tempfile
+
+from amulog import log_db
+from amulog import manager
+
+from amulog import testutil
+
+
+class TestLogArchive(testutil.DBTestCase):
+
+    _path_archive = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._path_archive = tempfile.mkdtemp()
+        cls._conf['database']['archive_dir'] = cls._path_archive
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls._path_archive)
+
+    def test_archive(self):
+        conf = copy.deepcopy(self._conf)
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_online(conf, targets, reset_db=True)
+
+        ld = log_db.LogData(conf)
+        dts, dte = ld.dt_term()
+        dt_cut = dts + (dte - dts) / 2
+        expected = sorted((lm.lid, lm.lt.ltid, lm.dt, lm.host, lm.l_w)
+                          for lm in ld.iter_lines(ltid=0))
+        n_old = len(list(ld.iter_lines(dte=dt_cut)))
+
+        ld = log_db.LogData(conf, edit=True)
+        self.assertEqual(ld.archive_lines(dt_cut), n_old)
+
+        ld = log_db.LogData(conf)
+        self.assertEqual(ld.count_lines(), 6539)
+        self.assertEqual(ld.dt_term(), (dts, dte))
+        self.assertEqual(len(list(ld.iter_all())), 6539)
+        self.assertEqual(len(list(ld.iter_lines(dte=dt_cut))), n_old)
+        results = sorted((lm.lid, lm.lt.ltid, lm.dt, lm.host, lm.l_w)
+                         for lm in ld.iter_lines(ltid=0))
+        self.assertEqual(results, expected)
+
+        # block files listed in the archive table are removed in reset
+        self.assertTrue(len(os.listdir(self._path_archive)) > 0)
+        path_other = os.path.join(self._path_archive, "19700101.blk")
+        with open(path_other, "wb") as f:
+            f.write(b"block of another DB")
+        log_db.LogData(conf, edit=True, reset_db=True)
+        self.assertEqual(os.listdir(self._path_archive), ["19700101.blk"])
+        log_db.LogData(conf, edit=True, reset_db=True)
+        self.assertTrue(os.path.exists(path_other))
+        os.remove(path_other)
+
+    def test_archive_iter_all(self):
+        import random
+        conf = copy.deepcopy(self._conf)
+        with open(self._path_testlog) as f:
+            lines = f.readlines()
+        # lids are not in the order of timestamps
+        random.Random(0).shuffle(lines)
+        fd, path_log = tempfile.mkstemp()
+        with os.fdopen(fd, "w") as f:
+            f.writelines(lines)
+        manager.process_files_online(conf, [path_log], reset_db=True)
+        os.remove(path_log)
+
+        ld = log_db.LogData(conf)
+        expected = [str(lm) for lm in ld.iter_all()]
+        dts, dte = ld.dt_term()
+        ld = log_db.LogData(conf, edit=True)
+        ld.archive_lines(dts + (dte - dts) / 2)
+
+        ld = log_db.LogData(conf)
+        self.assertEqual([str(lm) for lm in ld.iter_all()], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
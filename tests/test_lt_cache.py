@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import copy
+import unittest
+
+from amulog import log_db
+from amulog import manager
+
+from amulog import testutil
+
+
+class TestLTCache(testutil.DBTestCase):
+
+    def test_makedb_online_memo(self):
+        conf = copy.deepcopy(self._conf)
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_online(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        l_lt = [(str(lt), lt.count) for lt in ld.iter_lt()]
+        l_lm = [str(lm) for lm in ld.iter_all()]
+
+        conf['manager']['memo_cache_size'] = "100"
+        ld = log_db.LogData(conf, edit=True, reset_db=True)
+        ltm = manager.LTManager(conf, ld.db, ld.lttable, reset_db=True)
+        for line in manager.iter_lines(targets):
+            ltm.process_line(line)
+        ltm.commit_db()
+        self.assertTrue(ltm.memo_cache.hit > 0)
+        self.assertTrue(len(ltm.memo_cache) <= 100)
+
+        ld = log_db.LogData(conf)
+        self.assertEqual([(str(lt), lt.count) for lt in ld.iter_lt()], l_lt)
+        self.assertEqual([str(lm) for lm in ld.iter_all()], l_lm)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -99,6 +99,43 @@ class TestLTGen(unittest.TestCase):
         n_tpl = len(table)
         self.assertTrue(3 < n_tpl < 20)
 
+    def test_dump_flat(self):
+        import pickle
+        plines = list(manager.iter_plines(config.open_config(verbose=False),
+                                          [self._path_testlog]))
+        half = len(plines) // 2
+        # internal state pickled in the old format
+        d_old_dump = {
+            "drain": lambda g: g._root,
+            "shiso": lambda g: g._n_root,
+            "fttree": lambda g: (g._tree, g._d_words),
+            "lenma": lambda g: (g._clusters, g._d_candidates),
+        }
+        for method, old_dump in d_old_dump.items():
+            conf = config.open_config(verbose=False)
+            conf['log_template']['lt_methods'] = method
+            table = lt_common.TemplateTable()
+            ltgen = manager.init_ltgen_methods(conf, table)
+            for pline in plines[:half]:
+                ltgen.process_line(pline)
+            table_data = pickle.dumps(table.dumpobj())
+            dumpobj = ltgen.dumpobj()
+            self.assertTrue(lt_common.is_flat_dump(dumpobj, 1))
+
+            # restored generator (from flat and old format) works same
+            l_ltgen = [ltgen]
+            for loadobj in (dumpobj, old_dump(ltgen)):
+                table2 = lt_common.TemplateTable()
+                table2.load(pickle.loads(table_data))
+                ltgen2 = manager.init_ltgen_methods(conf, table2)
+                ltgen2.load(pickle.loads(pickle.dumps(loadobj)))
+                self.assertEqual(ltgen2.dumpobj(), dumpobj, method)
+                l_ltgen.append(ltgen2)
+            for pline in plines[half:]:
+                l_tid = [tmp_ltgen.process_line(pline)[0]
+                         for tmp_ltgen in l_ltgen]
+                self.assertEqual(len(set(l_tid)), 1, method)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import copy
+import json
+import unittest
+import tempfile
+
+from amulog import log_db
+from amulog import manager
+
+from amulog import testutil
+
+
+class TestMetrics(testutil.DBTestCase):
+
+    def test_metrics(self):
+        conf = copy.deepcopy(self._conf)
+        conf['manager']['metrics'] = "true"
+        fd, path_output = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        conf['manager']['metrics_output'] = path_output
+
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_online(conf, targets, reset_db=True)
+        with open(path_output) as f:
+            d = json.load(f)
+        self.assertEqual(d["lines"], 6539)
+        self.assertEqual(d["templates"],
+                         len(list(log_db.LogData(conf).iter_lt())))
+        for stage in ("parse", "normalize", "template", "db"):
+            self.assertEqual(d["stages"][stage]["count"], 6539)
+            self.assertTrue(d["stages"][stage]["p50"]
+                            <= d["stages"][stage]["p99"])
+        os.remove(path_output)
+
+
+if __name__ == "__main__":
+    unittest.main()
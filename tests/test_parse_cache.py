@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import copy
+import shutil
+import unittest
+import tempfile
+
+from amulog import manager
+
+from amulog import testutil
+
+
+class TestParseCache(testutil.DBTestCase):
+
+    def test_parse_cache(self):
+        dirname = tempfile.mkdtemp()
+        fp = os.path.join(dirname, "test.log")
+        shutil.copy(self._path_testlog, fp)
+        conf = copy.deepcopy(self._conf)
+        conf["general"]["cache_dir"] = os.path.join(dirname, "cache")
+        l_pline = list(manager.iter_plines(conf, [fp], pass_none=False))
+
+        conf["manager"]["parse_cache"] = "true"
+        for _ in range(2):
+            self.assertEqual(list(manager.iter_plines(conf, [fp],
+                                                      pass_none=False)),
+                             l_pline)
+        self.assertEqual(len(os.listdir(conf["general"]["cache_dir"])), 1)
+
+        # interrupted iteration does not leave a cache file
+        os.utime(fp, ns=(0, 0))
+        next(manager.iter_plines(conf, [fp]))
+        self.assertEqual(len(os.listdir(conf["general"]["cache_dir"])), 1)
+
+        # cache made again for the changed file
+        self.assertEqual(list(manager.iter_plines(conf, [fp],
+                                                  pass_none=False)),
+                         l_pline)
+        self.assertEqual(len(os.listdir(conf["general"]["cache_dir"])), 2)
+        shutil.rmtree(dirname)
+
+
+if __name__ == "__main__":
+    unittest.main()
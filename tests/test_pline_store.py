@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import copy
+import unittest
+
+from amulog import log_db
+from amulog import manager
+from amulog import pline_store
+
+from amulog import testutil
+
+
+class TestPlineStore(testutil.DBTestCase):
+
+    def test_makedb_offline_pline_store(self):
+        conf = copy.deepcopy(self._conf)
+        conf["log_template"]["lt_methods"] = "dlog"
+
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_offline(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        l_lt = [str(lt) for lt in ld.iter_lt()]
+        l_lm = [str(lm) for lm in ld.iter_all()]
+
+        conf["manager"]["offline_pline_memory"] = "100000"
+        with self.assertLogs("amulog", level="INFO") as cm:
+            manager.process_files_offline(conf, targets, reset_db=True)
+        self.assertTrue(any("spilled" in msg for msg in cm.output))
+        ld = log_db.LogData(conf)
+        self.assertEqual([str(lt) for lt in ld.iter_lt()], l_lt)
+        self.assertEqual([str(lm) for lm in ld.iter_all()], l_lm)
+
+    def test_makedb_offline_compact_pline(self):
+        conf = copy.deepcopy(self._conf)
+        conf["log_template"]["lt_methods"] = "lenma"
+
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_offline(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        l_lt = [str(lt) for lt in ld.iter_lt()]
+        l_lm = [str(lm) for lm in ld.iter_all()]
+
+        conf["manager"]["offline_compact_pline"] = "true"
+        manager.process_files_offline(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        self.assertEqual([str(lt) for lt in ld.iter_lt()], l_lt)
+        self.assertEqual([str(lm) for lm in ld.iter_all()], l_lm)
+
+        # also in the memory-bounded store
+        conf["manager"]["offline_pline_memory"] = "100000"
+        manager.process_files_offline(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        self.assertEqual([str(lt) for lt in ld.iter_lt()], l_lt)
+
+    def test_parsed_line(self):
+        pline = next(manager.iter_plines(self._conf, [self._path_testlog]))
+        cpline = pline_store.ParsedLine.from_pline(pline)
+        self.assertEqual(cpline["words"], tuple(pline["words"]))
+        self.assertEqual(cpline["host"], pline["host"])
+        self.assertFalse("lid" in cpline)
+        self.assertFalse("message" in cpline)
+
+
+if __name__ == "__main__":
+    unittest.main()
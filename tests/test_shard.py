@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import copy
+import unittest
+
+from amulog import log_db
+from amulog import lt_common
+from amulog import manager
+from amulog import shard
+
+from amulog import testutil
+
+
+class TestShard(testutil.DBTestCase):
+
+    def test_makedb_sharded(self):
+        conf = copy.deepcopy(self._conf)
+        conf['manager']['shard_process'] = "3"
+
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_online(conf, targets, reset_db=True)
+        ld = log_db.LogData(conf)
+        self.assertEqual(ld.count_lines(), 6539)
+        l_lm = list(ld.iter_all())
+        self.assertEqual(sorted(lm.lid for lm in l_lm),
+                         list(range(1, 6539 + 1)))
+        self.assertEqual(sum(lt.count for lt in ld.iter_lt()), 6539)
+        for lm in l_lm:
+            self.assertEqual(len(lm.lt.ltw), len(lm.l_w))
+            for w1, w2 in zip(lm.lt.ltw, lm.l_w):
+                self.assertTrue(w1 in (w2, lt_common.REPLACER))
+        l_ltw = [tuple(lt.ltw) for lt in ld.iter_lt()]
+        self.assertEqual(len(l_ltw), len(set(l_ltw)))
+
+    def test_makedb_sharded_append(self):
+        conf = copy.deepcopy(self._conf)
+        conf['manager']['shard_process'] = "3"
+
+        from amulog import __main__ as amulog_main
+        targets = amulog_main.get_targets_conf(conf)
+        manager.process_files_online(conf, targets, reset_db=True)
+        n_lt = len(list(log_db.LogData(conf).iter_lt()))
+
+        # normal db-add after sharded processing
+        conf['manager']['shard_process'] = "0"
+        for i in range(2):
+            manager.process_files_online(conf, targets, reset_db=False)
+            ld = log_db.LogData(conf)
+            self.assertEqual(ld.count_lines(), 6539 * (i + 2))
+            l_lt = list(ld.iter_lt())
+            self.assertEqual(len(l_lt), n_lt)
+            self.assertEqual(sum(lt.count for lt in l_lt), 6539 * (i + 2))
+        for lm in ld.iter_all():
+            self.assertEqual(len(lm.lt.ltw), len(lm.l_w))
+            for w1, w2 in zip(lm.lt.ltw, lm.l_w):
+                self.assertTrue(w1 in (w2, lt_common.REPLACER))
+
+    def test_merge_templates(self):
+        l_index, merged = shard.merge_templates(
+            [["a", "b", "c"], ["a", "**", "c"], ["a", "b"], ["x", "b", "c"]],
+            [["**", "b", "c"]])
+        self.assertEqual(l_index, [0, 1, 2, 0])
+        self.assertEqual(len(merged), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
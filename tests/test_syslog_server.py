@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import copy
+import socket
+import asyncio
+import unittest
+
+from amulog import log_db
+from amulog import syslog_server
+
+from amulog import testutil
+
+
+class TestSyslogServer(testutil.DBTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._conf['serve_syslog']['udp_port'] = "0"
+        cls._conf['serve_syslog']['tcp_port'] = "0"
+
+    def test_convert_message(self):
+        msg = ("<34>1 2003-10-11T22:14:15.003Z mymachine su - ID47 "
+               "[exampleSDID@32473 iut=\"3\"] 'su root' failed")
+        self.assertEqual(syslog_server.convert_message(msg)[19:],
+                         " mymachine su: 'su root' failed")
+
+    def test_serve_syslog(self):
+        conf = copy.deepcopy(self._conf)
+        conf['serve_syslog']['batchsize'] = "100"
+        conf['serve_syslog']['flush_interval'] = "0.1"
+        conf['serve_syslog']['queue_size'] = "2"
+        with open(self._path_testlog) as f:
+            lines = [line.rstrip("\n") for line in f]
+
+        async def _test(server):
+            await server.start()
+            _, tcp_port = server.addresses["tcp"][:2]
+            _, writer = await asyncio.open_connection("127.0.0.1", tcp_port)
+            for line in lines[:3000]:
+                data = "<13>{0}".format(line).encode()
+                writer.write(str(len(data)).encode() + b" " + data)
+            for line in lines[3000:6000]:
+                writer.write("<13>{0}\n".format(line).encode())
+            await writer.drain()
+            writer.close()
+
+            udp_addr = server.addresses["udp"][:2]
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                for line in lines[6000:]:
+                    sock.sendto("<13>{0}".format(line).encode(), udp_addr)
+                    await asyncio.sleep(0)
+            await asyncio.sleep(0.5)
+            await server.stop()
+
+        server = syslog_server.SyslogServer(conf, reset_db=True)
+        asyncio.run(_test(server))
+        ld = log_db.LogData(conf)
+        self.assertEqual(server.stats["received"], len(lines))
+        self.assertEqual(ld.count_lines() + server.stats["dropped"],
+                         len(lines))
+
+    def test_broken_frames(self):
+        conf = copy.deepcopy(self._conf)
+        conf['serve_syslog']['flush_interval'] = "0.1"
+        with open(self._path_testlog) as f:
+            line = f.readline().rstrip("\n")
+        l_data = [
+            "<13>{0}\n".format(line).encode(),
+            # exceeding the stream limit without a separator
+            b"<13>" + b"x" * 100000,
+            # invalid length
+            b"12a <13>" + line.encode(),
+            # cut in the middle of a frame
+            b"100 <13>" + line[:10].encode(),
+            # the last message without trailing LF is not dropped
+            "<13>{0}\n<13>{0}".format(line).encode(),
+        ]
+
+        async def _test(server):
+            await server.start()
+            _, tcp_port = server.addresses["tcp"][:2]
+            for data in l_data:
+                _, writer = await asyncio.open_connection("127.0.0.1",
+                                                          tcp_port)
+                writer.write(data)
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+                writer.close()
+                await asyncio.sleep(0.1)
+            await asyncio.sleep(0.3)
+            await server.stop()
+
+        server = syslog_server.SyslogServer(conf, reset_db=True)
+        with self.assertLogs("amulog", level="WARNING") as cm:
+            asyncio.run(_test(server))
+        self.assertEqual(len([msg for msg in cm.output
+                              if "frame dropped" in msg]), 3)
+        self.assertEqual(server.stats["received"], 6)
+        self.assertEqual(server.stats["dropped"], 3)
+        self.assertEqual(log_db.LogData(conf).count_lines(), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()